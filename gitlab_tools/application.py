@@ -88,12 +88,14 @@ def create_app(config_obj: Config, no_sql: bool = False) -> Flask:
 
     app.json = FlaskJSONProvider(app)
 
-    def url_for_other_page(page: int) -> str:
-        args = request.view_args.copy()
-        args['page'] = page
+    def url_for_cursor(**cursor: str) -> str:
+        # Keeps filters, drops cursor of current page
+        args = {key: value for key, value in request.args.items() if key not in ('after', 'before')}
+        args.update(request.view_args)
+        args.update(cursor)
         return url_for(request.endpoint, **args)
 
-    app.jinja_env.globals['url_for_other_page'] = url_for_other_page  # pylint: disable=no-member
+    app.jinja_env.globals['url_for_cursor'] = url_for_cursor  # pylint: disable=no-member
 
     if not no_sql:
         db.init_app(app)
@@ -0,0 +1,37 @@
+from celery.backends.database import DatabaseBackend
+from celery.result import GroupResult, result_from_tuple
+from gitlab_tools.celery_backend.models import Task, TaskSet
+
+
+class JSONDatabaseBackend(DatabaseBackend):
+    """
+    Database result backend storing results as compact JSON, rows stored as pickle are still readable
+    Selected by CELERY_RESULT_BACKEND 'gitlab_tools.celery_backend.database:JSONDatabaseBackend+<database uri>'
+    """
+    task_cls = Task
+    taskset_cls = TaskSet
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Extended results are not supported, they would switch task_cls to celery pickle model
+        self.task_cls = Task
+
+    def _update_result(self, task, result, state, traceback=None, request=None):
+        meta = self._get_result_meta(result=result, state=state, traceback=traceback, request=request,
+                                     format_date=False, encode=True)
+        task.status = meta['status']
+        task.result = meta['result']
+        task.legacy_result = None
+        task.traceback = meta['traceback']
+        task.date_done = meta['date_done']
+
+    def _save_group(self, group_id, result: GroupResult):
+        # GroupResult is not JSON serializable, its ids are stored instead
+        super()._save_group(group_id, result.as_tuple())
+        return result
+
+    def _restore_group(self, group_id):
+        meta = super()._restore_group(group_id)
+        if meta and isinstance(meta['result'], list):
+            meta['result'] = result_from_tuple(meta['result'], self.app)
+        return meta
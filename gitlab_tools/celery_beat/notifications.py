@@ -0,0 +1,123 @@
+import abc
+import select
+import logging
+from typing import Optional
+import flask
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from gitlab_tools.extensions import db
+from gitlab_tools.tools.throttle import get_redis_client
+
+SCHEDULE_CHANGED_PUBLISH_KEY = 'schedule_changed_publish'
+
+
+def get_channel() -> str:
+    return flask.current_app.config['SCHEDULE_CHANGES_CHANNEL']
+
+
+def is_postgresql() -> bool:
+    return db.engine.dialect.name == 'postgresql'
+
+
+def notify_schedule_changed(session: Session, version: int) -> None:
+    """
+    Notifies schedulers about schedule change, notification is delivered only when transaction is committed
+    :param session: Session of transaction doing the change
+    :param version: new version of PeriodicTasks
+    """
+    if is_postgresql():
+        # NOTIFY is transactional in PostgreSQL
+        session.execute(text('SELECT pg_notify(:channel, :payload)'), {'channel': get_channel(), 'payload': str(version)})
+    elif get_redis_client():
+        session.info[SCHEDULE_CHANGED_PUBLISH_KEY] = version
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_schedule_changed(session: Session) -> None:
+    version = session.info.pop(SCHEDULE_CHANGED_PUBLISH_KEY, None)
+    if version is None:
+        return
+
+    redis_client = get_redis_client()
+    try:
+        redis_client.publish(get_channel(), str(version))
+    except Exception as exc:  # pylint: disable=broad-except
+        # Schedulers find the change by polling
+        logging.warning('Failed to publish schedule change: %r', exc)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_schedule_changed(session: Session) -> None:
+    session.info.pop(SCHEDULE_CHANGED_PUBLISH_KEY, None)
+
+
+class ScheduleChangeListener(abc.ABC):
+    @abc.abstractmethod
+    def wait(self, timeout: float) -> bool:
+        """
+        Blocks till schedule change is notified or timeout passes
+        :param timeout: seconds
+        :return: True when change was notified
+        """
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        pass
+
+
+class PostgreSQLScheduleChangeListener(ScheduleChangeListener):
+    def __init__(self, channel: str):
+        """
+        Listens to NOTIFY sent by notify_schedule_changed
+        :param channel: channel name
+        """
+        # Dedicated connection, it is never returned to pool
+        connection = db.engine.raw_connection()
+        connection.detach()
+        self.connection = connection.connection
+        self.connection.autocommit = True
+        with self.connection.cursor() as cursor:
+            cursor.execute('LISTEN "{}"'.format(channel.replace('"', '')))
+
+    def wait(self, timeout: float) -> bool:
+        if not self.connection.notifies and select.select([self.connection], [], [], timeout) != ([], [], []):
+            self.connection.poll()
+
+        notified = bool(self.connection.notifies)
+        self.connection.notifies.clear()
+        return notified
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class RedisScheduleChangeListener(ScheduleChangeListener):
+    def __init__(self, channel: str):
+        """
+        Listens to messages published by publish_schedule_changed
+        :param channel: channel name
+        """
+        self.pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(channel)
+
+    def wait(self, timeout: float) -> bool:
+        notified = bool(self.pubsub.get_message(timeout=timeout))
+        # Drain changes notified in the mean time, one reload covers them all
+        while self.pubsub.get_message(timeout=0):
+            pass
+        return notified
+
+    def close(self) -> None:
+        self.pubsub.close()
+
+
+def get_schedule_change_listener() -> Optional[ScheduleChangeListener]:
+    """
+    Returns listener matching the way notify_schedule_changed notifies
+    :return: None when notifications are not available, eg. SQLite without redis
+    """
+    if is_postgresql():
+        return PostgreSQLScheduleChangeListener(get_channel())
+    if get_redis_client():
+        return RedisScheduleChangeListener(get_channel())
+    return None
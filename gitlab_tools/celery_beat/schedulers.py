@@ -1,17 +1,26 @@
+import copy
 import datetime
+import heapq
 import logging
 import math
+import time
 from multiprocessing.util import Finalize
 
+import flask
 from celery import current_app, schedules
-from celery.beat import ScheduleEntry, Scheduler
+from celery.beat import ScheduleEntry, Scheduler, event_t
 from celery.utils.log import get_logger
 from celery.utils.time import maybe_make_aware
 from kombu.utils.encoding import safe_str, safe_repr
 from kombu.utils.json import dumps, loads
+from sqlalchemy import bindparam
 from sqlalchemy.exc import DatabaseError, InterfaceError
+from sqlalchemy.orm.attributes import set_committed_value
 
-from gitlab_tools.models.celery import PeriodicTask, PeriodicTasks, CrontabSchedule, IntervalSchedule
+from gitlab_tools.tools.cron import get_jitter_offset
+from gitlab_tools.celery_beat.notifications import get_schedule_change_listener
+from gitlab_tools.models.celery import PeriodicTask, PeriodicTasks, PeriodicTaskRemoval, CrontabSchedule, \
+    IntervalSchedule, PERIODIC_TASK_REMOVAL_RETENTION
 from gitlab_tools.extensions import db
 
 DEFAULT_MAX_INTERVAL = 5
@@ -30,7 +39,6 @@ class ModelEntry(ScheduleEntry):
         (schedules.crontab, CrontabSchedule, 'crontab'),
         (schedules.schedule, IntervalSchedule, 'interval')
     )
-    save_fields = ['last_run_at', 'total_run_count', 'no_changes']
 
     def __init__(self, model, app=None):
         """Initialize the model entry."""
@@ -70,15 +78,18 @@ class ModelEntry(ScheduleEntry):
 
         self.total_run_count = model.total_run_count
         self.model = model
+        self.model_id = model.id
+
+        # Deterministic delay spreading entries with same schedule across window
+        self.jitter = 0
+        if self.task in flask.current_app.config.get('SCHEDULE_JITTER_TASKS', ()):
+            self.jitter = get_jitter_offset(self.name, flask.current_app.config.get('SCHEDULE_JITTER_WINDOW', 0))
 
         if not model.last_run_at:
             model.last_run_at = self._default_now()
 
         self.last_run_at = model.last_run_at
 
-
-
-
     def _disable(self, model) -> None:
         model.no_changes = True
         model.enabled = False
@@ -120,6 +131,13 @@ class ModelEntry(ScheduleEntry):
             # while maybe_make_aware assumes utc for naive datetimes
         tz = self.app.timezone
         last_run_at_in_tz = maybe_make_aware(self.last_run_at).astimezone(tz)
+        if self.jitter:
+            # Schedule evaluated on clock shifted back by jitter fires jitter seconds after its time
+            jitter = datetime.timedelta(seconds=self.jitter)
+            schedule = copy.copy(self.schedule)
+            schedule.nowfun = lambda: self.schedule.now() - jitter
+            return schedule.is_due(last_run_at_in_tz - jitter)
+
         return self.schedule.is_due(last_run_at_in_tz)
 
     def _default_now(self):
@@ -132,19 +150,38 @@ class ModelEntry(ScheduleEntry):
         return now
 
     def __next__(self):
-        self.model.last_run_at = self._default_now()
-        self.model.total_run_count += 1
+        # Model is not marked dirty, run state is persisted in bulk by DatabaseScheduler.sync
+        set_committed_value(self.model, 'last_run_at', self._default_now())
+        set_committed_value(self.model, 'total_run_count', self.total_run_count + 1)
         self.model.no_changes = True
         return self.__class__(self.model)
 
     next = __next__  # for 2to3
 
     def save(self):
-        obj = type(self.model).filter_by(db.session, id=self.model.id).first()
-        for field in self.save_fields:
-            setattr(obj, field, getattr(self.model, field))
-        self.save_model(obj)
+        self.save_run_state([self])
 
+    @classmethod
+    def save_run_state(cls, entries: list) -> None:
+        """
+        Persists last_run_at and total_run_count of entries in one executemany UPDATE
+        :param entries: list of ModelEntry
+        """
+        if not entries:
+            return
+
+        table = PeriodicTask.__table__
+        db.session.execute(
+            table.update().where(table.c.id == bindparam('model_id')).values(
+                last_run_at=bindparam('run_at'),
+                total_run_count=bindparam('run_count')
+            ),
+            [
+                {'model_id': entry.model_id, 'run_at': entry.last_run_at, 'run_count': entry.total_run_count}
+                for entry in entries
+            ]
+        )
+        db.session.commit()
 
     @staticmethod
     def save_model(obj):
@@ -217,19 +254,28 @@ class DatabaseScheduler(Scheduler):
     Entry = ModelEntry
     Model = PeriodicTask
     Changes = PeriodicTasks
+    Removal = PeriodicTaskRemoval
 
     _schedule = None
-    _last_timestamp = None
+    _last_version = 0
     _initial_read = True
     _heap_invalidated = False
+    _listener = None
+    _listener_retry_at = 0.0
+    _change_notified = False
+    _last_poll = 0.0
+    _last_read = 0.0
 
     def __init__(self, *args, **kwargs):
         self._dirty = set()
+        self._batches = {}
         Scheduler.__init__(self, *args, **kwargs)
         self._finalize = Finalize(self, self.sync, exitpriority=5)
         self.max_interval = (kwargs.get('max_interval') or
                              self.app.conf.CELERYBEAT_MAX_LOOP_INTERVAL or
                              DEFAULT_MAX_INTERVAL)
+        # Run state of fired entries is written in bulk once per this many seconds
+        self.sync_every = flask.current_app.config['SCHEDULE_SYNC_INTERVAL']
 
     def setup_schedule(self):
         self.install_default_entries(self.schedule)
@@ -246,16 +292,179 @@ class DatabaseScheduler(Scheduler):
         return s
 
     def schedule_changed(self):
-        last, ts = self._last_timestamp, self.Changes.last_change(db.session)
+        # With change notifications database is polled only as safety net for lost notifications
+        poll_interval = flask.current_app.config['SCHEDULE_CHANGES_POLL_INTERVAL']
+        if self._listener and not self._change_notified and time.monotonic() - self._last_poll < poll_interval:
+            return False
+
+        self._change_notified = False
+        self._last_poll = time.monotonic()
+        is_changed = self.Changes.last_version(db.session) > self._last_version
+        if not is_changed:
+            self._last_read = self._last_poll
+        return is_changed
+
+    def apply_changes(self, version: int) -> None:
+        """
+        Applies only PeriodicTask rows added, modified or removed since last seen version
+        to schedule and heap, instead of rebuilding whole schedule
+        :param version: current version of PeriodicTasks
+        """
+        if time.monotonic() - self._last_read > PERIODIC_TASK_REMOVAL_RETENTION.total_seconds():
+            # Removals scheduler did not see may be pruned already
+            info('DatabaseScheduler: Changes not read for too long, reloading whole schedule')
+            self._schedule = self.all_as_schedule()
+            self._heap_invalidated = True
+        else:
+            removed_names = {name for name, in db.session.query(self.Removal.name).filter(
+                self.Removal.version > self._last_version
+            )}
+            for name in removed_names:
+                if self._schedule.pop(name, None):
+                    debug('DatabaseScheduler: Removing entry %s', name)
+
+            for model in self.Model.query.filter(self.Model.version > self._last_version).populate_existing():
+                # Modified entry is replaced, disabled one is dropped
+                self._schedule.pop(model.name, None)
+                if not model.enabled:
+                    continue
+                try:
+                    entry = self.Entry(model)
+                except ValueError:
+                    continue
+                debug('DatabaseScheduler: Updating entry %s', model.name)
+                self._schedule[model.name] = entry
+                self.push_heap_entry(entry)
+
+        self._last_version = version
+        self._last_read = time.monotonic()
+
+    def push_heap_entry(self, entry) -> None:
+        """
+        Adds entry to heap, event of entry it replaces is dropped once it gets to the top of heap
+        :param entry: ModelEntry
+        """
+        if self._heap is None:
+            return
+        is_due, next_call_delay = entry.is_due()
+        heapq.heappush(self._heap, event_t(self._when(entry, 0 if is_due else next_call_delay) or 0, 5, entry))
+
+    def get_listener(self):
+        """
+        Returns schedule change listener, connecting it when needed
+        :return: None when changes are found by polling
+        """
+        if self._listener is None and time.monotonic() >= self._listener_retry_at:
+            try:
+                self._listener = get_schedule_change_listener()
+            except Exception as exc:  # pylint: disable=broad-except
+                warning('DatabaseScheduler: Cannot listen to schedule changes, polling: %r', exc)
+            if self._listener is None:
+                self._listener_retry_at = time.monotonic() + flask.current_app.config['SCHEDULE_CHANGES_POLL_INTERVAL']
+
+        return self._listener
+
+    def tick(self, *args, **kwargs):
+        """
+        Waits for schedule change notification instead of letting beat sleep,
+        so changed schedule is applied immediately
+        """
+        interval = self.tick_heap(*args, **kwargs)
+        if interval:
+            # Nothing else is due in this tick
+            self.dispatch_batches()
+
+        # Beat syncs only after positive interval or in apply_async, waiting for listener and batches bypass both
+        if self._dirty and self.should_sync():
+            self._do_sync()
+
+        listener = self.get_listener()
+        if not interval or interval <= 0 or not listener:
+            return interval
+
         try:
-            if ts and ts > (last if last else ts):
-                return True
-        finally:
-            self._last_timestamp = ts
-        return False
+            self._change_notified = listener.wait(interval)
+        except Exception as exc:  # pylint: disable=broad-except
+            warning('DatabaseScheduler: Schedule change listener failed, polling: %r', exc)
+            listener.close()
+            self._listener = None
+            return interval
+
+        return 0
+
+    def tick_heap(  # pylint: disable=redefined-builtin,redefined-outer-name
+            self,
+            event_t=event_t,
+            min=min,
+            heappop=heapq.heappop,
+            heappush=heapq.heappush
+    ):
+        """
+        Same as Scheduler.tick, but heap is kept in sync with schedule by apply_changes
+        instead of being rebuilt on every schedule change
+        """
+        schedule = self.schedule
+        if self._heap is None or self._heap_invalidated:
+            self._heap_invalidated = False
+            self.populate_heap()
+
+        H = self._heap  # pylint: disable=invalid-name
+
+        # Drop events of entries replaced or removed since they were pushed
+        while H and schedule.get(H[0][2].name) is not H[0][2]:
+            heappop(H)
+
+        if not H:
+            return self.max_interval
+
+        event = H[0]
+        entry = event[2]
+        is_due, next_time_to_run = self.is_due(entry)
+        if is_due:
+            verify = heappop(H)
+            if verify is event:
+                next_entry = self.reserve(entry)
+                if entry.task in flask.current_app.config['SCHEDULE_BATCH_TASKS']:
+                    self.add_to_batch(entry)
+                else:
+                    self.apply_entry(entry, producer=self.producer)
+                heappush(H, event_t(self._when(next_entry, next_time_to_run), event[1], next_entry))
+                return 0
+            heappush(H, verify)
+            return min(verify[0], self.max_interval)
+        return min(self.adjust(next_time_to_run) or self.max_interval, self.max_interval)
+
+    def add_to_batch(self, entry) -> None:
+        """
+        Adds first argument of due entry to batch of its batch task
+        :param entry: ModelEntry
+        """
+        batch_task = flask.current_app.config['SCHEDULE_BATCH_TASKS'][entry.task]
+        self._batches.setdefault(batch_task, []).append(entry.args[0])
+        if len(self._batches[batch_task]) >= flask.current_app.config['SCHEDULE_BATCH_SIZE']:
+            self.dispatch_batches()
+
+    def dispatch_batches(self) -> None:
+        """
+        Sends one batch task per collected batch
+        """
+        batches, self._batches = self._batches, {}
+        for batch_task, items in batches.items():
+            info('Scheduler: Sending due task %s (%s items)', batch_task, len(items))
+            try:
+                self.app.send_task(batch_task, args=[items], producer=self.producer)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.error('Message Error: %s', exc, exc_info=True)
+
+    def close(self):
+        # Entries in batches are already reserved, they would be skipped till next run
+        self.dispatch_batches()
+        super().close()
 
     def reserve(self, entry):
         new_entry = next(entry)
+        # Entry in schedule is replaced, so heap events can be matched with schedule
+        self._schedule[new_entry.name] = new_entry
         # Need to store entry by name, because the entry may change
         # in the mean time.
         self._dirty.add(new_entry.name)
@@ -264,26 +473,23 @@ class DatabaseScheduler(Scheduler):
     def sync(self):
         if logger.isEnabledFor(logging.DEBUG):
             debug('Writing entries...')
-        _tried = set()
-        _failed = set()
+        dirty = self._dirty
+        self._dirty = set()
+        # Entries removed from schedule in the mean time are not saved
+        entries = [self._schedule[name] for name in dirty if name in self._schedule]
         try:
-            while self._dirty:
-                name = self._dirty.pop()
-                try:
-                    self.schedule[name].save()
-                    _tried.add(name)
-                except KeyError:
-                    _failed.add(name)
+            self.Entry.save_run_state(entries)
         except DatabaseError as exc:
             logger.exception('Database error while sync: %r', exc)
+            db.session.rollback()
+            # retry later
+            self._dirty |= dirty
         except InterfaceError:
             warning(
                 'DatabaseScheduler: InterfaceError in sync(), '
                 'waiting to retry in next call...'
             )
-        finally:
-            # retry later, only for the failed ones
-            self._dirty |= _failed
+            self._dirty |= dirty
 
     def update_from_dict(self, mapping):
         s = {}
@@ -310,32 +516,50 @@ class DatabaseScheduler(Scheduler):
                     'options': {'expire_seconds': 12 * 3600},
                 },
             )
+        if flask.current_app.config.get('OBJECT_POOLS'):
+            entries.setdefault(
+                'gitlab_tools.gc_object_pools', {
+                    'task': 'gitlab_tools.tasks.gitlab_tools.gc_object_pools',
+                    'schedule': schedules.crontab('0', '3', '*'),
+                    'options': {'expire_seconds': 12 * 3600},
+                },
+            )
+        if flask.current_app.config.get('REPOSITORY_MAINTENANCE'):
+            entries.setdefault(
+                'gitlab_tools.maintain_repositories', {
+                    'task': 'gitlab_tools.tasks.gitlab_tools.maintain_repositories',
+                    'schedule': schedules.crontab('30', '*', '*'),
+                    'options': {'expire_seconds': 3600},
+                },
+            )
+        if flask.current_app.config.get('TASK_RESULT_RETENTION'):
+            entries.setdefault(
+                'gitlab_tools.prune_task_results', {
+                    'task': 'gitlab_tools.tasks.gitlab_tools.prune_task_results',
+                    'schedule': schedules.crontab('15', '4', '*'),
+                    'options': {'expire_seconds': 12 * 3600},
+                },
+            )
         self.update_from_dict(entries)
 
-    def schedules_equal(self, *args, **kwargs):
-        if self._heap_invalidated:
-            self._heap_invalidated = False
-            return False
-        return super().schedules_equal(*args, **kwargs)
-
     @property
     def schedule(self):
-        initial = update = False
+        update = False
         if self._initial_read:
             debug('DatabaseScheduler: intial read')
-            initial = update = True
+            update = True
             self._initial_read = False
+            self._last_version = self.Changes.last_version(db.session)
+            self._last_read = time.monotonic()
+            self._schedule = self.all_as_schedule()
+            self._heap_invalidated = True
         elif self.schedule_changed():
             info('DatabaseScheduler: Schedule changed.')
             update = True
+            self.sync()
+            self.apply_changes(self.Changes.last_version(db.session))
 
         if update:
-            self.sync()
-            self._schedule = self.all_as_schedule()
-            # the schedule changed, invalidate the heap in Scheduler.tick
-            if not initial:
-                self._heap = []
-                self._heap_invalidated = True
             if logger.isEnabledFor(logging.DEBUG):
                 debug('Current schedule:\n%s', '\n'.join(
                     repr(entry) for entry in self._schedule.values()),
@@ -45,11 +45,60 @@ class Config(CeleryConfig):
     PORT = 5000
     HOST = '0.0.0.0'  # nosec: B104
     GITLAB_API_VERSION = 4
+    GITLAB_HTTP_POOL_SIZE = 10  # Keep-alive connections to GitLab kept by one process
+    GITLAB_CLIENT_CACHE_SIZE = 100  # GitLab clients of most recently active users kept by one process
+    GITLAB_CACHE_TTL = 60  # Seconds GitLab group/project lookups and searches are cached, 0 disables
+    GITLAB_NAMESPACE_CACHE_TTL = 10 * 60  # Seconds full paths of groups are cached
+    GITLAB_CACHE_SIZE = 1000  # GitLab responses cached by one process, shared through redis when lock backend is redis
+    GITLAB_DEPLOY_KEY_CACHE_TTL = 24 * 60 * 60  # Seconds deploy key verified on project is trusted, failed sync forgets it
+    GITLAB_RATE_LIMIT_RESERVE = 10  # GitLab API calls of user rate limit left unused by tasks, shared by workers through redis
+    GITLAB_RATE_LIMIT_MAX_WAIT = 10  # Seconds API call waits for rate limit, task waiting longer is requeued
+    GITLAB_RATE_LIMIT_COUNTDOWN = 60  # Seconds rate limited task waits in queue when GitLab does not send Retry-After
+    GITLAB_RATE_LIMIT_MAX_RETRIES = 10  # Times rate limited task is requeued before it fails
     USER = getpass.getuser()
+    SYNC_COALESCE_TIMEOUT = 30 * 60  # Queued/running sync older than this is considered lost and not coalesced into
+    GIT_ENGINE = 'git'  # Sync engine: git (GitPython), subprocess or async
+    # Max git network commands running at once in worker process, shared by tasks of --pool threads (async engine)
+    GIT_ASYNC_CONCURRENCY = 16
+    # Max git network commands running at once against single host in one worker process (async engine)
+    GIT_ASYNC_HOST_CONCURRENCY = 4
+    GIT_ASYNC_TIMEOUTS = {'ls-remote': 60, 'fetch': 15 * 60, 'push': 15 * 60, 'clone': 30 * 60, 'local': 5 * 60}
+    HOST_CONCURRENCY = 8  # Max syncs running at once against single host across all workers, 0 disables
+    HOST_RATE = 1.0  # Syncs started per second against single host across all workers, 0 disables
+    HOST_RATE_BURST = 10  # Syncs that can be started at once against idle host
+    HOST_THROTTLE_OVERRIDES = {}  # hostname => dict overriding concurrency, rate and burst
+    HOST_SLOT_TIMEOUT = 30 * 60  # Host slot of crashed worker is released after this many seconds
+    HOST_THROTTLE_COUNTDOWN = 30  # Seconds sync waits in queue when all host slots are taken
+    HOST_THROTTLE_MAX_RETRIES = 100  # Times throttled sync is requeued before it fails
+    SSH_CONTROL_PERSIST = 300  # Seconds idle SSH master connection is kept for reuse by next git transport, 0 disables
+    SCHEDULE_JITTER_WINDOW = 0  # Periodic mirror syncs are delayed by deterministic offset within this many seconds, 0 disables
+    SCHEDULE_JITTER_TASKS = ('gitlab_tools.tasks.gitlab_tools.sync_pull_mirror_cron', )  # Tasks delayed by jitter
+    # PostgreSQL NOTIFY or redis pub/sub channel waking beat on schedule change
+    SCHEDULE_CHANGES_CHANNEL = 'gitlab_tools_schedule_changes'
+    SCHEDULE_CHANGES_POLL_INTERVAL = 60  # Seconds between schedule change polls when notifications are used
+    SCHEDULE_SYNC_INTERVAL = 10  # Seconds between bulk writes of last run time of fired periodic tasks
+    # Periodic tasks due in the same beat tick are dispatched as one batch task taking list of their first arguments
+    SCHEDULE_BATCH_TASKS = {
+        'gitlab_tools.tasks.gitlab_tools.sync_pull_mirror_cron': 'gitlab_tools.tasks.gitlab_tools.sync_pull_mirrors_cron',
+    }
+    SCHEDULE_BATCH_SIZE = 500  # Max items of one batch task
+    OBJECT_POOLS = False  # Share objects of mirrors with same source in pool repository (git alternates)
+    OBJECT_POOL_FETCH_INTERVAL = 60  # Pool fetched more recently than this is not fetched again by next mirror
+    OBJECT_POOL_EXPIRE = 24 * 60 * 60  # Pool not used by any mirror and not fetched for this long is removed
+    REPOSITORY_MAINTENANCE = False  # Periodically repack repositories and write commit-graph/bitmaps
+    REPOSITORY_MAINTENANCE_LOOSE_OBJECTS = 1000  # Repository with more loose objects than this needs maintenance
+    REPOSITORY_MAINTENANCE_PACKS = 10  # Repository with more packs than this needs maintenance
+    REPOSITORY_MAINTENANCE_BATCH = 20  # Max repositories maintained in one run, most fragmented first
+    REPOSITORY_MAINTENANCE_TIME_LIMIT = 10 * 60  # Run stops starting new repositories after this many seconds
+    TASK_RESULT_RETENTION = False  # Periodically delete old task results and logs
+    TASK_RESULT_RETENTION_KEEP = 100  # Newest task results of each mirror that are always kept
+    TASK_RESULT_RETENTION_DAYS = 30  # Failures and results not belonging to mirror are kept this many days
+    TASK_RESULT_RETENTION_CHUNK = 500  # Rows deleted in one transaction
+    TASK_RESULT_RETENTION_EXPORT_STORAGE = None  # Directory deleted rows are exported to as gzipped JSON lines, None disables
 
     @property
     def CELERY_RESULT_BACKEND(self) -> str:
-        return 'db+{}'.format(self.SQLALCHEMY_DATABASE_URI)
+        return 'gitlab_tools.celery_backend.database:JSONDatabaseBackend+{}'.format(self.SQLALCHEMY_DATABASE_URI)
 
 
 class Testing(Config):
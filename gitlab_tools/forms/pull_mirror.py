@@ -5,6 +5,7 @@ from wtforms import Form, StringField, validators, HiddenField, TextAreaField, B
 from cron_descriptor import ExpressionDescriptor, MissingFieldException, FormatException
 from gitlab_tools.models.gitlab_tools import PullMirror
 from gitlab_tools.tools.GitRemote import GitRemote
+from gitlab_tools.tools.cron import expand_hashed_cron
 from gitlab_tools.forms.custom_fields import NonValidatingSelectField
 from gitlab_tools.tools.gitlab import check_project_visibility_in_group, VisibilityError, check_project_exists
 
@@ -96,8 +97,8 @@ class NewForm(Form):
 
         if self.periodic_sync.data:
             try:
-                ExpressionDescriptor(self.periodic_sync.data)
-            except (MissingFieldException, FormatException):
+                ExpressionDescriptor(expand_hashed_cron(self.periodic_sync.data, '0'))
+            except (MissingFieldException, FormatException, ValueError):
                 self.periodic_sync.errors.append(
                     gettext('Wrong cron expression.')
                 )
@@ -167,8 +168,8 @@ class EditForm(NewForm):
 
         if self.periodic_sync.data:
             try:
-                ExpressionDescriptor(self.periodic_sync.data)
-            except (MissingFieldException, FormatException):
+                ExpressionDescriptor(expand_hashed_cron(self.periodic_sync.data, '0'))
+            except (MissingFieldException, FormatException, ValueError):
                 self.periodic_sync.errors.append(
                     gettext('Wrong cron expression.')
                 )
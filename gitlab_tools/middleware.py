@@ -4,18 +4,21 @@
 
 To be imported by the application.current_app() factory.
 """
+import math
 import datetime
 from typing import Optional
 from logging import getLogger
 from celery import states
 from cron_descriptor import ExpressionDescriptor
 from markupsafe import Markup
-from flask import current_app, render_template
+from flask import current_app, render_template, request, jsonify
 from flask_babel import format_datetime, format_date
 from gitlab_tools.extensions import login_manager
 from gitlab_tools.tools.formaters import format_bytes, fix_url, format_boolean, format_vcs
+from gitlab_tools.tools.cron import expand_hashed_cron
 from gitlab_tools.enums.InvokedByEnum import InvokedByEnum
 from gitlab_tools.models.gitlab_tools import User, TaskResult
+from gitlab_tools.tools.gitlab_rate_limit import GitLabRateLimitError
 
 LOG = getLogger(__name__)
 
@@ -30,6 +33,16 @@ def error_handler(e):
     return render_template('{}.html'.format(code)), code
 
 
+@current_app.errorhandler(GitLabRateLimitError)
+def gitlab_rate_limit_error_handler(e: GitLabRateLimitError):
+    # Requests of web UI do not wait for GitLab rate limit, user is asked to retry instead
+    retry_after = max(int(math.ceil(e.retry_after)), 1)
+    headers = {'Retry-After': str(retry_after)}
+    if request.blueprint == 'api_index':
+        return jsonify({'message': str(e)}), 429, headers
+    return render_template('429.html', retry_after=retry_after), 429, headers
+
+
 @login_manager.user_loader
 def load_user(user_id) -> User:
     return User.query.get(user_id)
@@ -71,9 +84,10 @@ def format_boolean_filter(bool_to_format: bool) -> Markup:
 
 
 @current_app.template_filter('format_cron_syntax')
-def format_cron_syntax_filter(cron_syntax: Optional[str]) -> Optional[str]:
+def format_cron_syntax_filter(cron_syntax: Optional[str], seed: Optional[int] = None) -> Optional[str]:
     if cron_syntax:
-        expression_descriptor = ExpressionDescriptor(cron_syntax)
+        # Hashed values are described as they are scheduled for mirror given by seed
+        expression_descriptor = ExpressionDescriptor(expand_hashed_cron(cron_syntax, str(seed)))
         return str(expression_descriptor)
 
     return None
@@ -83,6 +97,11 @@ def format_cron_syntax_filter(cron_syntax: Optional[str]) -> Optional[str]:
 def format_task_status_class_filter(task_result: Optional[TaskResult] = None) -> str:
     if not task_result or not task_result.taskmeta:
         return 'warning'
+    return format_status_class_filter(task_result.taskmeta.status)
+
+
+@current_app.template_filter('format_status_class')
+def format_status_class_filter(status: Optional[str] = None) -> str:
     return {
         states.SUCCESS: 'success',
         states.FAILURE: 'danger',
@@ -92,7 +111,7 @@ def format_task_status_class_filter(task_result: Optional[TaskResult] = None) ->
         states.PENDING: 'info',
         states.RECEIVED: 'info',
         states.STARTED: 'info',
-    }.get(task_result.taskmeta.status, 'warning')
+    }.get(status, 'warning')
 
 
 @current_app.template_filter('format_task_invoked_by')
@@ -1,8 +1,17 @@
 import datetime
-from sqlalchemy.orm import relationship
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import relationship, Session
 from sqlalchemy.sql import func
 from celery import schedules, states
 from gitlab_tools.extensions import db
+from gitlab_tools.tools.json_result import JSONResult, decode_legacy_result
+
+
+CHANGED_PERIODIC_TASKS_KEY = 'changed_periodic_tasks'
+REMOVED_PERIODIC_TASKS_KEY = 'removed_periodic_tasks'
+
+# Removals are kept this long, scheduler not reading changes for longer reloads whole schedule
+PERIODIC_TASK_REMOVAL_RETENTION = datetime.timedelta(days=1)
 
 
 class ConstraintError(Exception):
@@ -132,20 +141,55 @@ class PeriodicTasks(BaseTable):
     id = db.Column(db.Integer, primary_key=True)
     ident = db.Column(db.Integer, default=1, index=True)
     last_update = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    version = db.Column(db.Integer, default=0, nullable=False, server_default='0')
 
     @classmethod
     def changed(cls):
+        """
+        Marks schedule as changed, PeriodicTask rows added or modified in current session
+        are stamped with new version and names of deleted or renamed ones are logged with it,
+        so scheduler reloads only them
+        """
+        changed_tasks = get_changed_periodic_tasks(db.session)
+        removed_names = get_removed_periodic_task_names(db.session)
+
         found = PeriodicTasks.query.filter_by(ident=1).first()
         if not found:
-            found = PeriodicTasks()
+            found = PeriodicTasks(version=0)
+            db.session.add(found)
+            db.session.flush()
+
+        # Incremented in database, row lock keeps versions of concurrent changes ordered
+        PeriodicTasks.query.filter_by(id=found.id).update(
+            {PeriodicTasks.version: PeriodicTasks.version + 1},
+            synchronize_session=False
+        )
+        db.session.refresh(found)
         found.last_update = datetime.datetime.now()
         db.session.add(found)
 
+        for periodic_task in changed_tasks:
+            periodic_task.version = found.version
+
+        PeriodicTaskRemoval.query.filter(
+            PeriodicTaskRemoval.created < datetime.datetime.now() - PERIODIC_TASK_REMOVAL_RETENTION
+        ).delete(synchronize_session=False)
+        for name in removed_names:
+            db.session.add(PeriodicTaskRemoval(name=name, version=found.version))
+
+        from gitlab_tools.celery_beat.notifications import notify_schedule_changed  # pylint: disable=import-outside-toplevel
+        notify_schedule_changed(db.session, found.version)
+
     @classmethod
     def last_change(cls, session):
         obj = cls.filter_by(session, ident=1).first()
         return obj.last_update if obj else None
 
+    @classmethod
+    def last_version(cls, session) -> int:
+        obj = cls.filter_by(session, ident=1).first()
+        return obj.version if obj and obj.version else 0
+
 
 class PeriodicTask(BaseTable):
     __tablename__ = "periodic_task"
@@ -170,6 +214,7 @@ class PeriodicTask(BaseTable):
     enabled = db.Column(db.Boolean, default=True)
     last_run_at = db.Column(db.DateTime)
     total_run_count = db.Column(db.Integer, default=0)
+    version = db.Column(db.Integer, default=0, nullable=False, server_default='0', index=True)
 
     pull_mirrors = relationship("PullMirror", order_by="PullMirror.id", backref="periodic_task", lazy='dynamic')
     no_changes = False
@@ -188,19 +233,82 @@ class PeriodicTask(BaseTable):
         return None
 
 
+class PeriodicTaskRemoval(BaseTable):
+    __tablename__ = "periodic_task_removal"
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(length=200), nullable=False)
+    version = db.Column(db.Integer, nullable=False, index=True)
+
+
+def get_changed_periodic_tasks(session: Session) -> list:
+    """
+    Returns PeriodicTask rows added or modified in current transaction of session
+    :param session: Session
+    :return: list of PeriodicTask
+    """
+    changed_tasks = set(session.info.get(CHANGED_PERIODIC_TASKS_KEY, set()))
+    changed_tasks.update(obj for obj in list(session.new) + list(session.dirty) if isinstance(obj, PeriodicTask))
+    return [obj for obj in changed_tasks if inspect(obj).pending or inspect(obj).persistent]
+
+
+def get_renamed_from(periodic_task: PeriodicTask) -> list:
+    return [name for name in inspect(periodic_task).attrs.name.history.deleted if name]
+
+
+def get_removed_periodic_task_names(session: Session) -> set:
+    """
+    Returns names PeriodicTask rows deleted or renamed in current transaction of session had
+    :param session: Session
+    :return: set of names
+    """
+    removed_names = set(session.info.get(REMOVED_PERIODIC_TASKS_KEY, set()))
+    removed_names.update(obj.name for obj in session.deleted if isinstance(obj, PeriodicTask))
+    for obj in session.dirty:
+        if isinstance(obj, PeriodicTask):
+            removed_names.update(get_renamed_from(obj))
+    return removed_names
+
+
+@event.listens_for(Session, 'before_flush')
+def track_periodic_task_changes(session: Session, flush_context, instances) -> None:  # pylint: disable=unused-argument
+    # Flush empties session.new, session.dirty and session.deleted, so changes are remembered till end of transaction
+    session.info.setdefault(CHANGED_PERIODIC_TASKS_KEY, set()).update(
+        obj for obj in list(session.new) + list(session.dirty) if isinstance(obj, PeriodicTask)
+    )
+    session.info[REMOVED_PERIODIC_TASKS_KEY] = get_removed_periodic_task_names(session)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def reset_periodic_task_changes(session: Session) -> None:
+    session.info.pop(CHANGED_PERIODIC_TASKS_KEY, None)
+    session.info.pop(REMOVED_PERIODIC_TASKS_KEY, None)
+
+
 class TaskMeta(db.Model):
     __tablename__ = 'celery_taskmeta'
-    __table_args__ = {'sqlite_autoincrement': True}
+    __table_args__ = (
+        db.Index('ix_celery_taskmeta_status_date_done', 'status', 'date_done'),
+        {'sqlite_autoincrement': True}
+    )
     id = db.Column(db.Integer, db.Sequence('task_id_sequence'),
                    primary_key=True, autoincrement=True)
     task_id = db.Column(db.String(155), unique=True)
     status = db.Column(db.String(50), default=states.PENDING)
-    result = db.Column(db.PickleType, nullable=True)
+    result_json = db.Column(JSONResult, nullable=True)
+    # Results stored before result_json, pickled
+    legacy_result = db.Column('result', db.LargeBinary, nullable=True)
     date_done = db.Column(db.DateTime, default=datetime.datetime.utcnow,
                           onupdate=datetime.datetime.utcnow, nullable=True)
     traceback = db.Column(db.Text, nullable=True)
     task_result = relationship("TaskResult", backref="taskmeta", uselist=False)
 
+    @property
+    def result(self):
+        if self.legacy_result is not None:
+            return decode_legacy_result(self.legacy_result)
+        return self.result_json
+
 
 class TaskSet(db.Model):
     """TaskSet result."""
@@ -210,6 +318,14 @@ class TaskSet(db.Model):
     id = db.Column(db.Integer, db.Sequence('taskset_id_sequence'),
                    autoincrement=True, primary_key=True)
     taskset_id = db.Column(db.String(155), unique=True)
-    result = db.Column(db.PickleType, nullable=True)
+    result_json = db.Column(JSONResult, nullable=True)
+    # Results stored before result_json, pickled
+    legacy_result = db.Column('result', db.LargeBinary, nullable=True)
     date_done = db.Column(db.DateTime, default=datetime.datetime.utcnow,
                           nullable=True)
+
+    @property
+    def result(self):
+        if self.legacy_result is not None:
+            return decode_legacy_result(self.legacy_result)
+        return self.result_json
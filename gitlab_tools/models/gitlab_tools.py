@@ -35,6 +35,13 @@ class Mirror(BaseTable):
     is_force_update = db.Column(db.Boolean)
     is_prune_mirrors = db.Column(db.Boolean)
     is_deleted = db.Column(db.Boolean)
+    source_refs_hash = db.Column(db.String(64), nullable=True)
+    target_refs_hash = db.Column(db.String(64), nullable=True)
+    sync_requested_by = db.Column(db.Integer, nullable=True)
+    last_status = db.Column(db.String(50), nullable=True, index=True)
+    last_duration_ms = db.Column(db.Integer, nullable=True)
+    last_error_summary = db.Column(db.String(255), nullable=True)
+    last_success_at = db.Column(db.DateTime, nullable=True)
 
 
 class OAuth2State(BaseTable):
@@ -171,6 +178,11 @@ class Group(BaseTable):
 
 class TaskResult(BaseTable):
     __tablename__ = 'task_result'
+    __table_args__ = (
+        # Log pages list top level results of mirror newest first
+        db.Index('ix_task_result_pull_mirror_id_parent_id_created', 'pull_mirror_id', 'parent_id', 'created', 'id'),
+        db.Index('ix_task_result_push_mirror_id_parent_id_created', 'push_mirror_id', 'parent_id', 'created', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     pull_mirror_id = db.Column(db.Integer, db.ForeignKey('pull_mirror.id'), index=True, nullable=True)
     push_mirror_id = db.Column(db.Integer, db.ForeignKey('push_mirror.id'), index=True, nullable=True)
@@ -178,4 +190,5 @@ class TaskResult(BaseTable):
     invoked_by = db.Column(db.Integer, default=InvokedByEnum.UNKNOWN)
     taskmeta_id = db.Column(db.Integer, db.ForeignKey('celery_taskmeta.id'), index=True, nullable=False, unique=True)
     parent_id = db.Column(db.Integer, db.ForeignKey('task_result.id'), index=True, nullable=True)
+    coalesced_count = db.Column(db.Integer, default=0)
     children = relationship("TaskResult", backref=backref('parent', remote_side=[id]))
@@ -0,0 +1,28 @@
+-- Takes one API call from GitLab rate limit budget shared by all workers
+-- KEYS[1] hash holding budget reported by GitLab
+-- ARGV[1] now, ARGV[2] calls of budget left unused
+-- Returns seconds to wait for budget, 0 when call was taken
+local now = tonumber(ARGV[1])
+local reserve = tonumber(ARGV[2])
+
+local budget = redis.call('HMGET', KEYS[1], 'remaining', 'reset', 'blocked_until')
+local remaining = tonumber(budget[1])
+local reset = tonumber(budget[2])
+local blocked_until = tonumber(budget[3]) or 0
+
+-- Lua numbers are truncated to integers in replies
+if blocked_until > now then
+    return tostring(blocked_until - now)
+end
+
+-- Budget is unknown till first response or renewed after reset
+if remaining == nil or reset == nil or reset <= now then
+    return '0'
+end
+
+if remaining <= reserve then
+    return tostring(reset - now)
+end
+
+redis.call('HSET', KEYS[1], 'remaining', remaining - 1)
+return '0'
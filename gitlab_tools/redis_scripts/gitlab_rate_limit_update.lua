@@ -0,0 +1,23 @@
+-- Stores GitLab rate limit budget reported by response headers
+-- KEYS[1] hash holding budget
+-- ARGV[1] now, ARGV[2] RateLimit-Remaining or '', ARGV[3] RateLimit-Reset or '', ARGV[4] Retry-After or ''
+local now = tonumber(ARGV[1])
+local remaining = tonumber(ARGV[2])
+local reset = tonumber(ARGV[3])
+local retry_after = tonumber(ARGV[4])
+local expire_at = now
+
+if remaining and reset then
+    redis.call('HSET', KEYS[1], 'remaining', remaining, 'reset', reset)
+    expire_at = math.max(expire_at, reset)
+end
+
+if retry_after then
+    redis.call('HSET', KEYS[1], 'blocked_until', now + retry_after)
+    expire_at = math.max(expire_at, now + retry_after)
+end
+
+if expire_at > now then
+    redis.call('EXPIREAT', KEYS[1], math.ceil(expire_at) + 1)
+end
+return 0
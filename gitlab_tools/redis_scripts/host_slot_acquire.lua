@@ -0,0 +1,16 @@
+-- Acquires one of limited concurrent slots of host
+-- KEYS[1] sorted set of slot tokens scored by expiration
+-- ARGV[1] token, ARGV[2] limit, ARGV[3] now, ARGV[4] slot timeout
+local now = tonumber(ARGV[3])
+local timeout = tonumber(ARGV[4])
+
+-- Slots of crashed workers expire
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], now + timeout, ARGV[1])
+    redis.call('EXPIRE', KEYS[1], math.ceil(timeout))
+    return 1
+end
+
+return 0
@@ -0,0 +1,26 @@
+-- Takes token from rate limiting bucket of host
+-- KEYS[1] hash holding bucket state
+-- ARGV[1] refill rate (tokens per second), ARGV[2] bucket size, ARGV[3] now
+-- Returns seconds to wait for next token, 0 when token was taken
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+local tokens = tonumber(bucket[1]) or burst
+local timestamp = tonumber(bucket[2]) or now
+
+tokens = math.min(burst, tokens + math.max(0, now - timestamp) * rate)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'timestamp', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+
+-- Lua numbers are truncated to integers in replies
+return tostring(wait)
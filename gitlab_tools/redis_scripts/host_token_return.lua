@@ -0,0 +1,11 @@
+-- Returns token taken from rate limiting bucket of host by sync that was not started
+-- KEYS[1] hash holding bucket state
+-- ARGV[1] bucket size
+local burst = tonumber(ARGV[1])
+
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('HSET', KEYS[1], 'tokens', math.min(burst, tokens + 1))
+end
+
+return 1
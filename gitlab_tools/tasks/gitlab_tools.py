@@ -1,18 +1,36 @@
 import os
+import time
 import datetime
 import shutil
+from typing import List, Optional
 from logging import getLogger
 import flask
 import gitlab
 
 from Cryptodome.PublicKey import RSA
+from celery import states
+from celery.signals import worker_ready, worker_shutdown, task_prerun, task_postrun
 
 from flask_celery import single_instance
+from flask_celery.exceptions import OtherInstanceError
 from gitlab_tools.models.gitlab_tools import PullMirror, User, PushMirror, Project
 from gitlab_tools.tools.GitRemote import GitRemote
 from gitlab_tools.tools.GitUri import GitUri
-from gitlab_tools.tools.celery import log_task_pending
+from gitlab_tools.tools.celery import coalesce_task_pending, coalesced_sync, \
+    find_active_task_result, log_tasks_pending, coalesce_tasks_pending, update_mirror_status, \
+    single_instance_per_mirror, claim_sync_request
 from gitlab_tools.tools.Git import Git
+from gitlab_tools.tools.GitSubprocess import GitSubprocess
+from gitlab_tools.tools.GitAsync import GitAsync
+from gitlab_tools.tools.ObjectPool import ObjectPool
+from gitlab_tools.tools.throttle import host_throttled
+from gitlab_tools.tools.gitlab import get_gitlab_instance, find_project_in_namespace, enable_deploy_key
+from gitlab_tools.tools.gitlab_cache import invalidate_user_cache, set_deploy_key_enabled, forget_deploy_key_enabled
+from gitlab_tools.tools.gitlab_rate_limit import gitlab_rate_limited, reset_api_calls, record_api_calls
+from gitlab_tools.tools.retention import prune_task_results as prune_task_results_outside_retention
+from gitlab_tools.tools.maintenance import get_repository_stats, is_maintenance_needed, maintenance_priority, \
+    maintain_repository
+from gitlab_tools.enums.VcsEnum import VcsEnum
 from gitlab_tools.enums.InvokedByEnum import InvokedByEnum
 from gitlab_tools.tools.helpers import get_repository_path, \
     get_namespace_path, \
@@ -20,6 +38,10 @@ from gitlab_tools.tools.helpers import get_repository_path, \
     get_user_private_key_path, \
     convert_url_for_user, \
     add_ssh_config, \
+    get_object_pool_path, \
+    get_object_pool_storage, \
+    prepare_ssh_control_storage, \
+    stop_ssh_control_masters, \
     mkdir_p
 
 from gitlab_tools.extensions import celery, db
@@ -27,20 +49,109 @@ from gitlab_tools.extensions import celery, db
 
 LOG = getLogger(__name__)
 
+SYNC_SKIPPED_UNCHANGED = 'skipped: unchanged'
+
+# Start times of sync tasks running in this worker process, task id => monotonic time
+sync_started_at = {}
+
+# Async sync engine of this worker process
+git_async = None  # type: Optional[GitAsync]
+git_async_pid = None  # type: Optional[int]
+
+
+@worker_ready.connect
+def on_worker_ready(**kwargs) -> None:  # pylint: disable=unused-argument
+    # Control sockets of SSH multiplexing must exist before first git transport runs
+    prepare_ssh_control_storage(flask.current_app.config['USER'])
+
+
+@worker_shutdown.connect
+def on_worker_shutdown(**kwargs) -> None:  # pylint: disable=unused-argument
+    # Master connections would otherwise outlive worker for ControlPersist seconds
+    stop_ssh_control_masters(flask.current_app.config['USER'])
+
+
+def get_synced_mirror_class(task) -> Optional[type]:
+    return {
+        sync_pull_mirror.name: PullMirror,
+        sync_push_mirror.name: PushMirror,
+    }.get(task.name)
+
+
+@task_prerun.connect
+def on_task_prerun(task_id: str, task, **kwargs) -> None:  # pylint: disable=unused-argument
+    reset_api_calls()
+    if get_synced_mirror_class(task):
+        sync_started_at[task_id] = time.monotonic()
+
+
+@task_postrun.connect
+def on_task_postrun(task_id: str, task, args: tuple, retval, state: str, **kwargs) -> None:  # pylint: disable=unused-argument
+    record_api_calls(task.name)
+    started_at = sync_started_at.pop(task_id, None)
+    # Requeued or locked out sync did not run at all
+    if started_at is None or state == states.RETRY or isinstance(retval, OtherInstanceError):
+        return
+
+    update_mirror_status(get_synced_mirror_class(task), args[0], state, retval, time.monotonic() - started_at)
+    if state == states.FAILURE:
+        # Deploy key may have been disabled or deleted, next save verifies it again
+        mirror = get_synced_mirror_class(task).query.filter_by(id=args[0]).first()
+        if mirror and mirror.project:
+            forget_deploy_key_enabled(mirror.user_id, mirror.project.gitlab_id)
+
+
+def get_git_engine():
+    """
+    Returns sync engine selected by GIT_ENGINE config
+    :return: Git, GitSubprocess or GitAsync instance
+    """
+    global git_async, git_async_pid  # pylint: disable=global-statement
+    engine = flask.current_app.config.get('GIT_ENGINE', 'git')
+    if engine == 'async':
+        # One engine per worker process, its event loop and concurrency limits are shared by all tasks of process
+        if git_async is None or git_async_pid != os.getpid():
+            git_async = GitAsync(
+                flask.current_app.config['GIT_ASYNC_CONCURRENCY'],
+                flask.current_app.config['GIT_ASYNC_HOST_CONCURRENCY'],
+                flask.current_app.config['GIT_ASYNC_TIMEOUTS']
+            )
+            git_async_pid = os.getpid()
+        return git_async
+
+    engines = {
+        'git': Git,
+        'subprocess': GitSubprocess,
+    }
+    if engine not in engines:
+        raise Exception('Unknown git engine {}'.format(engine))
+
+    return engines[engine]
+
+
+def get_object_pool(source: GitRemote) -> Optional[ObjectPool]:
+    """
+    Returns object pool shared by mirrors of source
+    :param source: source remote
+    :return: None when object pools are disabled or not supported by source
+    """
+    if not flask.current_app.config.get('OBJECT_POOLS') or source.vcs_type != VcsEnum.GIT:
+        return None
+
+    return ObjectPool(
+        get_object_pool_path(source.url, flask.current_app.config['USER']),
+        flask.current_app.config['OBJECT_POOL_FETCH_INTERVAL']
+    )
+
 
 @celery.task(bind=True)
 @single_instance(include_args=True)
+@gitlab_rate_limited
 def save_pull_mirror(self, mirror_id: int) -> None:  # pylint: disable=unused-argument, too-many-locals, too-many-statements, too-many-branches
     mirror = PullMirror.query.filter_by(id=mirror_id).first()
     if not mirror.is_no_create and not mirror.is_no_remote:
 
-        gl = gitlab.Gitlab(
-            flask.current_app.config['GITLAB_URL'],
-            oauth_token=mirror.user.access_token,
-            api_version=flask.current_app.config['GITLAB_API_VERSION']
-        )
-
-        gl.auth()
+        gl = get_gitlab_instance(mirror.user)
 
         # 0. Check if group/s exists
         try:
@@ -104,12 +215,15 @@ def save_pull_mirror(self, mirror_id: int) -> None:  # pylint: disable=unused-ar
                         raise e
 
                     # Force create enabled, lets find our project
-                    found_projects = gl.projects.list(search=mirror.project_name)
-                    for found_project in found_projects:
-                        if mirror.project_name in [found_project.name, found_project.path] and \
-                                mirror.group.gitlab_id == int(found_project.namespace['id']):
-                            gitlab_project = gl.projects.get(found_project.id)
-                            break
+                    found_project_id = find_project_in_namespace(
+                        gl,
+                        mirror.user.id,
+                        mirror.group.gitlab_id,
+                        mirror.project_name
+                    )
+                    if not found_project_id:
+                        raise e
+                    gitlab_project = gl.projects.get(found_project_id)
 
             found_project = Project.query.filter_by(gitlab_id=gitlab_project.id).first()
             if not found_project:
@@ -125,52 +239,11 @@ def save_pull_mirror(self, mirror_id: int) -> None:  # pylint: disable=unused-ar
             db.session.add(mirror)
             db.session.commit()
 
-        # Check deploy key exists in gitlab
-        key = None
-        if mirror.user.gitlab_deploy_key_id:
-            try:
-                try:
-                    key = gl.deploykeys.get(mirror.user.gitlab_deploy_key_id)
-                except AttributeError:
-                    # python-gitlab > 1.5 has no get on DeployKeysManager
-                    for key_item in gl.deploykeys.list():
-                        if key_item.id == mirror.user.gitlab_deploy_key_id:
-                            key = key_item
-                            break
-            except gitlab.exceptions.GitlabError as e:
-                if e.response_code == 404:
-                    key = None
-                else:
-                    raise
+        # Cached searches and project lookups of user do not contain the change yet
+        invalidate_user_cache(mirror.user.id)
 
-            if key:
-                # We got here, so key exists! lets check if its enabled for project
-                try:
-                    gitlab_project.keys.get(mirror.user.gitlab_deploy_key_id)
-                except gitlab.exceptions.GitlabError as e:
-                    if e.response_code == 404:
-                        # Enable if not enabled
-                        gitlab_project.keys.enable(mirror.user.gitlab_deploy_key_id)
-                    else:
-                        raise
-
-                enabled_key = gitlab_project.keys.get(mirror.user.gitlab_deploy_key_id)
-                gl.http_put(
-                    '/projects/{project_id}/deploy_keys/{key_id}'.format(
-                        project_id=gitlab_project.id,
-                        key_id=enabled_key.id
-                    ),
-                    post_data={
-                        'can_push': True
-                    }
-                )
-                # Make sure that key has can_push=True
-                # !FIXME Enable when implemented
-                # enabled_key = project.keys.get(mirror.user.gitlab_deploy_key_id)
-                # enabled_key.can_push = True
-                # enabled_key.save()
-
-        if not key:
+        # Check deploy key exists in gitlab and is enabled with push access
+        if not enable_deploy_key(gl, gitlab_project, mirror.user, can_push=True):
             # No deploy key ID found, that means we need to add that key
             key = gitlab_project.keys.create({
                 'title': 'Gitlab tools deploy key for user {}'.format(mirror.user.name),
@@ -181,6 +254,7 @@ def save_pull_mirror(self, mirror_id: int) -> None:  # pylint: disable=unused-ar
             mirror.user.gitlab_deploy_key_id = key.id
             db.session.add(mirror)
             db.session.commit()
+            set_deploy_key_enabled(mirror.user.id, gitlab_project.id, key.id, True)
 
         git_remote_target_original = GitRemote(
             gitlab_project.ssh_url_to_repo,
@@ -198,7 +272,8 @@ def save_pull_mirror(self, mirror_id: int) -> None:  # pylint: disable=unused-ar
             mirror.user,
             flask.current_app.config['USER'],
             git_remote_target.hostname,
-            git_remote_target_original
+            git_remote_target_original,
+            flask.current_app.config['SSH_CONTROL_PERSIST']
         )
         mirror.target = git_remote_target.url
         db.session.add(mirror)
@@ -214,10 +289,17 @@ def save_pull_mirror(self, mirror_id: int) -> None:  # pylint: disable=unused-ar
 
     git_remote_source = GitRemote(mirror.source, mirror.is_force_update, mirror.is_prune_mirrors)
 
-    Git.create_mirror(namespace_path, str(mirror.id), git_remote_source, git_remote_target)
+    sync_result = get_git_engine().create_mirror(
+        namespace_path,
+        str(mirror.id),
+        git_remote_source,
+        git_remote_target,
+        get_object_pool(git_remote_source)
+    )
 
     # 5. Set last_sync date to mirror
-
+    mirror.source_refs_hash = sync_result.source_refs_hash
+    mirror.target_refs_hash = sync_result.target_refs_hash
     mirror.last_sync = datetime.datetime.now()
     db.session.add(mirror)
     db.session.commit()
@@ -225,15 +307,10 @@ def save_pull_mirror(self, mirror_id: int) -> None:  # pylint: disable=unused-ar
 
 @celery.task(bind=True)
 @single_instance(include_args=True)
+@gitlab_rate_limited
 def save_push_mirror(self, push_mirror_id) -> None:  # pylint: disable=unused-argument, too-many-statements
     mirror = PushMirror.query.filter_by(id=push_mirror_id).first()
-    gl = gitlab.Gitlab(
-        flask.current_app.config['GITLAB_URL'],
-        oauth_token=mirror.user.access_token,
-        api_version=flask.current_app.config['GITLAB_API_VERSION']
-    )
-
-    gl.auth()
+    gl = get_gitlab_instance(mirror.user)
 
     # 0. Check if project exists
     gitlab_project = gl.projects.get(mirror.project.gitlab_id)
@@ -250,36 +327,8 @@ def save_push_mirror(self, push_mirror_id) -> None:  # pylint: disable=unused-ar
     db.session.add(found_project)
     db.session.commit()
 
-    # Check deploy key exists in gitlab
-    key = None
-    if mirror.user.gitlab_deploy_key_id:
-        try:
-            try:
-                key = gl.deploykeys.get(mirror.user.gitlab_deploy_key_id)
-            except AttributeError:
-                # python-gitlab > 1.5 has no get on DeployKeysManager
-                for key_item in gl.deploykeys.list():
-                    if key_item.id == mirror.user.gitlab_deploy_key_id:
-                        key = key_item
-                        break
-        except gitlab.exceptions.GitlabError as e:
-            if e.response_code == 404:
-                key = None
-            else:
-                raise
-
-        if key:
-            # We got here, so key exists! lets check if its enabled for project
-            try:
-                gitlab_project.keys.get(mirror.user.gitlab_deploy_key_id)
-            except gitlab.exceptions.GitlabError as e:
-                if e.response_code == 404:
-                    # Enable if not enabled
-                    gitlab_project.keys.enable(mirror.user.gitlab_deploy_key_id)
-                else:
-                    raise
-
-    if not key:
+    # Check deploy key exists in gitlab and is enabled
+    if not enable_deploy_key(gl, gitlab_project, mirror.user, can_push=False):
         # No deploy key ID found, that means we need to add that key
         key = gitlab_project.keys.create({
             'title': 'Gitlab tools deploy key for user {}'.format(mirror.user.name),
@@ -289,6 +338,7 @@ def save_push_mirror(self, push_mirror_id) -> None:  # pylint: disable=unused-ar
         mirror.user.gitlab_deploy_key_id = key.id
         db.session.add(mirror)
         db.session.commit()
+        set_deploy_key_enabled(mirror.user.id, gitlab_project.id, key.id, False)
 
     # Create hook
     gitlab_project.hooks.create({
@@ -318,7 +368,8 @@ def save_push_mirror(self, push_mirror_id) -> None:  # pylint: disable=unused-ar
         mirror.user,
         flask.current_app.config['USER'],
         git_remote_source.hostname,
-        git_remote_source_original
+        git_remote_source_original,
+        flask.current_app.config['SSH_CONTROL_PERSIST']
     )
 
     namespace_path = get_namespace_path(mirror, flask.current_app.config['USER'])
@@ -329,9 +380,17 @@ def save_push_mirror(self, push_mirror_id) -> None:  # pylint: disable=unused-ar
 
     git_remote_target = GitRemote(mirror.target, mirror.is_force_update, mirror.is_prune_mirrors)
 
-    Git.create_mirror(namespace_path, str(mirror.id), git_remote_source, git_remote_target)
+    sync_result = get_git_engine().create_mirror(
+        namespace_path,
+        str(mirror.id),
+        git_remote_source,
+        git_remote_target,
+        get_object_pool(git_remote_source)
+    )
 
     # 5. Set last_sync date to mirror
+    mirror.source_refs_hash = sync_result.source_refs_hash
+    mirror.target_refs_hash = sync_result.target_refs_hash
     mirror.source = git_remote_source_original.url
     mirror.last_sync = datetime.datetime.now()
     db.session.add(mirror)
@@ -343,13 +402,36 @@ def save_push_mirror(self, push_mirror_id) -> None:  # pylint: disable=unused-ar
 def sync_pull_mirror_cron(self, pull_mirror_id: int) -> None:  # pylint: disable=unused-argument
     pull_mirror = PullMirror.query.filter_by(id=pull_mirror_id).first()
 
+    if coalesce_task_pending(pull_mirror, sync_pull_mirror, InvokedByEnum.SCHEDULER):
+        return
+
     task = sync_pull_mirror.delay(pull_mirror_id)
-    log_task_pending(task, pull_mirror, sync_pull_mirror, InvokedByEnum.SCHEDULER)
+    log_tasks_pending([(task, pull_mirror)], sync_pull_mirror, InvokedByEnum.SCHEDULER)
 
 
 @celery.task(bind=True)
+def sync_pull_mirrors_cron(self, pull_mirror_ids: List[int]) -> None:  # pylint: disable=unused-argument
+    """
+    Batch variant of sync_pull_mirror_cron, dispatched by beat for pull mirrors due in the same tick
+    :param pull_mirror_ids: list of pull mirror ids
+    """
+    pull_mirrors = PullMirror.query.filter(PullMirror.id.in_(pull_mirror_ids)).all()
+    pull_mirrors = coalesce_tasks_pending(pull_mirrors, sync_pull_mirror, InvokedByEnum.SCHEDULER)
+    if not pull_mirrors:
+        return
+
+    # All syncs are published over one broker connection
+    with celery.producer_or_acquire() as producer:
+        tasks = [sync_pull_mirror.apply_async((pull_mirror.id,), producer=producer) for pull_mirror in pull_mirrors]
+
+    log_tasks_pending(list(zip(tasks, pull_mirrors)), sync_pull_mirror, InvokedByEnum.SCHEDULER)
+
+
+@celery.task(bind=True)
+@coalesced_sync(PullMirror)
 @single_instance(include_args=True)
-def sync_pull_mirror(self, pull_mirror_id: int) -> None:  # pylint: disable=unused-argument
+@host_throttled(PullMirror)
+def sync_pull_mirror(self, pull_mirror_id: int) -> Optional[str]:  # pylint: disable=unused-argument
     mirror = PullMirror.query.filter_by(id=pull_mirror_id).first()
 
     if not mirror.source:
@@ -361,17 +443,35 @@ def sync_pull_mirror(self, pull_mirror_id: int) -> None:  # pylint: disable=unus
     namespace_path = get_namespace_path(mirror, flask.current_app.config['USER'])
     git_remote_source = GitRemote(mirror.source, mirror.is_force_update, mirror.is_prune_mirrors)
     git_remote_target = GitRemote(mirror.target, mirror.is_force_update, mirror.is_prune_mirrors)
-    Git.sync_mirror(namespace_path, str(mirror.id), git_remote_source, git_remote_target)
+    sync_result = get_git_engine().sync_mirror(
+        namespace_path,
+        str(mirror.id),
+        git_remote_source,
+        git_remote_target,
+        mirror.source_refs_hash,
+        mirror.target_refs_hash,
+        get_object_pool(git_remote_source)
+    )
 
     # 5. Set last_sync date to mirror
+    mirror.source_refs_hash = sync_result.source_refs_hash
+    mirror.target_refs_hash = sync_result.target_refs_hash
     mirror.last_sync = datetime.datetime.now()
     db.session.add(mirror)
     db.session.commit()
 
+    return SYNC_SKIPPED_UNCHANGED if sync_result.is_unchanged else None
+
 
 @celery.task(bind=True)
-@single_instance(include_args=True)
-def sync_push_mirror(self, push_mirror_id: int) -> None:  # pylint: disable=unused-argument
+@coalesced_sync(PushMirror)
+@single_instance_per_mirror
+@host_throttled(PushMirror)
+def sync_push_mirror(  # pylint: disable=unused-argument
+        self,
+        push_mirror_id: int,
+        ref_update: Optional[dict] = None
+) -> Optional[str]:
     mirror = PushMirror.query.filter_by(id=push_mirror_id).first()
 
     if not mirror.source:
@@ -383,13 +483,49 @@ def sync_push_mirror(self, push_mirror_id: int) -> None:  # pylint: disable=unus
     namespace_path = get_namespace_path(mirror, flask.current_app.config['USER'])
     git_remote_source = GitRemote(mirror.source, mirror.is_force_update, mirror.is_prune_mirrors)
     git_remote_target = GitRemote(mirror.target, mirror.is_force_update, mirror.is_prune_mirrors)
-    Git.sync_mirror(namespace_path, str(mirror.id), git_remote_source, git_remote_target)
+
+    git_engine = get_git_engine()
+    sync_result = None
+    if claim_sync_request(PushMirror, mirror.id) and ref_update:
+        LOG.info('Mirror %s was triggered again while ref update was queued, doing full sync', mirror.id)
+        ref_update = None
+
+    if ref_update:
+        # Push event told us what changed, try to sync only that ref
+        sync_result = git_engine.sync_ref(
+            namespace_path,
+            str(mirror.id),
+            git_remote_source,
+            git_remote_target,
+            ref_update['ref'],
+            ref_update['before'],
+            ref_update['after'],
+            mirror.source_refs_hash,
+            mirror.target_refs_hash
+        )
+        if not sync_result:
+            LOG.info('Ref update of mirror %s cannot be applied, falling back to full sync', mirror.id)
+
+    if not sync_result:
+        sync_result = git_engine.sync_mirror(
+            namespace_path,
+            str(mirror.id),
+            git_remote_source,
+            git_remote_target,
+            mirror.source_refs_hash,
+            mirror.target_refs_hash,
+            get_object_pool(git_remote_source)
+        )
 
     # 5. Set last_sync date to mirror
+    mirror.source_refs_hash = sync_result.source_refs_hash
+    mirror.target_refs_hash = sync_result.target_refs_hash
     mirror.last_sync = datetime.datetime.now()
     db.session.add(mirror)
     db.session.commit()
 
+    return SYNC_SKIPPED_UNCHANGED if sync_result.is_unchanged else None
+
 
 @celery.task(bind=True)
 @single_instance(include_args=True)
@@ -431,6 +567,83 @@ def delete_push_mirror(self, push_mirror_id: int) -> None:  # pylint: disable=un
         db.session.commit()
 
 
+@celery.task(bind=True)
+@single_instance()
+def gc_object_pools(self) -> None:  # pylint: disable=unused-argument
+    user_name = flask.current_app.config['USER']
+    pools_storage = get_object_pool_storage(user_name)
+    if not os.path.isdir(pools_storage):
+        return
+
+    # Pool members are found by alternates of repositories, mirror source may have changed since it was attached
+    pools_members = {}
+    for mirror in PullMirror.query.all() + PushMirror.query.all():
+        project_path = get_repository_path(get_namespace_path(mirror, user_name), mirror)
+        if not os.path.isdir(project_path):
+            continue
+
+        for alternate in ObjectPool.get_alternates(project_path):
+            member_key = '{}-{}'.format(mirror.__tablename__, mirror.id)
+            pools_members.setdefault(alternate, {})[member_key] = project_path
+
+    for pool_name in sorted(os.listdir(pools_storage)):
+        if not pool_name.endswith('.git'):
+            continue
+
+        object_pool = ObjectPool(os.path.join(pools_storage, pool_name))
+        members = pools_members.get(object_pool.objects_path)
+        if members:
+            LOG.info('Collecting garbage of object pool %s used by %s mirrors', object_pool.path, len(members))
+            object_pool.gc(members)
+        elif object_pool.idle_time > flask.current_app.config['OBJECT_POOL_EXPIRE']:
+            LOG.info('Removing unused object pool %s', object_pool.path)
+            shutil.rmtree(object_pool.path)
+
+
+@celery.task(bind=True)
+@single_instance()
+def maintain_repositories(self) -> None:  # pylint: disable=unused-argument
+    config = flask.current_app.config
+    candidates = []
+    for mirror in PullMirror.query.filter_by(is_deleted=False).all() + \
+            PushMirror.query.filter_by(is_deleted=False).all():
+        project_path = get_repository_path(get_namespace_path(mirror, config['USER']), mirror)
+        if not os.path.isdir(project_path):
+            continue
+
+        stats = get_repository_stats(project_path)
+        if is_maintenance_needed(stats, config['REPOSITORY_MAINTENANCE_LOOSE_OBJECTS'], config['REPOSITORY_MAINTENANCE_PACKS']):
+            candidates.append((maintenance_priority(stats), mirror, project_path))
+
+    # Most fragmented repositories first, rest waits for next run
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    deadline = time.monotonic() + config['REPOSITORY_MAINTENANCE_TIME_LIMIT']
+    for priority, mirror, project_path in candidates[:config['REPOSITORY_MAINTENANCE_BATCH']]:
+        if time.monotonic() > deadline:
+            LOG.info('Repository maintenance time limit reached, continuing in next run')
+            break
+
+        sync_task = sync_pull_mirror if isinstance(mirror, PullMirror) else sync_push_mirror
+        if find_active_task_result(mirror, sync_task):
+            LOG.info('Mirror %s is being synced, skipping maintenance of %s', mirror.id, project_path)
+            continue
+
+        LOG.info('Maintaining %s (priority %s)', project_path, priority)
+        maintain_repository(project_path)
+
+
+@celery.task(bind=True)
+@single_instance()
+def prune_task_results(self) -> None:  # pylint: disable=unused-argument
+    config = flask.current_app.config
+    prune_task_results_outside_retention(
+        config['TASK_RESULT_RETENTION_KEEP'],
+        config['TASK_RESULT_RETENTION_DAYS'],
+        config['TASK_RESULT_RETENTION_CHUNK'],
+        config['TASK_RESULT_RETENTION_EXPORT_STORAGE']
+    )
+
+
 @celery.task(bind=True)
 @single_instance(include_args=True)
 def create_rsa_pair(self, user_id: int) -> None:  # pylint: disable=unused-argument
@@ -461,4 +674,4 @@ def create_ssh_config(self, user_id: int, host: str, git_url: str) -> None:  # p
         raise Exception('User {} not found'.format(user_id))
 
     host_info = GitUri(git_url)
-    add_ssh_config(user, flask.current_app.config['USER'], host, host_info)
+    add_ssh_config(user, flask.current_app.config['USER'], host, host_info, flask.current_app.config['SSH_CONTROL_PERSIST'])
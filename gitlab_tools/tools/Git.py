@@ -1,16 +1,65 @@
 import os
 import subprocess  # nosec: B404
 import logging
+from typing import Dict, List, Optional
 from git import Repo
+from git.remote import PushInfo
 from gitlab_tools.tools.Svn import Svn
 from gitlab_tools.enums.VcsEnum import VcsEnum
 from gitlab_tools.tools.GitRemote import GitRemote
+from gitlab_tools.tools.SyncResult import SyncResult
+from gitlab_tools.tools.ObjectPool import ObjectPool
+from gitlab_tools.tools.refs import parse_refs, refs_fingerprint, build_push_refspecs, chunk_refspecs, \
+    MIRROR_REF_PREFIXES, ZERO_SHA
 
 
 class Git:
 
     @staticmethod
-    def sync_mirror(namespace_path: str, temp_name: str, source: GitRemote, target: GitRemote=None):
+    def get_remote_refs(repo: Repo, remote_name: str) -> Dict[str, str]:
+        """
+        Returns refs advertised by remote
+        :param repo: Repo
+        :param remote_name: name of remote
+        :return: dict of refname => sha
+        """
+        return parse_refs(repo.git.ls_remote(remote_name))
+
+    @staticmethod
+    def get_local_refs(repo: Repo) -> Dict[str, str]:
+        """
+        Returns refs of local repository
+        :param repo: Repo
+        :return: dict of refname => sha
+        """
+        return parse_refs(repo.git.for_each_ref('--format=%(objectname) %(refname)'))
+
+    @staticmethod
+    def push(repo: Repo, refspec: Optional[List[str]] = None, **kwargs) -> bool:
+        """
+        Pushes to gitlab remote
+        :param repo: Repo
+        :param refspec: refspecs to push
+        :param kwargs: git push options
+        :return: False when any ref was rejected
+        """
+        push_infos = repo.remotes.gitlab.push(refspec=refspec, **kwargs)
+        failed = [push_info for push_info in push_infos if push_info.flags & PushInfo.ERROR]
+        for push_info in failed:
+            logging.warning('Push of %s failed: %s', push_info.remote_ref_string, push_info.summary.strip())
+
+        return not failed
+
+    @staticmethod
+    def sync_mirror(
+            namespace_path: str,
+            temp_name: str,
+            source: GitRemote,
+            target: GitRemote = None,
+            source_refs_hash: Optional[str] = None,
+            target_refs_hash: Optional[str] = None,
+            object_pool: Optional[ObjectPool] = None
+    ) -> SyncResult:
 
         # Check if repository storage group directory exists:
         if not os.path.isdir(namespace_path):
@@ -33,19 +82,124 @@ class Git:
                 repo.remotes.gitlab.push(refspec='master')
                 #repo.git.config('--bool', 'core.bare', 'false')
 
+            sync_result = SyncResult()
         else:
             # Everything else
-            repo.remotes.origin.fetch(force=source.is_force_update, prune=source.is_prune_mirrors)
-            repo.remotes.gitlab.push(
-                mirror=True,
-                force=target.is_force_update,
-                prune=target.is_prune_mirrors
-            )
+            sync_result = SyncResult(source_refs_hash, target_refs_hash)
+
+            # Compare advertised refs with last synced state, ls-remote is much cheaper than fetch negotiation
+            is_git = source.vcs_type == VcsEnum.GIT
+            if is_git:
+                sync_result.source_refs_hash = refs_fingerprint(Git.get_remote_refs(repo, 'origin'))
+
+            before_refs = Git.get_local_refs(repo)
+            if is_git and source_refs_hash and sync_result.source_refs_hash == source_refs_hash:
+                logging.info('Source refs unchanged, skipping fetch')
+                sync_result.is_fetched = False
+                after_refs = before_refs
+            else:
+                if object_pool and is_git:
+                    # Objects already fetched to the shared pool are not downloaded again
+                    object_pool.sync(source.url)
+                    object_pool.attach(project_path)
+                repo.remotes.origin.fetch(force=source.is_force_update, prune=source.is_prune_mirrors)
+                after_refs = Git.get_local_refs(repo)
+
+            if target:
+                local_refs_hash = refs_fingerprint(after_refs, MIRROR_REF_PREFIXES)
+                # Target got everything we had before fetch in last sync
+                is_target_synced = target_refs_hash is not None and \
+                    target_refs_hash == refs_fingerprint(before_refs, MIRROR_REF_PREFIXES)
+
+                if not sync_result.is_fetched and \
+                        is_target_synced and \
+                        refs_fingerprint(Git.get_remote_refs(repo, 'gitlab'), MIRROR_REF_PREFIXES) == target_refs_hash:
+                    logging.info('Target refs unchanged, skipping push')
+                    sync_result.is_pushed = False
+                elif sync_result.is_fetched and is_target_synced:
+                    # Push only refs changed by fetch
+                    refspecs = build_push_refspecs(
+                        before_refs,
+                        after_refs,
+                        target.is_force_update,
+                        target.is_prune_mirrors
+                    )
+                    logging.info('Pushing %s changed refs', len(refspecs))
+                    sync_result.is_pushed = bool(refspecs)
+                    is_push_ok = all([Git.push(repo, refspecs_chunk) for refspecs_chunk in chunk_refspecs(refspecs)])
+                    sync_result.target_refs_hash = local_refs_hash if is_push_ok else None
+                else:
+                    is_push_ok = Git.push(repo, mirror=True, force=target.is_force_update, prune=target.is_prune_mirrors)
+                    sync_result.target_refs_hash = local_refs_hash if is_push_ok else None
+            else:
+                sync_result.is_pushed = False
 
         logging.info('Mirror sync done')
 
+        return sync_result
+
     @staticmethod
-    def create_mirror(namespace_path: str, temp_name: str, source: GitRemote, target: GitRemote=None) -> None:
+    def sync_ref(
+            namespace_path: str,
+            temp_name: str,
+            source: GitRemote,
+            target: GitRemote,
+            ref: str,
+            before: str,
+            after: str,
+            source_refs_hash: Optional[str] = None,
+            target_refs_hash: Optional[str] = None
+    ) -> Optional[SyncResult]:
+        """
+        Syncs single ref update (from push event)
+        :return: None when ref update cannot be applied and full sync is required
+        """
+        project_path = os.path.join(namespace_path, temp_name)
+        if source.vcs_type != VcsEnum.GIT or not ref.startswith(MIRROR_REF_PREFIXES) or not os.path.isdir(project_path):
+            return None
+
+        repo = Repo(project_path)
+        before_refs = Git.get_local_refs(repo)
+        if before_refs.get(ref, ZERO_SHA) != before:
+            logging.info('Local %s is not at %s, ref update cannot be applied', ref, before)
+            return None
+
+        sync_result = SyncResult(source_refs_hash, target_refs_hash)
+        after_refs = dict(before_refs)
+        if after == ZERO_SHA:
+            if not source.is_prune_mirrors:
+                logging.info('Ref %s deleted but prune is disabled, nothing to sync', ref)
+                sync_result.is_fetched = sync_result.is_pushed = False
+                return sync_result
+
+            repo.git.update_ref('-d', ref)
+            del after_refs[ref]
+        else:
+            repo.remotes.origin.fetch(refspec='{}{}:{}'.format('+' if source.is_force_update else '', ref, ref))
+            after_refs = Git.get_local_refs(repo)
+
+        refspecs = build_push_refspecs(before_refs, after_refs, target.is_force_update, target.is_prune_mirrors)
+        sync_result.is_pushed = bool(refspecs)
+        is_push_ok = all([Git.push(repo, refspecs_chunk) for refspecs_chunk in chunk_refspecs(refspecs)])
+
+        # Stored target state stays valid only when target was synced before this update
+        if is_push_ok and target_refs_hash == refs_fingerprint(before_refs, MIRROR_REF_PREFIXES):
+            sync_result.target_refs_hash = refs_fingerprint(after_refs, MIRROR_REF_PREFIXES)
+        else:
+            sync_result.target_refs_hash = None
+
+        logging.info('Ref %s sync done', ref)
+
+        return sync_result
+
+    @staticmethod
+    def create_mirror(
+            namespace_path: str,
+            temp_name: str,
+            source: GitRemote,
+            target: GitRemote = None,
+            object_pool: Optional[ObjectPool] = None
+    ) -> SyncResult:
 
         # 2. Create/pull local repository
 
@@ -73,6 +227,10 @@ class Git:
                     cwd=namespace_path
                 ).communicate()
                 repo = Repo(project_path)
+            elif object_pool and source.vcs_type == VcsEnum.GIT:
+                # Clone only objects missing in shared pool
+                object_pool.sync(source.url)
+                repo = Repo.clone_from(source.url, project_path, mirror=True, reference=object_pool.path)
             else:
                 repo = Repo.clone_from(source.url, project_path, mirror=True)
 
@@ -84,6 +242,8 @@ class Git:
 
                 repo.create_remote('gitlab', target.url)
 
-        Git.sync_mirror(namespace_path, temp_name, source, target)
+        sync_result = Git.sync_mirror(namespace_path, temp_name, source, target, object_pool=object_pool)
 
         logging.info('All done!')
+
+        return sync_result
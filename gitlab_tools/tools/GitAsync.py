@@ -0,0 +1,416 @@
+import os
+import sys
+import asyncio
+import logging
+import threading
+from contextlib import AsyncExitStack
+from typing import Dict, List, Optional, Tuple
+from gitlab_tools.tools.Svn import Svn
+from gitlab_tools.enums.VcsEnum import VcsEnum
+from gitlab_tools.tools.GitRemote import GitRemote
+from gitlab_tools.tools.SyncResult import SyncResult
+from gitlab_tools.tools.ObjectPool import ObjectPool
+from gitlab_tools.tools.helpers import get_upstream_hostname
+from gitlab_tools.tools.refs import parse_refs, refs_fingerprint, build_push_refspecs, chunk_refspecs, \
+    MIRROR_REF_PREFIXES, ZERO_SHA
+
+# Timeout in seconds of single git command by phase
+DEFAULT_TIMEOUTS = {
+    'ls-remote': 60,
+    'fetch': 15 * 60,
+    'push': 15 * 60,
+    'clone': 30 * 60,
+    'local': 5 * 60,
+}
+
+
+class GitAsyncError(Exception):
+    pass
+
+
+class GitAsyncTimeoutError(GitAsyncError):
+    pass
+
+
+class GitAsync:
+    def __init__(self, concurrency: int = 16, host_concurrency: int = 4, timeouts: Optional[Dict[str, int]] = None):
+        """
+        Sync engine driving git by asyncio subprocesses. All syncs of one process run in one shared event loop,
+        so tasks running concurrently in worker process (threads pool) share the concurrency limits
+        :param concurrency: max git network commands running at once in process
+        :param host_concurrency: max git network commands running at once against single host in process
+        :param timeouts: phase => timeout in seconds, overrides DEFAULT_TIMEOUTS
+        """
+        self.concurrency = concurrency
+        self.host_concurrency = host_concurrency
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+
+        # Semaphores are bound to event loop, they are created in the shared loop on first use
+        self._semaphore = None
+        self._host_semaphores = {}
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='GitAsync', daemon=True).start()
+            return self._loop
+
+    def _run_sync(self, coroutine):
+        if sys.version_info < (3, 8):
+            # Child watcher of Python 3.7 cannot wait for subprocesses of loop outside of main thread,
+            # limits apply to single sync only
+            self._semaphore = None
+            self._host_semaphores = {}
+            return asyncio.run(coroutine)
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self._get_loop()).result()
+
+    def _get_semaphores(self, hostname: Optional[str] = None) -> List[asyncio.Semaphore]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        if not hostname:
+            return [self._semaphore]
+
+        host_key = get_upstream_hostname(hostname)
+        if host_key not in self._host_semaphores:
+            self._host_semaphores[host_key] = asyncio.Semaphore(self.host_concurrency)
+
+        # Host slot first, so waiting for busy host does not hold global slot
+        return [self._host_semaphores[host_key], self._semaphore]
+
+    @staticmethod
+    async def _read_stream(stream: asyncio.StreamReader, lines: List[str], log_prefix: str) -> None:
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            line = line.decode('UTF-8', errors='replace').rstrip()
+            lines.append(line)
+            logging.debug('%s: %s', log_prefix, line)
+
+    async def run(
+            self,
+            command: List[str],
+            cwd: str,
+            phase: str = 'local',
+            hostname: Optional[str] = None,
+            check: bool = True
+    ) -> Tuple[int, str, str]:
+        """
+        Runs git command, network phases are limited by global and per host concurrency
+        :param command: command to run
+        :param cwd: working directory
+        :param phase: phase of sync, selects timeout
+        :param hostname: remote host of network phase, None for local commands
+        :param check: raise GitAsyncError on non zero exit code
+        :return: tuple of exit code, stdout and stderr
+        """
+        command_name = ' '.join(command[:2])
+        timeout = self.timeouts[phase]
+        stdout_lines = []
+        stderr_lines = []
+        async with AsyncExitStack() as stack:
+            if phase != 'local':
+                for semaphore in self._get_semaphores(hostname):
+                    await stack.enter_async_context(semaphore)
+
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                cwd=cwd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                # Never wait for credentials on terminal
+                env=dict(os.environ, GIT_TERMINAL_PROMPT='0')
+            )
+            try:
+                await asyncio.wait_for(asyncio.gather(
+                    self._read_stream(process.stdout, stdout_lines, command_name),
+                    self._read_stream(process.stderr, stderr_lines, command_name),
+                    process.wait()
+                ), timeout=timeout)
+            except asyncio.TimeoutError as e:
+                raise GitAsyncTimeoutError('{} timed out after {}s'.format(command_name, timeout)) from e
+            finally:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+
+        if check and process.returncode != 0:
+            raise GitAsyncError('{} failed with exit code {}: {}'.format(
+                command_name,
+                process.returncode,
+                '\n'.join(stderr_lines[-5:])
+            ))
+
+        return process.returncode, '\n'.join(stdout_lines), '\n'.join(stderr_lines)
+
+    async def get_remote_refs_async(self, project_path: str, remote: GitRemote, remote_name: str) -> Dict[str, str]:
+        """
+        Returns refs advertised by remote
+        :param project_path: path to repository
+        :param remote: remote, used for concurrency limits
+        :param remote_name: name of remote
+        :return: dict of refname => sha
+        """
+        _, stdout, _ = await self.run(['git', 'ls-remote', remote_name], project_path, 'ls-remote', remote.hostname)
+        return parse_refs(stdout)
+
+    async def get_local_refs_async(self, project_path: str) -> Dict[str, str]:
+        """
+        Returns refs of local repository
+        :param project_path: path to repository
+        :return: dict of refname => sha
+        """
+        _, stdout, _ = await self.run(['git', 'for-each-ref', '--format=%(objectname) %(refname)'], project_path)
+        return parse_refs(stdout)
+
+    async def push_async(self, project_path: str, target: GitRemote, arguments: List[str]) -> bool:
+        """
+        Pushes to gitlab remote
+        :param project_path: path to repository
+        :param target: target remote
+        :param arguments: git push arguments
+        :return: False when push failed
+        """
+        returncode, _, stderr = await self.run(
+            ['git', 'push', '--porcelain'] + arguments,
+            project_path,
+            'push',
+            target.hostname,
+            check=False
+        )
+        if returncode != 0:
+            logging.warning('Push failed with exit code %s: %s', returncode, stderr)
+
+        return returncode == 0
+
+    async def push_refspecs_async(self, project_path: str, target: GitRemote, refspecs: List[str]) -> bool:
+        results = []
+        for refspecs_chunk in chunk_refspecs(refspecs):
+            results.append(await self.push_async(project_path, target, ['gitlab'] + refspecs_chunk))
+
+        return all(results)
+
+    async def sync_mirror_async(
+            self,
+            namespace_path: str,
+            temp_name: str,
+            source: GitRemote,
+            target: Optional[GitRemote] = None,
+            source_refs_hash: Optional[str] = None,
+            target_refs_hash: Optional[str] = None,
+            object_pool: Optional[ObjectPool] = None
+    ) -> SyncResult:
+
+        # Check if repository storage group directory exists:
+        if not os.path.isdir(namespace_path):
+            raise Exception('Group storage {} not found, creation failed ?'.format(namespace_path))
+
+        # Check if project clone exists
+        project_path = os.path.join(namespace_path, temp_name)
+        if not os.path.isdir(project_path):
+            raise Exception('Repository storage {} not found, creation failed ?'.format(project_path))
+
+        # Special code for SVN repo mirror
+        if source.vcs_type == VcsEnum.SVN:
+            await self.run(['git', 'reset', '--hard'], project_path)
+            await self.run(['git', 'svn', 'fetch'], project_path, 'fetch', source.hostname)
+            await self.run(['git', 'svn', 'rebase'], project_path)
+
+            if target:
+                await self.push_async(project_path, target, ['gitlab', 'master'])
+
+            sync_result = SyncResult()
+        else:
+            # Everything else
+            sync_result = SyncResult(source_refs_hash, target_refs_hash)
+
+            # Compare advertised refs with last synced state, ls-remote is much cheaper than fetch negotiation
+            is_git = source.vcs_type == VcsEnum.GIT
+            if is_git:
+                sync_result.source_refs_hash = refs_fingerprint(
+                    await self.get_remote_refs_async(project_path, source, 'origin')
+                )
+
+            before_refs = await self.get_local_refs_async(project_path)
+            if is_git and source_refs_hash and sync_result.source_refs_hash == source_refs_hash:
+                logging.info('Source refs unchanged, skipping fetch')
+                sync_result.is_fetched = False
+                after_refs = before_refs
+            else:
+                if object_pool and is_git:
+                    # Objects already fetched to the shared pool are not downloaded again
+                    loop = asyncio.get_running_loop()
+                    await loop.run_in_executor(None, object_pool.sync, source.url)
+                    await loop.run_in_executor(None, object_pool.attach, project_path)
+
+                fetch_command = ['git', 'fetch']
+                if source.is_force_update:
+                    fetch_command.append('--force')
+                if source.is_prune_mirrors:
+                    fetch_command.append('--prune')
+                fetch_command.append('origin')
+                await self.run(fetch_command, project_path, 'fetch', source.hostname)
+                after_refs = await self.get_local_refs_async(project_path)
+
+            if target:
+                local_refs_hash = refs_fingerprint(after_refs, MIRROR_REF_PREFIXES)
+                # Target got everything we had before fetch in last sync
+                is_target_synced = target_refs_hash is not None and \
+                    target_refs_hash == refs_fingerprint(before_refs, MIRROR_REF_PREFIXES)
+
+                if not sync_result.is_fetched and \
+                        is_target_synced and \
+                        refs_fingerprint(
+                            await self.get_remote_refs_async(project_path, target, 'gitlab'),
+                            MIRROR_REF_PREFIXES
+                        ) == target_refs_hash:
+                    logging.info('Target refs unchanged, skipping push')
+                    sync_result.is_pushed = False
+                elif sync_result.is_fetched and is_target_synced:
+                    # Push only refs changed by fetch
+                    refspecs = build_push_refspecs(
+                        before_refs,
+                        after_refs,
+                        target.is_force_update,
+                        target.is_prune_mirrors
+                    )
+                    logging.info('Pushing %s changed refs', len(refspecs))
+                    sync_result.is_pushed = bool(refspecs)
+                    is_push_ok = await self.push_refspecs_async(project_path, target, refspecs)
+                    sync_result.target_refs_hash = local_refs_hash if is_push_ok else None
+                else:
+                    push_arguments = ['--mirror']
+                    if target.is_force_update:
+                        push_arguments.append('--force')
+                    push_arguments.append('gitlab')
+                    is_push_ok = await self.push_async(project_path, target, push_arguments)
+                    sync_result.target_refs_hash = local_refs_hash if is_push_ok else None
+            else:
+                sync_result.is_pushed = False
+
+        logging.info('Mirror sync done')
+
+        return sync_result
+
+    async def sync_ref_async(
+            self,
+            namespace_path: str,
+            temp_name: str,
+            source: GitRemote,
+            target: GitRemote,
+            ref: str,
+            before: str,
+            after: str,
+            source_refs_hash: Optional[str] = None,
+            target_refs_hash: Optional[str] = None
+    ) -> Optional[SyncResult]:
+        """
+        Syncs single ref update (from push event)
+        :return: None when ref update cannot be applied and full sync is required
+        """
+        project_path = os.path.join(namespace_path, temp_name)
+        if source.vcs_type != VcsEnum.GIT or not ref.startswith(MIRROR_REF_PREFIXES) or not os.path.isdir(project_path):
+            return None
+
+        before_refs = await self.get_local_refs_async(project_path)
+        if before_refs.get(ref, ZERO_SHA) != before:
+            logging.info('Local %s is not at %s, ref update cannot be applied', ref, before)
+            return None
+
+        sync_result = SyncResult(source_refs_hash, target_refs_hash)
+        after_refs = dict(before_refs)
+        if after == ZERO_SHA:
+            if not source.is_prune_mirrors:
+                logging.info('Ref %s deleted but prune is disabled, nothing to sync', ref)
+                sync_result.is_fetched = sync_result.is_pushed = False
+                return sync_result
+
+            await self.run(['git', 'update-ref', '-d', ref], project_path)
+            del after_refs[ref]
+        else:
+            await self.run(
+                ['git', 'fetch', 'origin', '{}{}:{}'.format('+' if source.is_force_update else '', ref, ref)],
+                project_path,
+                'fetch',
+                source.hostname
+            )
+            after_refs = await self.get_local_refs_async(project_path)
+
+        refspecs = build_push_refspecs(before_refs, after_refs, target.is_force_update, target.is_prune_mirrors)
+        sync_result.is_pushed = bool(refspecs)
+        is_push_ok = await self.push_refspecs_async(project_path, target, refspecs)
+
+        # Stored target state stays valid only when target was synced before this update
+        if is_push_ok and target_refs_hash == refs_fingerprint(before_refs, MIRROR_REF_PREFIXES):
+            sync_result.target_refs_hash = refs_fingerprint(after_refs, MIRROR_REF_PREFIXES)
+        else:
+            sync_result.target_refs_hash = None
+
+        logging.info('Ref %s sync done', ref)
+
+        return sync_result
+
+    async def create_mirror_async(
+            self,
+            namespace_path: str,
+            temp_name: str,
+            source: GitRemote,
+            target: Optional[GitRemote] = None,
+            object_pool: Optional[ObjectPool] = None
+    ) -> SyncResult:
+
+        # Check if project clone exists
+        project_path = os.path.join(namespace_path, temp_name)
+        if os.path.isdir(project_path):
+            # SVN REPO has no origin
+            if source.vcs_type not in [VcsEnum.SVN]:
+                await self.run(['git', 'remote', 'set-url', 'origin', source.url], project_path)
+
+            if target:
+                await self.run(['git', 'remote', 'set-url', 'gitlab', target.url], project_path)
+        else:
+            # Project not found, we can clone
+            logging.info('Creating mirror for %s', source.url)
+
+            if source.vcs_type == VcsEnum.SVN:
+                await self.run(
+                    ['git', 'svn', 'clone', Svn.fix_url(source.url), project_path],
+                    namespace_path,
+                    'clone',
+                    source.hostname
+                )
+            else:
+                clone_command = ['git', 'clone', '--mirror']
+                if object_pool and source.vcs_type == VcsEnum.GIT:
+                    # Clone only objects missing in shared pool
+                    await asyncio.get_running_loop().run_in_executor(None, object_pool.sync, source.url)
+                    clone_command.extend(['--reference', object_pool.path])
+                await self.run(clone_command + [source.url, project_path], namespace_path, 'clone', source.hostname)
+
+                if source.vcs_type in [VcsEnum.BAZAAR, VcsEnum.MERCURIAL]:
+                    await self.run(['git', 'gc', '--aggressive'], project_path, 'clone')
+
+            if target:
+                logging.info('Adding GitLab remote to project.')
+                await self.run(['git', 'remote', 'add', 'gitlab', target.url], project_path)
+
+        sync_result = await self.sync_mirror_async(namespace_path, temp_name, source, target, object_pool=object_pool)
+
+        logging.info('All done!')
+
+        return sync_result
+
+    def sync_mirror(self, *args, **kwargs) -> SyncResult:
+        return self._run_sync(self.sync_mirror_async(*args, **kwargs))
+
+    def sync_ref(self, *args, **kwargs) -> Optional[SyncResult]:
+        return self._run_sync(self.sync_ref_async(*args, **kwargs))
+
+    def create_mirror(self, *args, **kwargs) -> SyncResult:
+        return self._run_sync(self.create_mirror_async(*args, **kwargs))
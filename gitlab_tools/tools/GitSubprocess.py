@@ -1,15 +1,67 @@
 import os
 import subprocess  # nosec: B404
 import logging
-from typing import Optional
+from typing import Dict, List, Optional
 from gitlab_tools.enums.VcsEnum import VcsEnum
 from gitlab_tools.tools.GitRemote import GitRemote
+from gitlab_tools.tools.SyncResult import SyncResult
+from gitlab_tools.tools.ObjectPool import ObjectPool
+from gitlab_tools.tools.refs import parse_refs, refs_fingerprint, build_push_refspecs, chunk_refspecs, \
+    MIRROR_REF_PREFIXES, ZERO_SHA
 
 
 class GitSubprocess:
 
     @staticmethod
-    def sync_mirror(namespace_path: str, temp_name: str, source: GitRemote, target: Optional[GitRemote] = None) -> None:
+    def get_remote_refs(project_path: str, remote_name: str) -> Dict[str, str]:
+        """
+        Returns refs advertised by remote
+        :param project_path: path to repository
+        :param remote_name: name of remote
+        :return: dict of refname => sha
+        """
+        return parse_refs(subprocess.check_output(  # nosec: B607, B603
+            ['git', 'ls-remote', remote_name],
+            cwd=project_path
+        ).decode('UTF-8'))
+
+    @staticmethod
+    def get_local_refs(project_path: str) -> Dict[str, str]:
+        """
+        Returns refs of local repository
+        :param project_path: path to repository
+        :return: dict of refname => sha
+        """
+        return parse_refs(subprocess.check_output(  # nosec: B607, B603
+            ['git', 'for-each-ref', '--format=%(objectname) %(refname)'],
+            cwd=project_path
+        ).decode('UTF-8'))
+
+    @staticmethod
+    def push(project_path: str, push_command: List[str]) -> bool:
+        """
+        Runs push command
+        :param project_path: path to repository
+        :param push_command: git push command
+        :return: False when push failed
+        """
+        process = subprocess.Popen(push_command, cwd=project_path)  # nosec: B607, B603
+        process.communicate()
+        if process.returncode != 0:
+            logging.warning('Push failed with exit code %s', process.returncode)
+
+        return process.returncode == 0
+
+    @staticmethod
+    def sync_mirror(
+            namespace_path: str,
+            temp_name: str,
+            source: GitRemote,
+            target: Optional[GitRemote] = None,
+            source_refs_hash: Optional[str] = None,
+            target_refs_hash: Optional[str] = None,
+            object_pool: Optional[ObjectPool] = None
+    ) -> SyncResult:
 
         # Check if repository storage group directory exists:
         if not os.path.isdir(namespace_path):
@@ -31,6 +83,7 @@ class GitSubprocess:
                 subprocess.Popen(['git', 'push', 'gitlab'], cwd=project_path).communicate()  # nosec: B607, B603
                 # repo.git.config('--bool', 'core.bare', 'false')
 
+            sync_result = SyncResult()
         else:
             # Everything else
             fetch_command = ['git', 'fetch']
@@ -52,13 +105,133 @@ class GitSubprocess:
             #push_command.append('+refs/heads/*:refs/heads/*')
             #push_command.append('+refs/tags/*:refs/tags/*')
 
-            subprocess.Popen(fetch_command, cwd=project_path).communicate()  # nosec: B607, B603
-            subprocess.Popen(push_command, cwd=project_path).communicate()  # nosec: B607, B603
+            sync_result = SyncResult(source_refs_hash, target_refs_hash)
+
+            # Compare advertised refs with last synced state, ls-remote is much cheaper than fetch negotiation
+            is_git = source.vcs_type == VcsEnum.GIT
+            if is_git:
+                sync_result.source_refs_hash = refs_fingerprint(GitSubprocess.get_remote_refs(project_path, 'origin'))
+
+            before_refs = GitSubprocess.get_local_refs(project_path)
+            if is_git and source_refs_hash and sync_result.source_refs_hash == source_refs_hash:
+                logging.info('Source refs unchanged, skipping fetch')
+                sync_result.is_fetched = False
+                after_refs = before_refs
+            else:
+                if object_pool and is_git:
+                    # Objects already fetched to the shared pool are not downloaded again
+                    object_pool.sync(source.url)
+                    object_pool.attach(project_path)
+                # Failed fetch must not leave source_refs_hash stored, next sync would skip the fetch
+                subprocess.check_call(fetch_command, cwd=project_path)  # nosec: B607, B603
+                after_refs = GitSubprocess.get_local_refs(project_path)
+
+            if target:
+                local_refs_hash = refs_fingerprint(after_refs, MIRROR_REF_PREFIXES)
+                # Target got everything we had before fetch in last sync
+                is_target_synced = target_refs_hash is not None and \
+                    target_refs_hash == refs_fingerprint(before_refs, MIRROR_REF_PREFIXES)
+
+                if not sync_result.is_fetched and \
+                        is_target_synced and \
+                        refs_fingerprint(
+                            GitSubprocess.get_remote_refs(project_path, 'gitlab'),
+                            MIRROR_REF_PREFIXES
+                        ) == target_refs_hash:
+                    logging.info('Target refs unchanged, skipping push')
+                    sync_result.is_pushed = False
+                elif sync_result.is_fetched and is_target_synced:
+                    # Push only refs changed by fetch
+                    refspecs = build_push_refspecs(
+                        before_refs,
+                        after_refs,
+                        target.is_force_update,
+                        target.is_prune_mirrors
+                    )
+                    logging.info('Pushing %s changed refs', len(refspecs))
+                    sync_result.is_pushed = bool(refspecs)
+                    is_push_ok = all([
+                        GitSubprocess.push(project_path, ['git', 'push', 'gitlab'] + refspecs_chunk)
+                        for refspecs_chunk in chunk_refspecs(refspecs)
+                    ])
+                    sync_result.target_refs_hash = local_refs_hash if is_push_ok else None
+                else:
+                    is_push_ok = GitSubprocess.push(project_path, push_command)
+                    sync_result.target_refs_hash = local_refs_hash if is_push_ok else None
+            else:
+                sync_result.is_pushed = False
 
         logging.info('Mirror sync done')
 
+        return sync_result
+
     @staticmethod
-    def create_mirror(namespace_path: str, temp_name: str, source: GitRemote, target: Optional[GitRemote] = None) -> None:
+    def sync_ref(
+            namespace_path: str,
+            temp_name: str,
+            source: GitRemote,
+            target: GitRemote,
+            ref: str,
+            before: str,
+            after: str,
+            source_refs_hash: Optional[str] = None,
+            target_refs_hash: Optional[str] = None
+    ) -> Optional[SyncResult]:
+        """
+        Syncs single ref update (from push event)
+        :return: None when ref update cannot be applied and full sync is required
+        """
+        project_path = os.path.join(namespace_path, temp_name)
+        if source.vcs_type != VcsEnum.GIT or not ref.startswith(MIRROR_REF_PREFIXES) or not os.path.isdir(project_path):
+            return None
+
+        before_refs = GitSubprocess.get_local_refs(project_path)
+        if before_refs.get(ref, ZERO_SHA) != before:
+            logging.info('Local %s is not at %s, ref update cannot be applied', ref, before)
+            return None
+
+        sync_result = SyncResult(source_refs_hash, target_refs_hash)
+        after_refs = dict(before_refs)
+        if after == ZERO_SHA:
+            if not source.is_prune_mirrors:
+                logging.info('Ref %s deleted but prune is disabled, nothing to sync', ref)
+                sync_result.is_fetched = sync_result.is_pushed = False
+                return sync_result
+
+            subprocess.check_call(['git', 'update-ref', '-d', ref], cwd=project_path)  # nosec: B607, B603
+            del after_refs[ref]
+        else:
+            subprocess.check_call(  # nosec: B607, B603
+                ['git', 'fetch', 'origin', '{}{}:{}'.format('+' if source.is_force_update else '', ref, ref)],
+                cwd=project_path
+            )
+            after_refs = GitSubprocess.get_local_refs(project_path)
+
+        refspecs = build_push_refspecs(before_refs, after_refs, target.is_force_update, target.is_prune_mirrors)
+        sync_result.is_pushed = bool(refspecs)
+        is_push_ok = all([
+            GitSubprocess.push(project_path, ['git', 'push', 'gitlab'] + refspecs_chunk)
+            for refspecs_chunk in chunk_refspecs(refspecs)
+        ])
+
+        # Stored target state stays valid only when target was synced before this update
+        if is_push_ok and target_refs_hash == refs_fingerprint(before_refs, MIRROR_REF_PREFIXES):
+            sync_result.target_refs_hash = refs_fingerprint(after_refs, MIRROR_REF_PREFIXES)
+        else:
+            sync_result.target_refs_hash = None
+
+        logging.info('Ref %s sync done', ref)
+
+        return sync_result
+
+    @staticmethod
+    def create_mirror(
+            namespace_path: str,
+            temp_name: str,
+            source: GitRemote,
+            target: Optional[GitRemote] = None,
+            object_pool: Optional[ObjectPool] = None
+    ) -> SyncResult:
 
         # 2. Create/pull local repository
 
@@ -86,6 +259,12 @@ class GitSubprocess:
                     ['git', 'svn', 'clone', source.url, project_path],
                     cwd=namespace_path
                 ).communicate()
+            elif object_pool and source.vcs_type == VcsEnum.GIT:
+                # Clone only objects missing in shared pool
+                object_pool.sync(source.url)
+                subprocess.Popen(  # nosec: B607, B603
+                    ['git', 'clone', '--mirror', '--reference', object_pool.path, source.url, project_path]
+                ).communicate()
             else:
                 subprocess.Popen(  # nosec: B607, B603
                     ['git', 'clone', '--mirror', source.url, project_path]
@@ -116,6 +295,8 @@ class GitSubprocess:
                     cwd=project_path
                 ).communicate()
 
-        GitSubprocess.sync_mirror(namespace_path, temp_name, source, target)
+        sync_result = GitSubprocess.sync_mirror(namespace_path, temp_name, source, target, object_pool=object_pool)
 
         logging.info('All done!')
+
+        return sync_result
@@ -65,7 +65,7 @@ class GitUri:
     def url(self) -> str:
         return self.build_url()
 
-    def build_url(self, ignore_default_port: bool = False) -> str:
+    def build_url(self, ignore_default_port: bool = False, git_format: bool = True) -> str:
         hostname_parts = []
         if self.username:
             hostname_parts.append(self.username)
@@ -86,10 +86,26 @@ class GitUri:
         return '{}://{}{}{}{}'.format(
             self.scheme,
             ''.join(hostname_parts),
-            ':' if self.protocol == ProtocolEnum.SSH or port else '',
+            ':' if (git_format and self.protocol == ProtocolEnum.SSH) or port else '',
             port,
             self.path
         )
 
+    @property
+    def normalized_url(self) -> str:
+        """
+        URL used to compare identity of repositories, hostname is lowercased,
+        default port with its separator and trailing slash or .git suffix are removed
+        :return: str
+        """
+        path = self.path.rstrip('/')
+        if path.endswith('.git'):
+            path = path[:-len('.git')]
+
+        normalized = GitUri(self.url)
+        normalized.hostname = self.hostname.lower() if self.hostname else self.hostname
+        normalized.path = path
+        return normalized.build_url(ignore_default_port=True, git_format=False)
+
     def __str__(self) -> str:
         return self.url
@@ -0,0 +1,183 @@
+import os
+import time
+import shutil
+import subprocess  # nosec: B404
+import logging
+from typing import Dict, List
+
+# Pool tracks only branches and tags of its source
+POOL_FETCH_REFSPECS = ('+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*')
+
+# Namespace in pool holding refs of repositories using the pool, keeps their objects reachable on gc
+MEMBER_REFS_PREFIX = 'refs/members/'
+
+
+class ObjectPool:
+    def __init__(self, path: str, fetch_interval: int = 0):
+        """
+        Bare repository holding objects shared by mirrors of the same source (git alternates)
+        :param path: path to pool repository
+        :param fetch_interval: pool is not fetched again when last fetch is younger than this (seconds)
+        """
+        self.path = path
+        self.fetch_interval = fetch_interval
+
+    @staticmethod
+    def _run(command: List[str], cwd: str) -> bool:
+        process = subprocess.Popen(command, cwd=cwd)  # nosec: B607, B603
+        process.communicate()
+        if process.returncode != 0:
+            logging.warning('%s failed with exit code %s', ' '.join(command[:2]), process.returncode)
+
+        return process.returncode == 0
+
+    @staticmethod
+    def get_objects_path(repository_path: str) -> str:
+        """
+        Returns path to object storage of bare or non bare repository
+        :param repository_path: path to repository
+        :return: str
+        """
+        git_dir = os.path.join(repository_path, '.git')
+        return os.path.join(git_dir if os.path.isdir(git_dir) else repository_path, 'objects')
+
+    @staticmethod
+    def get_alternates(repository_path: str) -> List[str]:
+        """
+        Returns object storages used by repository as alternates
+        :param repository_path: path to repository
+        :return: list of real paths
+        """
+        alternates_path = os.path.join(ObjectPool.get_objects_path(repository_path), 'info', 'alternates')
+        if not os.path.isfile(alternates_path):
+            return []
+
+        with open(alternates_path) as alternates_file:
+            return [
+                os.path.realpath(line.strip())
+                for line in alternates_file
+                if line.strip() and not line.startswith('#')
+            ]
+
+    @property
+    def objects_path(self) -> str:
+        return os.path.realpath(self.get_objects_path(self.path))
+
+    @property
+    def idle_time(self) -> float:
+        """
+        Seconds since pool was last fetched
+        :return: float
+        """
+        fetch_head_path = os.path.join(self.path, 'FETCH_HEAD')
+        last_used = os.path.getmtime(fetch_head_path if os.path.isfile(fetch_head_path) else self.path)
+        return time.time() - last_used
+
+    def create(self, url: str) -> None:
+        """
+        Creates pool repository for source url when it does not exist yet
+        :param url: source url
+        """
+        if os.path.isdir(self.path):
+            return
+
+        logging.info('Creating object pool for %s', url)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        # Pool is prepared aside and renamed, so concurrent creation cannot leave half configured pool
+        temp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        self._run(['git', 'init', '--quiet', '--bare', temp_path], os.path.dirname(self.path))
+        for command in [
+            # Objects must never be pruned by auto gc, only by gc() that knows about all members
+            ['git', 'config', 'gc.auto', '0'],
+            ['git', 'config', 'core.logAllRefUpdates', 'false'],
+            ['git', 'config', 'remote.origin.url', url],
+            ['git', 'config', 'remote.origin.fetch', POOL_FETCH_REFSPECS[0]],
+            ['git', 'config', '--add', 'remote.origin.fetch', POOL_FETCH_REFSPECS[1]],
+        ]:
+            self._run(command, temp_path)
+
+        try:
+            os.rename(temp_path, self.path)
+        except OSError:
+            # Created by someone else in the mean time
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+    def fetch(self) -> bool:
+        """
+        Fetches source into pool, skipped when pool was fetched recently
+        :return: False when fetch failed
+        """
+        if self.fetch_interval and self.idle_time < self.fetch_interval:
+            logging.info('Object pool %s fetched recently, skipping fetch', self.path)
+            return True
+
+        return self._run(['git', 'fetch', '--quiet', '--prune', 'origin'], self.path)
+
+    def sync(self, url: str) -> bool:
+        """
+        Creates pool if needed and fetches it from source
+        :param url: source url
+        :return: False when fetch failed
+        """
+        self.create(url)
+        return self.fetch()
+
+    def attach(self, repository_path: str) -> bool:
+        """
+        Adds pool to repository alternates and drops objects duplicated in pool from repository
+        :param repository_path: path to repository
+        :return: True when pool was newly attached
+        """
+        if self.objects_path in self.get_alternates(repository_path):
+            return False
+
+        logging.info('Attaching object pool %s to %s', self.path, repository_path)
+        info_path = os.path.join(self.get_objects_path(repository_path), 'info')
+        os.makedirs(info_path, exist_ok=True)
+        with open(os.path.join(info_path, 'alternates'), 'a') as alternates_file:
+            alternates_file.write('{}\n'.format(self.objects_path))
+
+        # -l omits objects available from alternates
+        self._run(['git', 'repack', '-a', '-d', '-l', '-q'], repository_path)
+
+        return True
+
+    def gc(self, members: Dict[str, str], prune_expire: str = '2.weeks.ago') -> bool:
+        """
+        Garbage collects pool while keeping objects reachable from refs of any member repository
+        :param members: dict of member key => path to member repository
+        :param prune_expire: unreachable objects younger than this are kept
+        :return: False when gc was not done
+        """
+        member_refs = subprocess.check_output(  # nosec: B607, B603
+            ['git', 'for-each-ref', '--format=%(refname)', MEMBER_REFS_PREFIX],
+            cwd=self.path
+        ).decode('UTF-8').split()
+
+        # Refs of repositories no longer using this pool
+        stale_refs = [
+            refname for refname in member_refs
+            if refname[len(MEMBER_REFS_PREFIX):].split('/', 1)[0] not in members
+        ]
+        if stale_refs:
+            subprocess.run(  # nosec: B607, B603
+                ['git', 'update-ref', '--stdin'],
+                input=''.join('delete {}\n'.format(refname) for refname in stale_refs).encode('UTF-8'),
+                cwd=self.path,
+                check=True
+            )
+
+        for member_key, member_path in members.items():
+            is_fetched = self._run([
+                'git', 'fetch', '--quiet', '--prune', '--no-tags', '--no-write-fetch-head',
+                member_path,
+                '+refs/*:{}{}/*'.format(MEMBER_REFS_PREFIX, member_key)
+            ], self.path)
+
+            if not is_fetched:
+                # Without refs of all members we cannot tell which objects are still in use
+                logging.warning('Failed to fetch refs of %s, skipping gc of object pool %s', member_path, self.path)
+                return False
+
+        return self._run(['git', 'gc', '--quiet', '--prune={}'.format(prune_expire)], self.path)
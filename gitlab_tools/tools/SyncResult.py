@@ -0,0 +1,30 @@
+from typing import Optional
+
+
+class SyncResult:
+    def __init__(
+            self,
+            source_refs_hash: Optional[str] = None,
+            target_refs_hash: Optional[str] = None,
+            is_fetched: bool = True,
+            is_pushed: bool = True
+    ):
+        """
+        Outcome of mirror sync
+        :param source_refs_hash: fingerprint of refs advertised by source
+        :param target_refs_hash: fingerprint of mirrored refs known to be on target
+        :param is_fetched: was source fetched
+        :param is_pushed: was target pushed
+        """
+        self.source_refs_hash = source_refs_hash
+        self.target_refs_hash = target_refs_hash
+        self.is_fetched = is_fetched
+        self.is_pushed = is_pushed
+
+    @property
+    def is_unchanged(self) -> bool:
+        """
+        Nothing was fetched nor pushed, source and target were already in sync
+        :return: bool
+        """
+        return not self.is_fetched and not self.is_pushed
@@ -1,11 +1,35 @@
-from typing import Callable, Optional
+import datetime
+from functools import wraps
+from typing import Callable, List, Optional, Tuple, Type
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from celery import states
 from celery.result import AsyncResult
+from celery.exceptions import Retry
+from flask import current_app
+from flask_celery import single_instance
+from flask_celery.exceptions import OtherInstanceError
 from gitlab_tools.models.gitlab_tools import Mirror, PullMirror, PushMirror, TaskResult
 from gitlab_tools.extensions import db
 from gitlab_tools.models.celery import TaskMeta
 from gitlab_tools.enums.InvokedByEnum import InvokedByEnum
 
+# Task states meaning task is queued or running
+ACTIVE_STATES = (states.PENDING, states.RECEIVED, states.STARTED, states.RETRY)
+
+# Task states meaning task body runs, it may be past the fetch already
+STARTED_STATES = (states.STARTED, )
+
+# Max length of Mirror.last_error_summary
+ERROR_SUMMARY_LENGTH = 255
+
+# Dialects supporting INSERT ... ON CONFLICT
+UPSERT_INSERTS = {
+    'postgresql': postgresql_insert,
+    'sqlite': sqlite_insert,
+}
+
 
 def log_task_pending(
         task: AsyncResult,
@@ -42,3 +66,317 @@ def log_task_pending(
     db.session.commit()
 
     return task_result
+
+
+def log_tasks_pending(
+        tasks: List[Tuple[AsyncResult, Mirror]],
+        task_callable: Optional[Callable] = None,
+        invoked_by: int = InvokedByEnum.UNKNOWN
+) -> None:
+    """
+    Same as log_task_pending for many tasks, in one transaction with bulk upserts
+    :param tasks: list of (task, mirror)
+    :param task_callable: task
+    :param invoked_by: InvokedByEnum
+    """
+    if not tasks:
+        return
+
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name not in UPSERT_INSERTS:
+        for task, mirror in tasks:
+            log_task_pending(task, mirror, task_callable, invoked_by)
+        return
+
+    insert = UPSERT_INSERTS[dialect_name]
+    task_ids = [task.id for task, _ in tasks]
+    task_meta_table = TaskMeta.__table__
+
+    # Result of fast task may be already stored by celery
+    task_meta_insert = insert(task_meta_table).values([{'task_id': task_id} for task_id in task_ids])
+    if dialect_name == 'postgresql':
+        # No-op update makes RETURNING include existing rows, saves a select
+        taskmeta_ids = dict(db.session.execute(
+            task_meta_insert.on_conflict_do_update(
+                index_elements=['task_id'],
+                set_={'task_id': task_meta_insert.excluded.task_id}
+            ).returning(task_meta_table.c.task_id, task_meta_table.c.id)
+        ).all())
+    else:
+        db.session.execute(task_meta_insert.on_conflict_do_nothing(index_elements=['task_id']))
+        taskmeta_ids = dict(
+            db.session.query(TaskMeta.task_id, TaskMeta.id).filter(TaskMeta.task_id.in_(task_ids)).all()
+        )
+
+    db.session.execute(insert(TaskResult.__table__).values([
+        {
+            'taskmeta_id': taskmeta_ids[task.id],
+            'task_name': task_callable.__name__ if task_callable else None,
+            'invoked_by': invoked_by,
+            'pull_mirror_id': mirror.id if isinstance(mirror, PullMirror) else None,
+            'push_mirror_id': mirror.id if isinstance(mirror, PushMirror) else None,
+        }
+        for task, mirror in tasks
+    ]).on_conflict_do_nothing(index_elements=['taskmeta_id']))
+    db.session.commit()
+
+
+def get_active_task_results_query(task_callable: Callable):
+    """
+    Returns query of queued or running tasks
+    :param task_callable: task to look for
+    :return: TaskResult query
+    """
+    # Tasks lost by broker/worker stay PENDING forever, ignore them after timeout
+    active_since = datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=current_app.config['SYNC_COALESCE_TIMEOUT']
+    )
+
+    # Result backend clears date_done of STARTED and RETRY tasks, age is taken from task result
+    return TaskResult.query.join(TaskMeta).filter(
+        TaskResult.task_name == task_callable.__name__,
+        TaskMeta.status.in_(ACTIVE_STATES),
+        TaskResult.created >= active_since
+    )
+
+
+def find_active_task_result(mirror: Mirror, task_callable: Callable) -> Optional[TaskResult]:
+    """
+    Finds queued or running task of mirror
+    :param mirror: Mirror
+    :param task_callable: task to look for
+    :return: TaskResult or None
+    """
+    query = get_active_task_results_query(task_callable)
+    if isinstance(mirror, PullMirror):
+        query = query.filter(TaskResult.pull_mirror_id == mirror.id)
+    else:
+        query = query.filter(TaskResult.push_mirror_id == mirror.id)
+
+    return query.order_by(TaskResult.id.desc()).first()
+
+
+def format_error_summary(exc) -> Optional[str]:
+    """
+    Formats short one line summary of task failure
+    :param exc: exception raised by task
+    :return: str
+    """
+    if exc is None:
+        return None
+    summary = '{}: {}'.format(type(exc).__name__, exc).splitlines()[0] if str(exc) else type(exc).__name__
+    return summary[:ERROR_SUMMARY_LENGTH]
+
+
+def update_mirror_status(mirror_class: Type[Mirror], mirror_id: int, status: str, result, duration: float) -> None:
+    """
+    Stores outcome of finished sync on mirror
+    :param mirror_class: PullMirror or PushMirror
+    :param mirror_id: mirror id
+    :param status: celery state
+    :param result: return value or exception of task
+    :param duration: seconds
+    """
+    values = {
+        mirror_class.last_status: status,
+        mirror_class.last_duration_ms: int(duration * 1000),
+    }
+    if status == states.SUCCESS:
+        values[mirror_class.last_success_at] = datetime.datetime.now()
+        values[mirror_class.last_error_summary] = None
+    else:
+        values[mirror_class.last_error_summary] = format_error_summary(result)
+
+    # Failed task may leave transaction broken
+    db.session.rollback()
+    mirror_class.query.filter_by(id=mirror_id).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+def lock_mirrors(mirror_class: Type[Mirror], mirror_ids: List[int]) -> None:
+    """
+    Locks rows of mirrors till end of transaction, coalescing triggers and finishing task
+    serialize on this lock, so no trigger is coalesced into task that already checked for follow-up
+    :param mirror_class: PullMirror or PushMirror
+    :param mirror_ids: ids of mirrors
+    """
+    db.session.query(mirror_class.id).filter(
+        mirror_class.id.in_(mirror_ids)
+    ).order_by(mirror_class.id).with_for_update().all()
+
+
+def coalesce_task_pending(
+        mirror: Mirror,
+        task_callable: Callable,
+        invoked_by: int = InvokedByEnum.UNKNOWN,
+        is_queued_partial: bool = False
+) -> Optional[TaskResult]:
+    """
+    Coalesces sync trigger into task that is already queued or running for mirror
+    When None is returned mirror stays locked till new task is logged by log_tasks_pending
+    :param mirror: Mirror
+    :param task_callable: sync task
+    :param invoked_by: InvokedByEnum
+    :param is_queued_partial: queued task may sync only part of mirror (single ref), it must learn about the trigger,
+        see claim_sync_request
+    :return: TaskResult of active task or None when new task should be scheduled
+    """
+    lock_mirrors(type(mirror), [mirror.id])
+    task_result = find_active_task_result(mirror, task_callable)
+    if not task_result:
+        return None
+
+    TaskResult.query.filter_by(id=task_result.id).update(
+        {TaskResult.coalesced_count: db.func.coalesce(TaskResult.coalesced_count, 0) + 1},
+        synchronize_session=False
+    )
+
+    # Running task may already be past the fetch, request one follow-up sync, queued task fetches our change itself
+    if is_queued_partial or task_result.taskmeta.status in STARTED_STATES:
+        mirror.sync_requested_by = invoked_by
+        db.session.add(mirror)
+    db.session.commit()
+
+    return task_result
+
+
+def coalesce_tasks_pending(
+        mirrors: List[Mirror],
+        task_callable: Callable,
+        invoked_by: int = InvokedByEnum.UNKNOWN
+) -> List[Mirror]:
+    """
+    Same as coalesce_task_pending for many mirrors of the same type in one transaction
+    :param mirrors: list of PullMirror or list of PushMirror
+    :param task_callable: sync task
+    :param invoked_by: InvokedByEnum
+    :return: mirrors new task should be scheduled for
+    """
+    if not mirrors:
+        return []
+
+    mirror_class = type(mirrors[0])
+    mirror_id_column = TaskResult.pull_mirror_id if isinstance(mirrors[0], PullMirror) else TaskResult.push_mirror_id
+    lock_mirrors(mirror_class, [mirror.id for mirror in mirrors])
+    active_task_result_ids = dict(
+        get_active_task_results_query(task_callable).filter(
+            mirror_id_column.in_([mirror.id for mirror in mirrors])
+        ).group_by(mirror_id_column).with_entities(mirror_id_column, db.func.max(TaskResult.id)).all()
+    )
+    if not active_task_result_ids:
+        return mirrors
+
+    TaskResult.query.filter(TaskResult.id.in_(active_task_result_ids.values())).update(
+        {TaskResult.coalesced_count: db.func.coalesce(TaskResult.coalesced_count, 0) + 1},
+        synchronize_session=False
+    )
+    started_mirror_ids = [
+        mirror_id for mirror_id, in TaskResult.query.join(TaskMeta).filter(
+            TaskResult.id.in_(active_task_result_ids.values()),
+            TaskMeta.status.in_(STARTED_STATES)
+        ).with_entities(mirror_id_column)
+    ]
+    if started_mirror_ids:
+        mirror_class.query.filter(mirror_class.id.in_(started_mirror_ids)).update(
+            {mirror_class.sync_requested_by: invoked_by},
+            synchronize_session=False
+        )
+    db.session.commit()
+
+    return [mirror for mirror in mirrors if mirror.id not in active_task_result_ids]
+
+
+def claim_sync_request(mirror_class: Type[Mirror], mirror_id: int) -> bool:
+    """
+    Clears sync requested before sync of mirror started, the starting sync covers it
+    :param mirror_class: PullMirror or PushMirror
+    :param mirror_id: mirror id
+    :return: True when sync was requested, partial sync must become full one
+    """
+    lock_mirrors(mirror_class, [mirror_id])
+    claimed = mirror_class.query.filter(
+        mirror_class.id == mirror_id,
+        mirror_class.sync_requested_by.isnot(None)
+    ).update({mirror_class.sync_requested_by: None}, synchronize_session=False)
+    db.session.commit()
+    return bool(claimed)
+
+
+def schedule_coalesced_sync(mirror_class: Type[Mirror], mirror_id: int, task_callable: Callable, task_id: Optional[str],
+                            state: str) -> None:
+    """
+    Finishes task for coalescing and schedules one follow-up sync when triggers were coalesced while mirror was syncing
+    :param mirror_class: PullMirror or PushMirror
+    :param mirror_id: mirror id
+    :param task_callable: sync task
+    :param task_id: id of finishing task
+    :param state: final state of finishing task
+    :return: None
+    """
+    # Task may have failed in the middle of transaction
+    db.session.rollback()
+
+    lock_mirrors(mirror_class, [mirror_id])
+    mirror = mirror_class.query.filter_by(id=mirror_id).populate_existing().first()
+    if not mirror:
+        db.session.commit()
+        return
+
+    # Result backend stores the state only after task returns, trigger coming in between must not be coalesced
+    if task_id:
+        TaskMeta.query.filter(TaskMeta.task_id == task_id, TaskMeta.status.in_(ACTIVE_STATES)).update(
+            {TaskMeta.status: state},
+            synchronize_session=False
+        )
+
+    invoked_by = mirror.sync_requested_by
+    if invoked_by is None:
+        db.session.commit()
+        return
+
+    mirror.sync_requested_by = None
+    db.session.add(mirror)
+    task = task_callable.delay(mirror.id)
+    # Commits everything at once, mirror is unlocked with follow-up task already logged
+    log_tasks_pending([(task, mirror)], task_callable, invoked_by)
+
+
+def single_instance_per_mirror(func: Callable) -> Callable:
+    """
+    Celery task decorator, same as @single_instance(include_args=True) but only mirror id is part of lock key,
+    so syncs of one mirror with different extra arguments (eg. ref update) never run in the same working copy at once
+    :param func: task function taking mirror id as first argument
+    :return: wrapped task function
+    """
+    @wraps(func)
+    def wrapped(celery_self, mirror_id: int, *args, **kwargs):
+        @single_instance(include_args=True)
+        def locked(_celery_self, _mirror_id: int):
+            return func(celery_self, mirror_id, *args, **kwargs)
+        return locked(celery_self, mirror_id)
+    return wrapped
+
+
+def coalesced_sync(mirror_class: Type[Mirror]) -> Callable:
+    """
+    Celery task decorator, runs one follow-up sync when triggers were coalesced while the task was queued or running.
+    Use above @single_instance so follow-up is scheduled after the lock is released.
+    :param mirror_class: PullMirror or PushMirror
+    :return: decorator
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapped(celery_self, mirror_id: int, *args, **kwargs):
+            try:
+                result = func(celery_self, mirror_id, *args, **kwargs)
+            except (OtherInstanceError, Retry):
+                # Running or requeued instance takes care of follow-up
+                raise
+            except Exception:
+                schedule_coalesced_sync(mirror_class, mirror_id, celery_self, celery_self.request.id, states.FAILURE)
+                raise
+
+            schedule_coalesced_sync(mirror_class, mirror_id, celery_self, celery_self.request.id, states.SUCCESS)
+            return result
+        return wrapped
+    return decorator
@@ -0,0 +1,81 @@
+import re
+import zlib
+
+# Hashed value ("H") is supported in these fields, field index => (min, max)
+HASHED_FIELDS_RANGES = {
+    0: (0, 59),  # minute
+    1: (0, 23),  # hour
+}
+
+HASHED_VALUE_REGEX = re.compile(r'^H(\((?P<start>\d+)-(?P<end>\d+)\))?(/(?P<step>\d+))?$')
+
+
+def get_hash(seed: str) -> int:
+    """
+    Returns stable hash of seed, python hash() is randomized per process
+    :param seed: seed
+    :return: int
+    """
+    return zlib.crc32(seed.encode('UTF-8'))
+
+
+def expand_hashed_value(value: str, seed: str, value_min: int, value_max: int) -> str:
+    """
+    Expands hashed value of single cron field
+    H => one value in range, H(a-b) => one value in a-b, H/n and H(a-b)/n => every n with hashed start
+    :param value: field value
+    :param seed: seed of hash, same seed gives same value
+    :param value_min: min value of field
+    :param value_max: max value of field
+    :return: expanded value
+    """
+    match = HASHED_VALUE_REGEX.match(value)
+    if not match:
+        return value
+
+    start = int(match.group('start')) if match.group('start') else value_min
+    end = int(match.group('end')) if match.group('end') else value_max
+    if not value_min <= start <= end <= value_max:
+        raise ValueError('Hashed range {} out of {}-{}'.format(value, value_min, value_max))
+
+    step = int(match.group('step')) if match.group('step') else None
+    if step is None:
+        return str(start + get_hash(seed) % (end - start + 1))
+
+    if step < 1:
+        raise ValueError('Hashed step {} must be positive'.format(value))
+
+    offset = start + get_hash(seed) % min(step, end - start + 1)
+    return '{}-{}/{}'.format(offset, end, step)
+
+
+def expand_hashed_cron(expression: str, seed: str) -> str:
+    """
+    Replaces hashed values ("H") in minute and hour fields of cron expression with values derived from seed,
+    so schedules with same expression are spread evenly in time instead of firing at once
+    :param expression: cron expression
+    :param seed: seed of hash, eg. mirror id
+    :return: cron expression without hashed values
+    """
+    fields = expression.split()
+    for index, (value_min, value_max) in HASHED_FIELDS_RANGES.items():
+        if index < len(fields):
+            fields[index] = ','.join(
+                expand_hashed_value(value, '{}:{}'.format(seed, index), value_min, value_max)
+                for value in fields[index].split(',')
+            )
+
+    return ' '.join(fields)
+
+
+def get_jitter_offset(seed: str, window: int) -> int:
+    """
+    Returns deterministic offset of seed within window
+    :param seed: seed of hash, eg. schedule name
+    :param window: window size in seconds
+    :return: offset in seconds
+    """
+    if window <= 0:
+        return 0
+
+    return get_hash(seed) % window
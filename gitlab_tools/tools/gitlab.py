@@ -1,6 +1,27 @@
+import os
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Optional
+import flask
 import gitlab
+import requests
+from requests.adapters import HTTPAdapter
 from flask import current_app
 from flask_login import current_user
+from gitlab_tools.models.gitlab_tools import User
+from gitlab_tools.extensions import db
+from gitlab_tools.tools.gitlab_cache import cached, is_deploy_key_enabled, set_deploy_key_enabled
+from gitlab_tools.tools.gitlab_rate_limit import RateLimitedSession
+
+# Access token is refreshed this long before it expires
+TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=1)
+
+_http_session = None
+_http_session_pid = None
+_clients = OrderedDict()  # type: OrderedDict
+_clients_lock = threading.Lock()
 
 
 class VisibilityError(Exception):
@@ -13,36 +34,181 @@ def check_project_visibility_in_group(project_visibility: str, group_id: int) ->
         'internal': 2,
         'public': 3
     }
-    group = get_group(group_id)
-    if visibility_to_int.get(project_visibility) > visibility_to_int.get(group.visibility):
+    group = get_group_attributes(group_id)
+    if visibility_to_int.get(project_visibility) > visibility_to_int.get(group['visibility']):
         raise VisibilityError(
             'Project visibility is less restrictive than its group {} > {}'.format(
                 project_visibility,
-                group.visibility
+                group['visibility']
             )
         )
 
 
-def check_project_exists(project_name: str, group_id: int, ignore_project_id: int=None):
-    gl = get_gitlab_instance()
-    found_projects = gl.projects.list(search=project_name)
-    for found_project in found_projects:
-        if ignore_project_id and ignore_project_id == found_project.id:
-            continue
+def check_project_exists(project_name: str, group_id: int, ignore_project_id: int=None) -> bool:
+    return cached(
+        current_user.id,
+        'project_exists.{}.{}.{}'.format(group_id, ignore_project_id, project_name),
+        lambda: find_project_exists(project_name, group_id, ignore_project_id)
+    )
 
-        if project_name in [found_project.name, found_project.path] and group_id == int(found_project.namespace['id']):
-            return True
-    return False
+
+def find_project_exists(project_name: str, group_id: int, ignore_project_id: int=None) -> bool:
+    gl = get_gitlab_instance()
+    return find_project_in_namespace(gl, current_user.id, group_id, project_name, ignore_project_id) is not None
 
 
-def get_gitlab_instance() -> gitlab.Gitlab:
-    gl = gitlab.Gitlab(
-        current_app.config['GITLAB_URL'],
-        oauth_token=current_user.access_token,
-        api_version=current_app.config['GITLAB_API_VERSION']
+def get_namespace_path(gl: gitlab.Gitlab, user_id: int, namespace_id: int) -> str:
+    """
+    Returns full path of group, paths rarely change so they are cached longer
+    :param gl: GitLab client of user
+    :param user_id: id of user
+    :param namespace_id: id of group
+    :return: full path, eg. parent/group
+    """
+    return cached(
+        user_id,
+        'namespace_path.{}'.format(namespace_id),
+        lambda: gl.groups.get(namespace_id).full_path,
+        current_app.config['GITLAB_NAMESPACE_CACHE_TTL']
     )
 
-    gl.auth()
+
+def find_project_in_namespace(gl: gitlab.Gitlab, user_id: int, namespace_id: int, project_name: str,
+                              ignore_project_id: int=None) -> Optional[int]:
+    """
+    Finds project with name or path in group without listing projects of whole instance
+    :param gl: GitLab client of user
+    :param user_id: id of user
+    :param namespace_id: id of group
+    :param project_name: name or path of project
+    :param ignore_project_id: project with this id is not reported
+    :return: id of project or None when not found
+    """
+    try:
+        project = gl.projects.get('{}/{}'.format(get_namespace_path(gl, user_id, namespace_id), project_name))
+        if project.id != ignore_project_id:
+            return project.id
+    except gitlab.exceptions.GitlabGetError as e:
+        if e.response_code != 404:
+            raise
+
+    # Name of project may differ from its path
+    group = gl.groups.get(namespace_id, lazy=True)
+    # Search in big group has more pages, generator fetches them lazily till project is found
+    for found_project in group.projects.list(search=project_name, simple=True, as_list=False):
+        if found_project.id != ignore_project_id and project_name in [found_project.name, found_project.path]:
+            return found_project.id
+    return None
+
+
+def get_http_session() -> requests.Session:
+    """
+    Returns keep-alive session shared by all GitLab clients of this process
+    :return: requests.Session
+    """
+    global _http_session, _http_session_pid  # pylint: disable=global-statement
+    # Connections must not be shared with forked worker processes
+    if _http_session is None or _http_session_pid != os.getpid():
+        # Cached clients hold the old session
+        _clients.clear()
+        pool_size = current_app.config['GITLAB_HTTP_POOL_SIZE']
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        _http_session = RateLimitedSession()
+        _http_session.mount('http://', adapter)
+        _http_session.mount('https://', adapter)
+        _http_session_pid = os.getpid()
+    return _http_session
+
+
+def get_token_expires(response_data: dict) -> Optional[datetime.datetime]:
+    """
+    Returns expiration of access token from OAuth token response
+    :param response_data: token response
+    :return: None when token does not expire
+    """
+    if not response_data.get('expires_in'):
+        return None
+    return datetime.datetime.fromtimestamp(response_data['created_at'] + response_data['expires_in'])
+
+
+def is_access_token_expired(user: User) -> bool:
+    """
+    Checks if access token of user is expired or about to expire and can be refreshed
+    :param user: User
+    :return: bool
+    """
+    if not user.refresh_token or not user.expires:
+        return False
+    return user.expires - TOKEN_REFRESH_MARGIN <= datetime.datetime.now()
+
+
+def refresh_access_token(user: User) -> User:
+    """
+    Replaces expired access token of user by new one using refresh token
+    :param user: User
+    :return: User with current access token
+    """
+    # Refresh token can be used only once, concurrent refresh waits for lock and finds token refreshed
+    user = User.query.filter_by(id=user.id).with_for_update().populate_existing().one()
+    if not is_access_token_expired(user):
+        db.session.commit()
+        return user
+
+    data = {
+        'client_id': current_app.config['GITLAB_APP_ID'],
+        'client_secret': current_app.config['GITLAB_APP_SECRET'],
+        'refresh_token': user.refresh_token,
+        'grant_type': 'refresh_token'
+    }
+    if flask.has_request_context():
+        data['redirect_uri'] = flask.url_for('sign_index.do_login', _external=True)
+
+    try:
+        r = get_http_session().post(os.path.join(current_app.config['GITLAB_URL'], 'oauth', 'token'), data)
+        r.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        db.session.rollback()
+        # Current access token is used, GitLab rejects it when it is really expired
+        logging.warning('Failed to refresh access token of user %s: %s', user.id, e)
+        return user
+
+    response_data = r.json()
+    user.access_token = response_data['access_token']
+    user.refresh_token = response_data['refresh_token']
+    user.expires = get_token_expires(response_data)
+    db.session.commit()
+    return user
+
+
+def get_gitlab_instance(user: Optional[User] = None) -> gitlab.Gitlab:
+    """
+    Returns GitLab client of user, clients are cached per user and share keep-alive connection pool
+    Authentication is lazy, invalid token is reported by first API call
+    :param user: User, current_user when not set
+    :return: gitlab.Gitlab
+    """
+    if user is None:
+        user = current_user
+
+    if is_access_token_expired(user):
+        user = refresh_access_token(user)
+
+    with _clients_lock:
+        session = get_http_session()
+        gl = _clients.get(user.id)
+        if gl and gl.oauth_token == user.access_token:
+            _clients.move_to_end(user.id)
+            return gl
+
+        gl = gitlab.Gitlab(
+            current_app.config['GITLAB_URL'],
+            oauth_token=user.access_token,
+            api_version=current_app.config['GITLAB_API_VERSION'],
+            session=session
+        )
+        _clients[user.id] = gl
+        while len(_clients) > current_app.config['GITLAB_CLIENT_CACHE_SIZE']:
+            _clients.popitem(last=False)
 
     return gl
 
@@ -55,3 +221,106 @@ def get_group(group_id: int):
 def get_project(project_id: int):
     gl = get_gitlab_instance()
     return gl.projects.get(project_id)
+
+
+def get_group_attributes(group_id: int) -> dict:
+    return cached(current_user.id, 'group.{}'.format(group_id), lambda: get_group(group_id).attributes)
+
+
+def get_project_attributes(project_id: int) -> dict:
+    return cached(current_user.id, 'project.{}'.format(project_id), lambda: get_project(project_id).attributes)
+
+
+def get_list_page(manager, q: str, page: Optional[str] = None, per_page: Optional[str] = None) -> dict:
+    """
+    Returns one page of GitLab objects matching search
+    :param manager: gl.groups or gl.projects
+    :param q: search query
+    :param page: page number
+    :param per_page: items per page
+    :return: dict with items and pagination
+    """
+    params = {
+        'search': q,
+        'as_list': False
+    }
+
+    if per_page:
+        params['per_page'] = per_page
+
+    if page:
+        params['page'] = page
+
+    items_list = manager.list(**params)
+
+    return {
+        'items': [i.attributes for i in items_list],
+        'current_page': items_list.current_page,
+        'prev_page': items_list.prev_page,
+        'next_page': items_list.next_page,
+        'per_page': items_list.per_page,
+        'total_pages': items_list.total_pages,
+        'total': items_list.total,
+    }
+
+
+def search_groups(q: str, page: Optional[str] = None, per_page: Optional[str] = None) -> dict:
+    return cached(
+        current_user.id,
+        'groups.{}.{}.{}'.format(page, per_page, q),
+        lambda: get_list_page(get_gitlab_instance().groups, q, page, per_page)
+    )
+
+
+def search_projects(q: str, page: Optional[str] = None, per_page: Optional[str] = None) -> dict:
+    return cached(
+        current_user.id,
+        'projects.{}.{}.{}'.format(page, per_page, q),
+        lambda: get_list_page(get_gitlab_instance().projects, q, page, per_page)
+    )
+
+
+def enable_deploy_key(gl: gitlab.Gitlab, gitlab_project, user: User, can_push: bool) -> bool:
+    """
+    Makes sure deploy key of user is enabled on project, only the project is asked, deploy keys
+    of whole instance are never listed. Key verified recently is trusted till sync fails.
+    :param gl: GitLab client of user
+    :param gitlab_project: GitLab project
+    :param user: User owning deploy key
+    :param can_push: key must be able to push
+    :return: False when user has no usable deploy key and new one has to be created
+    """
+    key_id = user.gitlab_deploy_key_id
+    if not key_id:
+        return False
+
+    if is_deploy_key_enabled(user.id, gitlab_project.id, key_id, can_push):
+        return True
+
+    try:
+        key_can_push = gitlab_project.keys.get(key_id).can_push
+    except gitlab.exceptions.GitlabError as e:
+        if e.response_code != 404:
+            raise
+        try:
+            gitlab_project.keys.enable(key_id)
+        except gitlab.exceptions.GitlabError as enable_error:
+            # Key was deleted from GitLab
+            if enable_error.response_code == 404:
+                return False
+            raise
+        key_can_push = False
+
+    if can_push and not key_can_push:
+        gl.http_put(
+            '/projects/{project_id}/deploy_keys/{key_id}'.format(
+                project_id=gitlab_project.id,
+                key_id=key_id
+            ),
+            post_data={
+                'can_push': True
+            }
+        )
+
+    set_deploy_key_enabled(user.id, gitlab_project.id, key_id, can_push or key_can_push)
+    return True
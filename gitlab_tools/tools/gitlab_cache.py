@@ -0,0 +1,239 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+import redis
+from flask import current_app
+from gitlab_tools.tools.throttle import get_redis_client
+
+CACHE_KEY = 'gitlab_tools.gitlab_cache.{user_id}.{generation}.{name}'
+GENERATION_KEY = 'gitlab_tools.gitlab_cache_generation.{user_id}'
+# Not part of user generation, project changes do not affect deploy keys
+DEPLOY_KEY_KEY = 'gitlab_tools.gitlab_deploy_key.{user_id}.{project_id}.{generation}'
+DEPLOY_KEY_GENERATION_KEY = 'gitlab_tools.gitlab_deploy_key_generation.{user_id}.{project_id}'
+
+
+class LRUCache:
+    def __init__(self, size: int):
+        """
+        Thread safe in-process cache of values with expiration, least recently used are evicted first
+        :param size: max number of cached values
+        """
+        self.size = size
+        self.items = OrderedDict()  # type: OrderedDict
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        """
+        Returns cached value
+        :param key: key
+        :return: None when value is not cached or expired
+        """
+        with self.lock:
+            item = self.items.get(key)
+            if not item:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.items.pop(key, None)
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        with self.lock:
+            self.items[key] = (time.monotonic() + ttl, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+
+_local_cache = None  # type: Optional[LRUCache]
+_local_generations = {}  # type: Dict[str, int]
+
+
+def get_local_cache() -> LRUCache:
+    global _local_cache  # pylint: disable=global-statement
+    if _local_cache is None:
+        _local_cache = LRUCache(current_app.config['GITLAB_CACHE_SIZE'])
+    return _local_cache
+
+
+def get_generation_of(generation_key: str) -> str:
+    """
+    Returns generation stored under key, it changes when values cached under it are invalidated
+    :param generation_key: redis key of generation
+    :return: str
+    """
+    generation = str(_local_generations.get(generation_key, 0))
+    redis_client = get_redis_client()
+    if redis_client:
+        try:
+            # Invalidation done by other process is seen through redis
+            generation = '{}.{}'.format(generation, int(redis_client.get(generation_key) or 0))
+        except redis.exceptions.RedisError as e:
+            logging.warning('Failed to read GitLab cache generation: %s', e)
+    return generation
+
+
+def increment_generation(generation_key: str, ttl: Optional[int] = None) -> None:
+    """
+    Invalidates values cached under generation in all processes
+    :param generation_key: redis key of generation
+    :param ttl: seconds generation is kept in redis, must not be shorter than TTL of values cached under it
+    """
+    _local_generations[generation_key] = _local_generations.get(generation_key, 0) + 1
+    redis_client = get_redis_client()
+    if redis_client:
+        try:
+            pipeline = redis_client.pipeline()
+            pipeline.incr(generation_key)
+            if ttl:
+                pipeline.expire(generation_key, ttl)
+            pipeline.execute()
+        except redis.exceptions.RedisError as e:
+            logging.warning('Failed to invalidate GitLab cache: %s', e)
+
+
+def get_generation(user_id: int) -> str:
+    """
+    Returns generation of cached values of user, it changes when cache of user is invalidated
+    :param user_id: id of user
+    :return: str
+    """
+    return get_generation_of(GENERATION_KEY.format(user_id=user_id))
+
+
+def get_cached_value(key: str, ttl: int) -> Any:
+    """
+    Returns value from in-process cache or from redis
+    :param key: key
+    :param ttl: seconds value read from redis is kept in process
+    :return: None when value is not cached
+    """
+    local_cache = get_local_cache()
+    value = local_cache.get(key)
+    if value is not None:
+        return value
+
+    redis_client = get_redis_client()
+    if redis_client:
+        try:
+            data = redis_client.get(key)
+        except redis.exceptions.RedisError as e:
+            logging.warning('Failed to read GitLab cache: %s', e)
+            return None
+        if data is not None:
+            value = json.loads(data)
+            local_cache.set(key, value, ttl)
+    return value
+
+
+def set_cached_value(key: str, value: Any, ttl: int) -> None:
+    """
+    Caches value in process and in redis when lock backend is redis
+    :param key: key
+    :param value: JSON serializable value
+    :param ttl: seconds value is cached
+    """
+    get_local_cache().set(key, value, ttl)
+    redis_client = get_redis_client()
+    if redis_client:
+        try:
+            redis_client.setex(key, ttl, json.dumps(value))
+        except redis.exceptions.RedisError as e:
+            logging.warning('Failed to write GitLab cache: %s', e)
+
+
+def delete_cached_value(key: str) -> None:
+    get_local_cache().delete(key)
+    redis_client = get_redis_client()
+    if redis_client:
+        try:
+            redis_client.delete(key)
+        except redis.exceptions.RedisError as e:
+            logging.warning('Failed to delete from GitLab cache: %s', e)
+
+
+def cached(user_id: int, name: str, factory: Callable[[], Any], ttl: Optional[int] = None) -> Any:
+    """
+    Returns value cached for user, value is created by factory when it is not cached
+    Values are cached in process and in redis when lock backend is redis, so they must be JSON serializable
+    :param user_id: id of user value belongs to, GitLab returns different data to different users
+    :param name: name of value, eg. query
+    :param factory: creates value
+    :param ttl: seconds value is cached, GITLAB_CACHE_TTL when not set
+    :return: value
+    """
+    if ttl is None:
+        ttl = current_app.config['GITLAB_CACHE_TTL']
+    if not ttl:
+        return factory()
+
+    key = CACHE_KEY.format(user_id=user_id, generation=get_generation(user_id), name=name)
+    value = get_cached_value(key, ttl)
+    if value is None:
+        value = factory()
+        set_cached_value(key, value, ttl)
+    return value
+
+
+def invalidate_user_cache(user_id: int) -> None:
+    """
+    Invalidates all values cached for user, eg. after project of user was created or updated
+    :param user_id: id of user
+    """
+    increment_generation(GENERATION_KEY.format(user_id=user_id))
+
+
+def get_deploy_key_key(user_id: int, project_id: int) -> str:
+    # Generation is read from redis, so entry forgotten by other process is not used from in-process cache
+    return DEPLOY_KEY_KEY.format(
+        user_id=user_id,
+        project_id=project_id,
+        generation=get_generation_of(DEPLOY_KEY_GENERATION_KEY.format(user_id=user_id, project_id=project_id))
+    )
+
+
+def is_deploy_key_enabled(user_id: int, project_id: int, key_id: int, can_push: bool) -> bool:
+    """
+    Checks if deploy key was verified to be enabled on project recently
+    :param user_id: id of user owning deploy key
+    :param project_id: GitLab id of project
+    :param key_id: GitLab id of deploy key
+    :param can_push: key must be able to push
+    :return: bool
+    """
+    value = get_cached_value(
+        get_deploy_key_key(user_id, project_id),
+        current_app.config['GITLAB_DEPLOY_KEY_CACHE_TTL']
+    )
+    return bool(value) and value['key_id'] == key_id and (value['can_push'] or not can_push)
+
+
+def set_deploy_key_enabled(user_id: int, project_id: int, key_id: int, can_push: bool) -> None:
+    set_cached_value(
+        get_deploy_key_key(user_id, project_id),
+        {'key_id': key_id, 'can_push': can_push},
+        current_app.config['GITLAB_DEPLOY_KEY_CACHE_TTL']
+    )
+
+
+def forget_deploy_key_enabled(user_id: int, project_id: int) -> None:
+    """
+    Forgets verified deploy key in all processes, eg. after sync failed, so it is verified on next save
+    :param user_id: id of user owning deploy key
+    :param project_id: GitLab id of project
+    """
+    delete_cached_value(get_deploy_key_key(user_id, project_id))
+    # Entries cached before the increment expire before generation does, it never returns to their value
+    increment_generation(
+        DEPLOY_KEY_GENERATION_KEY.format(user_id=user_id, project_id=project_id),
+        current_app.config['GITLAB_DEPLOY_KEY_CACHE_TTL']
+    )
@@ -0,0 +1,175 @@
+import time
+import random
+import hashlib
+import logging
+import threading
+from functools import wraps
+from typing import Callable, Tuple
+from urllib.parse import urlparse
+import redis
+import requests
+from flask import current_app
+from gitlab_tools.tools.throttle import get_redis_client, get_redis_script
+
+RATE_LIMIT_KEY = 'gitlab_tools.gitlab_rate_limit.{hostname}.{token}'
+API_CALLS_KEY = 'gitlab_tools.gitlab_api_calls'
+
+_api_calls = threading.local()
+
+
+class GitLabRateLimitError(Exception):
+    def __init__(self, retry_after: float):
+        """
+        GitLab API call would have to wait for rate limit budget too long
+        :param retry_after: seconds till budget is available
+        """
+        super().__init__('GitLab rate limit exhausted, retry after {:.0f}s'.format(retry_after))
+        self.retry_after = retry_after
+
+
+def get_rate_limit_key(request: requests.PreparedRequest) -> str:
+    """
+    Returns key of rate limit budget, GitLab limits authenticated API calls per user
+    :param request: request to GitLab
+    :return: redis key
+    """
+    authorization = request.headers.get('Authorization') or request.headers.get('PRIVATE-TOKEN') or ''
+    return RATE_LIMIT_KEY.format(
+        hostname=urlparse(request.url).hostname,
+        token=hashlib.sha256(authorization.encode('UTF-8')).hexdigest()[:16]
+    )
+
+
+def take_api_call(redis_client: redis.Redis, key: str, reserve: int) -> float:
+    """
+    Takes one API call from rate limit budget shared by all workers
+    :param redis_client: redis client
+    :param key: key of budget
+    :param reserve: calls of budget left unused, GitLab UI of user keeps working
+    :return: seconds to wait for budget, 0 when call was taken
+    """
+    return float(get_redis_script(redis_client, 'gitlab_rate_limit_take')(
+        keys=[key],
+        args=[time.time(), reserve]
+    ))
+
+
+def update_rate_limit(redis_client: redis.Redis, key: str, response: requests.Response) -> None:
+    """
+    Stores rate limit budget reported by GitLab response
+    :param redis_client: redis client
+    :param key: key of budget
+    :param response: response of GitLab
+    """
+    get_redis_script(redis_client, 'gitlab_rate_limit_update')(
+        keys=[key],
+        args=[
+            time.time(),
+            response.headers.get('RateLimit-Remaining', ''),
+            response.headers.get('RateLimit-Reset', ''),
+            response.headers.get('Retry-After', '') if response.status_code == 429 else ''
+        ]
+    )
+
+
+def reset_api_calls() -> None:
+    _api_calls.count = 0
+    _api_calls.rate_limited = 0
+
+
+def count_api_call(rate_limited: bool) -> None:
+    _api_calls.count = getattr(_api_calls, 'count', 0) + 1
+    _api_calls.rate_limited = getattr(_api_calls, 'rate_limited', 0) + int(rate_limited)
+
+
+def get_api_calls() -> Tuple[int, int]:
+    """
+    Returns GitLab API calls made by current thread since reset_api_calls
+    :return: (calls, rate limited calls)
+    """
+    return getattr(_api_calls, 'count', 0), getattr(_api_calls, 'rate_limited', 0)
+
+
+def record_api_calls(task_name: str) -> None:
+    """
+    Logs GitLab API calls made by task and adds them to per task counters in redis
+    :param task_name: name of finished task
+    """
+    count, rate_limited = get_api_calls()
+    reset_api_calls()
+    if not count:
+        return
+
+    logging.info('Task %s made %s GitLab API calls, %s rate limited', task_name, count, rate_limited)
+    redis_client = get_redis_client()
+    if not redis_client:
+        return
+    try:
+        pipeline = redis_client.pipeline()
+        pipeline.hincrby(API_CALLS_KEY, '{}.calls'.format(task_name), count)
+        pipeline.hincrby(API_CALLS_KEY, '{}.rate_limited'.format(task_name), rate_limited)
+        pipeline.execute()
+    except redis.exceptions.RedisError as e:
+        logging.warning('Failed to record GitLab API calls: %s', e)
+
+
+class RateLimitedSession(requests.Session):
+    """
+    Session of GitLab clients respecting RateLimit-Remaining and Retry-After headers.
+    Budget is shared by all workers through redis when lock backend is redis.
+    Call waiting for budget longer than GITLAB_RATE_LIMIT_MAX_WAIT raises GitLabRateLimitError.
+    """
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:  # pylint: disable=arguments-differ
+        max_wait = current_app.config['GITLAB_RATE_LIMIT_MAX_WAIT']
+        redis_client = get_redis_client()
+        key = get_rate_limit_key(request)
+        if redis_client:
+            try:
+                wait = take_api_call(redis_client, key, current_app.config['GITLAB_RATE_LIMIT_RESERVE'])
+            except redis.exceptions.RedisError as e:
+                logging.warning('Failed to take GitLab rate limit budget: %s', e)
+                redis_client = None
+                wait = 0
+            if wait > max_wait:
+                raise GitLabRateLimitError(wait)
+            if wait:
+                time.sleep(wait)
+
+        response = super().send(request, **kwargs)
+        count_api_call(response.status_code == 429)
+        if redis_client:
+            try:
+                update_rate_limit(redis_client, key, response)
+            except redis.exceptions.RedisError as e:
+                logging.warning('Failed to update GitLab rate limit budget: %s', e)
+
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After')
+            # python-gitlab sleeps for Retry-After itself, long sleep would block worker
+            if not retry_after or not retry_after.isdigit() or int(retry_after) > max_wait:
+                if retry_after and retry_after.isdigit():
+                    countdown = float(retry_after)
+                else:
+                    countdown = current_app.config['GITLAB_RATE_LIMIT_COUNTDOWN']
+                raise GitLabRateLimitError(countdown)
+        return response
+
+
+def gitlab_rate_limited(func: Callable) -> Callable:
+    """
+    Celery task decorator, task exhausting GitLab rate limit is requeued after the limit resets
+    instead of blocking worker, at most GITLAB_RATE_LIMIT_MAX_RETRIES times.
+    Use below @single_instance so requeued task does not hold the lock.
+    :param func: task function
+    :return: wrapped task function
+    """
+    @wraps(func)
+    def wrapped(celery_self, *args, **kwargs):
+        try:
+            return func(celery_self, *args, **kwargs)
+        except GitLabRateLimitError as e:
+            # Spread requeued tasks, so they do not come back all at once
+            countdown = e.retry_after + random.uniform(0, e.retry_after)  # nosec: B311
+            logging.info('GitLab rate limit exhausted, requeueing %s in %.0fs', celery_self.name, countdown)
+            raise celery_self.retry(countdown=countdown, max_retries=current_app.config['GITLAB_RATE_LIMIT_MAX_RETRIES'])
+    return wrapped
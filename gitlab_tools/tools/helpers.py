@@ -1,7 +1,10 @@
 import os
+import re
 import pwd
 import grp
 import errno
+import hashlib
+import subprocess  # nosec: B404
 import paramiko
 from gitlab_tools.models.gitlab_tools import User, PullMirror, Mirror
 from gitlab_tools.tools.GitUri import GitUri
@@ -51,6 +54,15 @@ def get_ssh_storage(user_name: str) -> str:
     return os.path.join(get_home_dir(user_name), '.ssh')
 
 
+def get_ssh_control_storage(user_name: str) -> str:
+    """
+    Gets runtime storage of SSH multiplexing control sockets
+    :param user_name: User name
+    :return: path to control socket storage
+    """
+    return os.path.join(get_ssh_storage(user_name), 'control')
+
+
 def get_repository_storage(user_name: str) -> str:
     """
     Gets user repository storage
@@ -60,6 +72,26 @@ def get_repository_storage(user_name: str) -> str:
     return os.path.join(get_home_dir(user_name), 'repositories')
 
 
+def get_object_pool_storage(user_name: str) -> str:
+    """
+    Gets storage of object pools shared by mirrors
+    :param user_name: user name
+    :return: path to object pool storage
+    """
+    return os.path.join(get_repository_storage(user_name), 'pools')
+
+
+def get_object_pool_path(url: str, user_name: str) -> str:
+    """
+    Gets path to object pool of source url, mirrors of same repository share one pool
+    :param url: source url
+    :param user_name: user name
+    :return: path to object pool
+    """
+    url_hash = hashlib.sha256(GitUri(url).normalized_url.encode('UTF-8')).hexdigest()
+    return os.path.join(get_object_pool_storage(user_name), '{}.git'.format(url_hash))
+
+
 def get_user_group_id(user_name: str) -> int:
     """
     Returns Default user group id
@@ -152,6 +184,16 @@ def convert_url_for_user(url: str, user: User) -> str:
     return url.replace(git_remote.hostname, '{}_{}'.format(git_remote.hostname, user.id), 1)
 
 
+def get_upstream_hostname(hostname: str) -> str:
+    """
+    Converts user identified hostname made by convert_url_for_user back to real hostname
+    :param hostname: hostname
+    :return: real hostname
+    """
+    match = re.match(r'^(.+)_\d+$', hostname)
+    return match.group(1) if match else hostname
+
+
 def mkdir_p(path: str) -> None:
     """
     Create path recursive
@@ -167,19 +209,61 @@ def mkdir_p(path: str) -> None:
             raise
 
 
-def add_ssh_config(user: User, user_name: str, identifier: str, host_info: GitUri) -> None:
+def prepare_ssh_control_storage(user_name: str) -> str:
+    """
+    Creates private storage for SSH control sockets
+    :param user_name: User name
+    :return: path to control socket storage
+    """
+    control_storage = get_ssh_control_storage(user_name)
+    mkdir_p(control_storage)
+    os.chmod(control_storage, 0o0700)
+    return control_storage
+
+
+def stop_ssh_control_masters(user_name: str) -> None:
+    """
+    Asks SSH master connections to exit, running transfers are finished first
+    :param user_name: User name
+    :return: None
+    """
+    control_storage = get_ssh_control_storage(user_name)
+    if not os.path.isdir(control_storage):
+        return
+
+    for socket_name in os.listdir(control_storage):
+        socket_path = os.path.join(control_storage, socket_name)
+        # Host argument is required but ignored when control socket is given
+        subprocess.Popen(  # nosec: B607, B603
+            ['ssh', '-O', 'stop', '-S', socket_path, 'gitlab-tools'],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        ).communicate()
+
+
+def add_ssh_config(user: User, user_name: str, identifier: str, host_info: GitUri, control_persist: int = 300) -> None:
     """
     Adds new SSH config host
     :param user: User
     :param user_name: str
     :param identifier: str
     :param host_info: GitUri
+    :param control_persist: seconds idle master connection is kept open for reuse, 0 disables multiplexing
     :return: None
     """
     ssh_config_path = get_ssh_config_path(user_name)
     user_known_hosts_path = get_user_known_hosts_path(user, user_name)
     user_private_key_path = get_user_private_key_path(user, user_name)
 
+    control_rows = []
+    if control_persist:
+        # Socket name is prefixed by user, so connection authenticated by one user key is never reused by other user
+        control_rows = [
+            "   ControlMaster auto",
+            "   ControlPath {}".format(os.path.join(prepare_ssh_control_storage(user_name), '{}-%C'.format(user.id))),
+            "   ControlPersist {}".format(control_persist),
+        ]
+
     ssh_config = paramiko.config.SSHConfig()
     if os.path.isfile(ssh_config_path):
         with open(ssh_config_path, 'r') as f:
@@ -192,6 +276,17 @@ def add_ssh_config(user: User, user_name: str, identifier: str, host_info: GitUr
             "   UserKnownHostsFile {}".format(user_known_hosts_path),
             "   IdentitiesOnly yes",
             "   IdentityFile {}".format(user_private_key_path),
+        ] + control_rows + [
+            ""
+        ]
+
+        with open(ssh_config_path, 'a') as f:
+            f.write('\n'.join(rows))
+    elif control_rows and 'controlpath' not in ssh_config.lookup(identifier):
+        # Host added before multiplexing was supported, ssh merges options of all matching Host blocks
+        rows = [
+            "Host {}".format(identifier),
+        ] + control_rows + [
             ""
         ]
 
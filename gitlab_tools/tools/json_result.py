@@ -0,0 +1,67 @@
+import json
+import zlib
+import pickle
+from typing import Any, Optional
+from sqlalchemy.types import TypeDecorator, LargeBinary
+
+# Results longer than this are stored zlib compressed
+COMPRESS_MIN_SIZE = 1024
+
+# zlib stream always starts with this byte, JSON document never does
+ZLIB_HEADER = b'\x78'
+
+
+def encode_result(value: Any, compress_min_size: int = COMPRESS_MIN_SIZE) -> bytes:
+    """
+    Encodes task result into compact JSON, compressed when it is long
+    :param value: result prepared by celery backend, exceptions are already dicts
+    :param compress_min_size: results longer than this are compressed, 0 disables compression
+    :return: bytes
+    """
+    data = json.dumps(value, separators=(',', ':'), default=str).encode('UTF-8')
+    if compress_min_size and len(data) > compress_min_size:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            return compressed
+    return data
+
+
+def decode_result(data: Optional[bytes]) -> Any:
+    """
+    Decodes task result encoded by encode_result
+    :param data: bytes
+    :return: result
+    """
+    if data is None:
+        return None
+    data = bytes(data)
+    if data[:1] == ZLIB_HEADER:
+        data = zlib.decompress(data)
+    return json.loads(data.decode('UTF-8'))
+
+
+def decode_legacy_result(data: Optional[bytes]) -> Any:
+    """
+    Decodes result stored by PickleType column before results were stored as JSON
+    :param data: pickled bytes
+    :return: result
+    """
+    if data is None:
+        return None
+    return pickle.loads(bytes(data))
+
+
+class JSONResult(TypeDecorator):  # pylint: disable=abstract-method
+    """Task result stored as compact, optionally compressed JSON"""
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, *args, compress_min_size: int = COMPRESS_MIN_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compress_min_size = compress_min_size
+
+    def process_bind_param(self, value: Any, dialect) -> bytes:
+        return encode_result(value, self.compress_min_size)
+
+    def process_result_value(self, value: Optional[bytes], dialect) -> Any:
+        return decode_result(value)
@@ -0,0 +1,143 @@
+import re
+import shutil
+import subprocess  # nosec: B404
+import logging
+from functools import lru_cache
+from typing import Dict, List, Tuple
+from gitlab_tools.tools.ObjectPool import ObjectPool
+
+# Single pack slows object lookup about as much as this many loose objects
+PACK_WEIGHT = 50
+
+# git repack --geometric with --write-midx needs at least this git version
+GEOMETRIC_REPACK_GIT_VERSION = (2, 34)
+
+
+def parse_count_objects(output: str) -> Dict[str, int]:
+    """
+    Parses output of git count-objects -v
+    :param output: command output
+    :return: dict of counter name => value
+    """
+    stats = {}
+    for line in output.splitlines():
+        if ':' not in line:
+            continue
+        name, value = line.split(':', 1)
+        try:
+            stats[name.strip()] = int(value.strip())
+        except ValueError:
+            continue
+
+    return stats
+
+
+def get_repository_stats(repository_path: str) -> Dict[str, int]:
+    """
+    Returns object storage counters of repository (count = loose objects, packs, ...)
+    :param repository_path: path to repository
+    :return: dict of counter name => value
+    """
+    return parse_count_objects(subprocess.check_output(  # nosec: B607, B603
+        ['git', 'count-objects', '-v'],
+        cwd=repository_path
+    ).decode('UTF-8'))
+
+
+def maintenance_priority(stats: Dict[str, int]) -> int:
+    """
+    Estimates how much repository suffers from missing maintenance
+    :param stats: repository stats
+    :return: priority, higher is more urgent
+    """
+    return stats.get('count', 0) + stats.get('packs', 0) * PACK_WEIGHT
+
+
+def is_maintenance_needed(stats: Dict[str, int], loose_objects_limit: int, packs_limit: int) -> bool:
+    """
+    Checks if repository crossed maintenance thresholds
+    :param stats: repository stats
+    :param loose_objects_limit: max loose objects
+    :param packs_limit: max packs
+    :return: bool
+    """
+    return stats.get('count', 0) > loose_objects_limit or stats.get('packs', 0) > packs_limit
+
+
+@lru_cache(maxsize=None)
+def get_git_version() -> Tuple[int, ...]:
+    """
+    Returns version of installed git
+    :return: version tuple, eg. (2, 34, 1), empty tuple when it cannot be detected
+    """
+    try:
+        output = subprocess.check_output(['git', '--version']).decode('UTF-8')  # nosec: B607, B603
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.warning('Failed to detect git version: %s', e)
+        return ()
+    found = re.search(r'(\d+)\.(\d+)(?:\.(\d+))?', output)
+    if not found:
+        return ()
+    return tuple(int(part) for part in found.groups() if part is not None)
+
+
+def get_maintenance_commands(
+        has_alternates: bool = False,
+        git_version: Tuple[int, ...] = GEOMETRIC_REPACK_GIT_VERSION
+) -> List[List[str]]:
+    """
+    Returns git commands doing incremental maintenance of repository
+    :param has_alternates: repository uses object pool, it keeps only few local objects and
+        multi-pack-index with bitmaps cannot be written for it
+    :param git_version: version of installed git, older git gets full repack instead of geometric one
+    :return: list of commands
+    """
+    if git_version >= GEOMETRIC_REPACK_GIT_VERSION:
+        # Geometric repack rolls loose objects and small packs into bigger ones without rewriting whole repository
+        repack_command = ['git', 'repack', '-d', '-l', '-q', '--geometric=2']
+        if not has_alternates:
+            repack_command.extend(['--write-midx', '--write-bitmap-index'])
+    else:
+        repack_command = ['git', 'repack', '-a', '-d', '-l', '-q']
+        if not has_alternates:
+            repack_command.append('--write-bitmap-index')
+
+    return [
+        ['git', 'pack-refs', '--all'],
+        repack_command,
+        ['git', 'commit-graph', 'write', '--reachable', '--split', '--no-progress'],
+    ]
+
+
+def get_low_priority_prefix() -> List[str]:
+    """
+    Returns command prefix lowering CPU and IO priority, so maintenance does not slow down syncs
+    :return: list
+    """
+    prefix = []
+    if shutil.which('nice'):
+        prefix.extend(['nice', '-n', '19'])
+    if shutil.which('ionice'):
+        prefix.extend(['ionice', '-c', '3'])
+
+    return prefix
+
+
+def maintain_repository(repository_path: str) -> bool:
+    """
+    Runs maintenance of repository
+    :param repository_path: path to repository
+    :return: False when any maintenance command failed
+    """
+    prefix = get_low_priority_prefix()
+    has_alternates = bool(ObjectPool.get_alternates(repository_path))
+
+    is_ok = True
+    for command in get_maintenance_commands(has_alternates, get_git_version()):
+        process = subprocess.Popen(prefix + command, cwd=repository_path)  # nosec: B607, B603
+        process.communicate()
+        if process.returncode != 0:
+            logging.warning('%s failed in %s with exit code %s', ' '.join(command[:2]), repository_path, process.returncode)
+            is_ok = False
+
+    return is_ok
@@ -0,0 +1,79 @@
+import datetime
+from typing import Optional, Tuple
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(created: datetime.datetime, row_id: int) -> str:
+    """
+    Encodes position of row into cursor usable in URL
+    :param created: created of row
+    :param row_id: id of row
+    :return: cursor
+    """
+    return '{}_{}'.format(created.isoformat(), row_id)
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime.datetime, int]]:
+    """
+    Decodes cursor created by encode_cursor
+    :param cursor: cursor
+    :return: (created, id) or None when cursor is missing or invalid
+    """
+    if not cursor or '_' not in cursor:
+        return None
+
+    created, row_id = cursor.rsplit('_', 1)
+    try:
+        return datetime.datetime.fromisoformat(created), int(row_id)
+    except ValueError:
+        return None
+
+
+class KeysetPagination:
+    def __init__(self, query, model, per_page: int, after: Optional[str] = None, before: Optional[str] = None):
+        """
+        Pagination of newest first rows seeking by (created, id) instead of OFFSET,
+        so any page costs the same as the first one
+        :param query: query of model rows
+        :param model: model having created and id columns
+        :param per_page: rows per page
+        :param after: cursor, page contains rows older than this one
+        :param before: cursor, page contains rows newer than this one
+        """
+        self.per_page = per_page
+        after_position = decode_cursor(after)
+        before_position = decode_cursor(before)
+
+        if before_position:
+            # Page before cursor is read in reversed order and flipped back
+            created, row_id = before_position
+            rows = query.filter(or_(
+                model.created > created,
+                and_(model.created == created, model.id > row_id)
+            )).order_by(model.created.asc(), model.id.asc()).limit(per_page + 1).all()
+            self.has_prev = len(rows) > per_page
+            self.has_next = True
+            self.items = list(reversed(rows[:per_page]))
+        else:
+            if after_position:
+                created, row_id = after_position
+                query = query.filter(or_(
+                    model.created < created,
+                    and_(model.created == created, model.id < row_id)
+                ))
+            rows = query.order_by(model.created.desc(), model.id.desc()).limit(per_page + 1).all()
+            self.has_prev = bool(after_position)
+            self.has_next = len(rows) > per_page
+            self.items = rows[:per_page]
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        if not self.has_next or not self.items:
+            return None
+        return encode_cursor(self.items[-1].created, self.items[-1].id)
+
+    @property
+    def prev_cursor(self) -> Optional[str]:
+        if not self.has_prev or not self.items:
+            return None
+        return encode_cursor(self.items[0].created, self.items[0].id)
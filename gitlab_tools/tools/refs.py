@@ -0,0 +1,117 @@
+import hashlib
+from typing import Dict, Optional, Iterable, Iterator, List, Tuple
+
+# Ref namespaces that are mirrored to the target
+MIRROR_REF_PREFIXES = ('refs/heads/', 'refs/tags/')
+
+# Max number of refspecs passed to single git push
+PUSH_REFSPECS_CHUNK_SIZE = 1000
+
+# Sha used by git for nonexistent ref (ref creation/deletion)
+ZERO_SHA = '0' * 40
+
+
+def parse_refs(output: str) -> Dict[str, str]:
+    """
+    Parses output of git ls-remote or git for-each-ref --format='%(objectname) %(refname)'
+    :param output: command output
+    :return: dict of refname => sha
+    """
+    refs = {}
+    for line in output.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        sha, refname = line.split(None, 1)
+        refs[refname.strip()] = sha
+
+    return refs
+
+
+def filter_refs(refs: Dict[str, str], prefixes: Iterable[str] = MIRROR_REF_PREFIXES) -> Dict[str, str]:
+    """
+    Filters refs to only ones in given namespaces, peeled tags (^{}) are removed
+    :param refs: dict of refname => sha
+    :param prefixes: ref namespaces to keep
+    :return: dict of refname => sha
+    """
+    prefixes = tuple(prefixes)
+    return {
+        refname: sha
+        for refname, sha in refs.items()
+        if refname.startswith(prefixes) and not refname.endswith('^{}')
+    }
+
+
+def refs_fingerprint(refs: Dict[str, str], prefixes: Optional[Iterable[str]] = None) -> str:
+    """
+    Calculates stable digest of refs
+    :param refs: dict of refname => sha
+    :param prefixes: when set, only refs in these namespaces are included
+    :return: sha256 hex digest
+    """
+    if prefixes is not None:
+        refs = filter_refs(refs, prefixes)
+
+    digest = hashlib.sha256()
+    for refname in sorted(refs):
+        digest.update('{} {}\n'.format(refs[refname], refname).encode('UTF-8'))
+
+    return digest.hexdigest()
+
+
+def refs_delta(
+        before: Dict[str, str],
+        after: Dict[str, str],
+        prefixes: Iterable[str] = MIRROR_REF_PREFIXES
+) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, str]]:
+    """
+    Computes refs changed between two snapshots
+    :param before: dict of refname => sha
+    :param after: dict of refname => sha
+    :param prefixes: ref namespaces to compare
+    :return: tuple of created, updated and deleted refs
+    """
+    before = filter_refs(before, prefixes)
+    after = filter_refs(after, prefixes)
+
+    created = {refname: sha for refname, sha in after.items() if refname not in before}
+    updated = {refname: sha for refname, sha in after.items() if refname in before and before[refname] != sha}
+    deleted = {refname: sha for refname, sha in before.items() if refname not in after}
+
+    return created, updated, deleted
+
+
+def build_push_refspecs(
+        before: Dict[str, str],
+        after: Dict[str, str],
+        is_force_update: bool = False,
+        is_prune_mirrors: bool = False
+) -> List[str]:
+    """
+    Builds explicit push refspecs for refs changed between two snapshots
+    :param before: dict of refname => sha
+    :param after: dict of refname => sha
+    :param is_force_update: force update of changed refs
+    :param is_prune_mirrors: delete refs removed from snapshot
+    :return: list of refspecs
+    """
+    created, updated, deleted = refs_delta(before, after)
+    force_prefix = '+' if is_force_update else ''
+
+    refspecs = ['{}{}:{}'.format(force_prefix, refname, refname) for refname in sorted({**created, **updated})]
+    if is_prune_mirrors:
+        refspecs.extend(':{}'.format(refname) for refname in sorted(deleted))
+
+    return refspecs
+
+
+def chunk_refspecs(refspecs: List[str], size: int = PUSH_REFSPECS_CHUNK_SIZE) -> Iterator[List[str]]:
+    """
+    Splits refspecs to chunks so command line does not get too long
+    :param refspecs: list of refspecs
+    :param size: max refspecs per chunk
+    :return: Iterator of refspec lists
+    """
+    for i in range(0, len(refspecs), size):
+        yield refspecs[i:i + size]
@@ -0,0 +1,206 @@
+import os
+import gzip
+import json
+import datetime
+import logging
+from typing import IO, List, Optional
+from celery import states
+from sqlalchemy import exists
+from sqlalchemy.orm import joinedload
+from gitlab_tools.extensions import db
+from gitlab_tools.models.gitlab_tools import TaskResult
+from gitlab_tools.models.celery import TaskMeta
+
+# Failures are kept longer than other results, they explain why mirror is broken
+FAILED_STATES = (states.FAILURE, states.REVOKED, states.REJECTED)
+
+
+def get_export_path(export_storage: str) -> str:
+    """
+    Returns path of new export file
+    :param export_storage: directory of exports
+    :return: str
+    """
+    return os.path.join(
+        export_storage,
+        'task_results-{}.jsonl.gz'.format(datetime.datetime.now().strftime('%Y%m%d%H%M%S'))
+    )
+
+
+def serialize_task_meta(task_meta: Optional[TaskMeta]) -> dict:
+    if not task_meta:
+        return {}
+
+    return {
+        'task_id': task_meta.task_id,
+        'status': task_meta.status,
+        'result': None if task_meta.result is None else str(task_meta.result),
+        'date_done': task_meta.date_done.isoformat() if task_meta.date_done else None,
+        'traceback': task_meta.traceback,
+    }
+
+
+def serialize_task_result(task_result: TaskResult) -> dict:
+    row = {
+        'id': task_result.id,
+        'task_name': task_result.task_name,
+        'invoked_by': task_result.invoked_by,
+        'pull_mirror_id': task_result.pull_mirror_id,
+        'push_mirror_id': task_result.push_mirror_id,
+        'parent_id': task_result.parent_id,
+        'coalesced_count': task_result.coalesced_count,
+        'created': task_result.created.isoformat() if task_result.created else None,
+    }
+    row.update(serialize_task_meta(task_result.taskmeta))
+    return row
+
+
+def write_rows(export_file: IO, rows: List[dict]) -> None:
+    for row in rows:
+        export_file.write('{}\n'.format(json.dumps(row)))
+    # Rows must be on disk before they are deleted
+    export_file.flush()
+
+
+def delete_task_results(task_result_ids: List[int], export_file: Optional[IO] = None) -> int:
+    """
+    Deletes task results with their child tasks and task metas in one short transaction
+    :param task_result_ids: ids of top level task results
+    :param export_file: deleted rows are written here as JSON lines
+    :return: number of deleted task results
+    """
+    child_ids = [
+        child_id for child_id, in TaskResult.query.with_entities(TaskResult.id).filter(
+            TaskResult.parent_id.in_(task_result_ids)
+        )
+    ]
+    all_ids = task_result_ids + child_ids
+
+    if export_file:
+        write_rows(export_file, [
+            serialize_task_result(task_result)
+            for task_result in TaskResult.query.options(joinedload(TaskResult.taskmeta)).filter(TaskResult.id.in_(all_ids))
+        ])
+
+    taskmeta_ids = [
+        taskmeta_id for taskmeta_id, in TaskResult.query.with_entities(TaskResult.taskmeta_id).filter(
+            TaskResult.id.in_(all_ids)
+        )
+    ]
+    TaskResult.query.filter(TaskResult.id.in_(child_ids)).delete(synchronize_session=False)
+    TaskResult.query.filter(TaskResult.id.in_(task_result_ids)).delete(synchronize_session=False)
+    TaskMeta.query.filter(TaskMeta.id.in_(taskmeta_ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+    return len(all_ids)
+
+
+def delete_task_metas(task_meta_ids: List[int], export_file: Optional[IO] = None) -> int:
+    """
+    Deletes task metas not belonging to any task result
+    :param task_meta_ids: ids of task metas
+    :param export_file: deleted rows are written here as JSON lines
+    :return: number of deleted task metas
+    """
+    if export_file:
+        write_rows(export_file, [
+            serialize_task_meta(task_meta)
+            for task_meta in TaskMeta.query.filter(TaskMeta.id.in_(task_meta_ids))
+        ])
+
+    TaskMeta.query.filter(TaskMeta.id.in_(task_meta_ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+    return len(task_meta_ids)
+
+
+def get_pruned_task_results_query(mirror_id_column, mirror_id: int, keep: int, keep_since: datetime.datetime):
+    """
+    Returns query of top level task results of mirror outside of retention
+    :param mirror_id_column: TaskResult.pull_mirror_id or TaskResult.push_mirror_id
+    :param mirror_id: mirror id
+    :param keep: newest task results of mirror that are always kept
+    :param keep_since: failures newer than this are kept
+    :return: query or None when mirror has nothing to prune
+    """
+    top_level_query = TaskResult.query.filter(mirror_id_column == mirror_id, TaskResult.parent_id.is_(None))
+
+    # Newest task result not covered by keep, everything older is outside of retention
+    threshold_id = top_level_query.with_entities(TaskResult.id).order_by(
+        TaskResult.id.desc()
+    ).offset(keep).limit(1).scalar()
+    if threshold_id is None:
+        return None
+
+    return top_level_query.join(TaskMeta).filter(
+        TaskResult.id <= threshold_id,
+        # Failure that never finished has no date_done, it is as old as its task result
+        ~db.and_(
+            TaskMeta.status.in_(FAILED_STATES),
+            db.func.coalesce(TaskMeta.date_done, TaskResult.created) >= keep_since
+        )
+    ).with_entities(TaskResult.id)
+
+
+def prune_task_results(keep: int, days: int, chunk_size: int, export_storage: Optional[str] = None) -> int:
+    """
+    Deletes task results outside of retention in small chunks, so no lock is held for long
+    Kept are newest keep results of each mirror, failures younger than days,
+    task results of deleted mirrors and task metas not belonging to mirror younger than days.
+    :param keep: newest task results of each mirror that are kept
+    :param days: failures, results of deleted mirrors and task metas not belonging to mirror are kept this many days
+    :param chunk_size: rows deleted in one transaction
+    :param export_storage: when set, deleted rows are exported to gzipped JSON lines file in this directory
+    :return: number of deleted rows
+    """
+    keep_since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    export_file = export_path = None
+    if export_storage:
+        os.makedirs(export_storage, exist_ok=True)
+        export_path = get_export_path(export_storage)
+        export_file = gzip.open(export_path, 'wt', encoding='UTF-8')
+
+    deleted = 0
+    try:
+        for mirror_id_column in (TaskResult.pull_mirror_id, TaskResult.push_mirror_id):
+            mirror_ids = [
+                mirror_id for mirror_id, in db.session.query(mirror_id_column).filter(mirror_id_column.isnot(None)).distinct()
+            ]
+            for mirror_id in mirror_ids:
+                query = get_pruned_task_results_query(mirror_id_column, mirror_id, keep, keep_since)
+                while query is not None:
+                    task_result_ids = [task_result_id for task_result_id, in query.limit(chunk_size)]
+                    if not task_result_ids:
+                        break
+                    deleted += delete_task_results(task_result_ids, export_file)
+
+        # Task results of deleted mirrors
+        orphan_task_results_query = TaskResult.query.filter(
+            TaskResult.pull_mirror_id.is_(None),
+            TaskResult.push_mirror_id.is_(None),
+            TaskResult.parent_id.is_(None),
+            TaskResult.created < keep_since
+        ).with_entities(TaskResult.id)
+        while True:
+            task_result_ids = [task_result_id for task_result_id, in orphan_task_results_query.limit(chunk_size)]
+            if not task_result_ids:
+                break
+            deleted += delete_task_results(task_result_ids, export_file)
+
+        orphans_query = TaskMeta.query.filter(
+            ~exists().where(TaskResult.taskmeta_id == TaskMeta.id),
+            TaskMeta.date_done < keep_since
+        ).with_entities(TaskMeta.id)
+        while True:
+            task_meta_ids = [task_meta_id for task_meta_id, in orphans_query.limit(chunk_size)]
+            if not task_meta_ids:
+                break
+            deleted += delete_task_metas(task_meta_ids, export_file)
+    finally:
+        if export_file:
+            export_file.close()
+            if not deleted:
+                os.remove(export_path)
+
+    logging.info('Pruned %s task results', deleted)
+    return deleted
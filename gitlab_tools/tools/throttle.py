@@ -0,0 +1,185 @@
+import os
+import time
+import random
+import logging
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Type
+import redis
+from flask import current_app
+from gitlab_tools.models.gitlab_tools import Mirror
+from gitlab_tools.tools.GitUri import GitUri
+from gitlab_tools.tools.helpers import get_upstream_hostname
+from gitlab_tools.extensions import celery
+
+HOST_SLOTS_KEY = 'gitlab_tools.host_slots.{hostname}'
+HOST_BUCKET_KEY = 'gitlab_tools.host_bucket.{hostname}'
+
+_scripts = {}
+
+
+def get_redis_client() -> Optional[redis.Redis]:
+    """
+    Returns redis client of CELERY_TASK_LOCK_BACKEND
+    :return: None when lock backend is not redis
+    """
+    return getattr(celery.lock_backend, 'redis_client', None)
+
+
+def get_redis_script(redis_client: redis.Redis, name: str):
+    """
+    Returns registered lua script from REDIS_SCRIPTS_FOLDER
+    :param redis_client: redis client
+    :param name: script file name without extension
+    :return: redis Script
+    """
+    key = (id(redis_client), name)
+    if key not in _scripts:
+        from gitlab_tools.application import REDIS_SCRIPTS_FOLDER  # pylint: disable=import-outside-toplevel
+        with open(os.path.join(REDIS_SCRIPTS_FOLDER, '{}.lua'.format(name))) as script_file:
+            _scripts[key] = redis_client.register_script(script_file.read())
+
+    return _scripts[key]
+
+
+def get_host_limits(hostname: str) -> Dict[str, float]:
+    """
+    Returns throttling limits of host
+    :param hostname: real hostname
+    :return: dict with concurrency, rate and burst
+    """
+    limits = {
+        'concurrency': current_app.config['HOST_CONCURRENCY'],
+        'rate': current_app.config['HOST_RATE'],
+        'burst': current_app.config['HOST_RATE_BURST'],
+    }
+    limits.update(current_app.config['HOST_THROTTLE_OVERRIDES'].get(hostname, {}))
+    return limits
+
+
+def acquire_host_slot(redis_client: redis.Redis, hostname: str, token: str, limit: int, timeout: int) -> bool:
+    """
+    Acquires one of limited concurrent slots of host, shared by all workers
+    :param redis_client: redis client
+    :param hostname: real hostname
+    :param token: slot owner identifier
+    :param limit: max slots of host
+    :param timeout: slot is released automatically after this many seconds
+    :return: False when all slots are taken
+    """
+    return bool(get_redis_script(redis_client, 'host_slot_acquire')(
+        keys=[HOST_SLOTS_KEY.format(hostname=hostname)],
+        args=[token, limit, time.time(), timeout]
+    ))
+
+
+def release_host_slot(redis_client: redis.Redis, hostname: str, token: str) -> None:
+    """
+    Releases host slot
+    :param redis_client: redis client
+    :param hostname: real hostname
+    :param token: slot owner identifier
+    :return: None
+    """
+    redis_client.zrem(HOST_SLOTS_KEY.format(hostname=hostname), token)
+
+
+def take_host_token(redis_client: redis.Redis, hostname: str, rate: float, burst: int) -> float:
+    """
+    Takes token from rate limiting bucket of host, shared by all workers
+    :param redis_client: redis client
+    :param hostname: real hostname
+    :param rate: tokens per second
+    :param burst: bucket size
+    :return: seconds to wait for next token, 0 when token was taken
+    """
+    return float(get_redis_script(redis_client, 'host_token_bucket')(
+        keys=[HOST_BUCKET_KEY.format(hostname=hostname)],
+        args=[rate, burst, time.time()]
+    ))
+
+
+def return_host_token(redis_client: redis.Redis, hostname: str, burst: int) -> None:
+    """
+    Returns token taken by take_host_token to rate limiting bucket of host
+    :param redis_client: redis client
+    :param hostname: real hostname
+    :param burst: bucket size
+    :return: None
+    """
+    get_redis_script(redis_client, 'host_token_return')(
+        keys=[HOST_BUCKET_KEY.format(hostname=hostname)],
+        args=[burst]
+    )
+
+
+def get_mirror_hostnames(mirror: Mirror) -> List[str]:
+    """
+    Returns real hostnames mirror talks to
+    :param mirror: Mirror
+    :return: sorted list of hostnames
+    """
+    hostnames = set()
+    for url in [mirror.source, mirror.target]:
+        hostname = GitUri(url).hostname if url else None
+        if hostname:
+            hostnames.add(get_upstream_hostname(hostname))
+
+    # Stable order, so two tasks never wait for each other's hosts crosswise
+    return sorted(hostnames)
+
+
+def host_throttled(mirror_class: Type[Mirror]) -> Callable:
+    """
+    Celery task decorator, limits concurrency and rate of syncs per host across all workers.
+    When host budget is exhausted task is requeued with countdown instead of blocking worker,
+    at most HOST_THROTTLE_MAX_RETRIES times.
+    Use below @single_instance so requeued task does not hold the lock. Needs redis CELERY_TASK_LOCK_BACKEND.
+    :param mirror_class: PullMirror or PushMirror
+    :return: decorator
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapped(celery_self, mirror_id: int, *args, **kwargs):
+            redis_client = get_redis_client()
+            mirror = mirror_class.query.filter_by(id=mirror_id).first()
+            if not redis_client or not mirror:
+                return func(celery_self, mirror_id, *args, **kwargs)
+
+            token = celery_self.request.id or str(mirror_id)
+            acquired = []
+            # Host => bucket size of rate tokens taken, returned when later host throttles the sync
+            taken = {}
+            try:
+                for hostname in get_mirror_hostnames(mirror):
+                    limits = get_host_limits(hostname)
+                    countdown = 0
+                    if limits['concurrency'] and not acquire_host_slot(
+                            redis_client,
+                            hostname,
+                            token,
+                            limits['concurrency'],
+                            current_app.config['HOST_SLOT_TIMEOUT']
+                    ):
+                        countdown = current_app.config['HOST_THROTTLE_COUNTDOWN']
+                    else:
+                        if limits['concurrency']:
+                            acquired.append(hostname)
+                        if limits['rate']:
+                            countdown = take_host_token(redis_client, hostname, limits['rate'], limits['burst'])
+                            if not countdown:
+                                taken[hostname] = limits['burst']
+
+                    if countdown:
+                        for taken_hostname, burst in taken.items():
+                            return_host_token(redis_client, taken_hostname, burst)
+                        # Spread requeued tasks, so they do not come back all at once
+                        countdown = countdown + random.uniform(0, countdown)  # nosec: B311
+                        logging.info('Host %s budget exhausted, requeueing mirror %s in %.0fs', hostname, mirror_id, countdown)
+                        raise celery_self.retry(countdown=countdown, max_retries=current_app.config['HOST_THROTTLE_MAX_RETRIES'])
+
+                return func(celery_self, mirror_id, *args, **kwargs)
+            finally:
+                for hostname in acquired:
+                    release_host_slot(redis_client, hostname, token)
+        return wrapped
+    return decorator
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
-from typing import Tuple
+import re
+from typing import Tuple, Optional
 import flask
 from flask import jsonify, request, url_for
 from flask_login import login_required
@@ -8,13 +9,15 @@ from gitlab_tools.tasks.gitlab_tools import sync_pull_mirror, sync_push_mirror
 from gitlab_tools.models.gitlab_tools import PullMirror, PushMirror
 from gitlab_tools.models.celery import TaskMeta
 from gitlab_tools.enums.InvokedByEnum import InvokedByEnum
-from gitlab_tools.tools.gitlab import get_group, get_project, get_gitlab_instance
-from gitlab_tools.tools.celery import log_task_pending
+from gitlab_tools.tools.gitlab import get_group_attributes, get_project_attributes, search_groups, search_projects
+from gitlab_tools.tools.celery import log_tasks_pending, coalesce_task_pending
 
 
 __author__ = "Adam Schubert"
 __date__ = "$26.7.2017 19:33:05$"
 
+SHA_REGEX = re.compile(r'^[0-9a-f]{40}([0-9a-f]{24})?$')
+
 
 @api_index.route('/pull/sync/<int:mirror_id>', methods=['POST', 'GET'])
 def schedule_sync_pull_mirror(mirror_id: int) -> Tuple[flask.Response, int]:
@@ -32,8 +35,12 @@ def schedule_sync_pull_mirror(mirror_id: int) -> Tuple[flask.Response, int]:
     if not found_mirror.project_id:
         return jsonify({'message': 'Project mirror is not created, cannot be synced'}), 400
 
+    coalesced_task_result = coalesce_task_pending(found_mirror, sync_pull_mirror, InvokedByEnum.HOOK)
+    if coalesced_task_result:
+        return jsonify({'message': 'Sync task already scheduled', 'uuid': coalesced_task_result.taskmeta.task_id}), 200
+
     task = sync_pull_mirror.delay(found_mirror.id)
-    log_task_pending(task, found_mirror, sync_pull_mirror, InvokedByEnum.HOOK)
+    log_tasks_pending([(task, found_mirror)], sync_pull_mirror, InvokedByEnum.HOOK)
 
     return jsonify({'message': 'Sync task started', 'uuid': task.id}), 200
 
@@ -54,14 +61,46 @@ def schedule_sync_push_mirror(mirror_id: int) -> Tuple[flask.Response, int]:
     if not found_mirror.project_id:
         return jsonify({'message': 'Project mirror is not created, cannot be synced'}), 400
 
-    task = sync_push_mirror.delay(found_mirror.id)
-    log_task_pending(task, found_mirror, sync_push_mirror, InvokedByEnum.HOOK)
+    # Queued task may sync single ref only
+    coalesced_task_result = coalesce_task_pending(found_mirror, sync_push_mirror, InvokedByEnum.HOOK, is_queued_partial=True)
+    if coalesced_task_result:
+        return jsonify({'message': 'Sync task already scheduled', 'uuid': coalesced_task_result.taskmeta.task_id}), 200
+
+    ref_update = get_ref_update(request.get_json(silent=True))
+    if ref_update:
+        task = sync_push_mirror.delay(found_mirror.id, ref_update)
+    else:
+        task = sync_push_mirror.delay(found_mirror.id)
+    log_tasks_pending([(task, found_mirror)], sync_push_mirror, InvokedByEnum.HOOK)
 
     return jsonify({'message': 'Sync task started', 'uuid': task.id}), 200
 
 
+def get_ref_update(payload: Optional[dict]) -> Optional[dict]:
+    """
+    Extracts ref update from GitLab push or tag push event payload
+    :param payload: hook payload
+    :return: dict with ref, before and after or None when payload is not usable
+    """
+    if not isinstance(payload, dict):
+        return None
+
+    ref_update = {key: payload.get(key) for key in ('ref', 'before', 'after')}
+    if not all(isinstance(value, str) for value in ref_update.values()):
+        return None
+
+    if not ref_update['ref'].startswith('refs/') or \
+            not SHA_REGEX.match(ref_update['before']) or \
+            not SHA_REGEX.match(ref_update['after']):
+        return None
+
+    return ref_update
+
+
 def group_fix_avatar(group: dict) -> dict:
     if not group['avatar_url']:
+        # Group may be cached, it is not modified in place
+        group = dict(group)
         group['avatar_url'] = url_for('static', filename='img/no_group_avatar.png', _external=True)
     return group
 
@@ -70,86 +109,38 @@ def group_fix_avatar(group: dict) -> dict:
 @login_required
 def search_group() -> Tuple[flask.Response, int]:
     q = request.args.get('q')
-    per_page = request.args.get('per_page')
-    page = request.args.get('page')
     if not q:
         return jsonify({'message': 'q was not provided'}), 400
 
-    gl = get_gitlab_instance()
-
-    params = {
-        'search': q,
-        'as_list': False
-    }
+    groups_page = search_groups(q, request.args.get('page'), request.args.get('per_page'))
 
-    if per_page:
-        params['per_page'] = per_page
-
-    if page:
-        params['page'] = page
-
-    items_list = gl.groups.list(**params)
-
-    return jsonify({
-        'items': [group_fix_avatar(i.attributes) for i in items_list],
-        'current_page': items_list.current_page,
-        'prev_page': items_list.prev_page,
-        'next_page': items_list.next_page,
-        'per_page': items_list.per_page,
-        'total_pages': items_list.total_pages,
-        'total': items_list.total,
-    }), 200
+    return jsonify(dict(groups_page, items=[group_fix_avatar(i) for i in groups_page['items']])), 200
 
 
 @api_index.route('/groups/<int:group_id>', methods=['GET'])
 @login_required
 def get_gitlab_group(group_id: int) -> Tuple[flask.Response, int]:
-    group = get_group(group_id)
+    group = get_group_attributes(group_id)
 
-    return jsonify(group_fix_avatar(group.attributes)), 200
+    return jsonify(group_fix_avatar(group)), 200
 
 
 @api_index.route('/projects/search', methods=['GET'])
 @login_required
 def search_project() -> Tuple[flask.Response, int]:
     q = request.args.get('q')
-    per_page = request.args.get('per_page')
-    page = request.args.get('page')
     if not q:
         return jsonify({'message': 'q was not provided'}), 400
 
-    gl = get_gitlab_instance()
-
-    params = {
-        'search': q,
-        'as_list': False
-    }
-
-    if per_page:
-        params['per_page'] = per_page
-
-    if page:
-        params['page'] = page
-
-    items_list = gl.projects.list(**params)
-
-    return jsonify({
-        'items': [i.attributes for i in items_list],
-        'current_page': items_list.current_page,
-        'prev_page': items_list.prev_page,
-        'next_page': items_list.next_page,
-        'per_page': items_list.per_page,
-        'total_pages': items_list.total_pages,
-        'total': items_list.total,
-    }), 200
+    return jsonify(search_projects(q, request.args.get('page'), request.args.get('per_page'))), 200
 
 
 @api_index.route('/projects/<int:project_id>', methods=['GET'])
 @login_required
 def get_gitlab_project(project_id: int) -> Tuple[flask.Response, int]:
-    project = get_project(project_id)
+    project = get_project_attributes(project_id)
 
-    return jsonify(project.attributes), 200
+    return jsonify(project), 200
 
 
 @api_index.route('/task/<string:task_id>/traceback', methods=['GET'])
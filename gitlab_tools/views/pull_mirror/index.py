@@ -5,6 +5,7 @@ from typing import Tuple, Union
 import flask
 from celery import chain
 from flask_login import current_user, login_required
+from sqlalchemy.orm import joinedload, selectinload
 from cron_descriptor.ExpressionParser import ExpressionParser
 from cron_descriptor.Options import Options
 from gitlab_tools.models.gitlab_tools import PullMirror, Group, TaskResult
@@ -13,7 +14,9 @@ from gitlab_tools.enums.InvokedByEnum import InvokedByEnum
 from gitlab_tools.forms.pull_mirror import EditForm, NewForm
 from gitlab_tools.tools.helpers import convert_url_for_user
 from gitlab_tools.tools.crypto import random_password
-from gitlab_tools.tools.celery import log_task_pending
+from gitlab_tools.tools.cron import expand_hashed_cron
+from gitlab_tools.tools.celery import log_task_pending, log_tasks_pending, coalesce_task_pending
+from gitlab_tools.tools.pagination import KeysetPagination
 from gitlab_tools.tools.GitRemote import GitRemote
 from gitlab_tools.models.celery import PeriodicTask, CrontabSchedule, PeriodicTasks
 from gitlab_tools.blueprints import pull_mirror_index
@@ -49,7 +52,12 @@ def process_cron_expression(pull_mirror: PullMirror) -> bool:
     """
     changed = False
     if pull_mirror.periodic_sync:
-        expression_parser = ExpressionParser(pull_mirror.periodic_sync, Options())
+        if pull_mirror.id is None:
+            # Mirror id is needed for hashed values and task name
+            db.session.add(pull_mirror)
+            db.session.flush()
+
+        expression_parser = ExpressionParser(expand_hashed_cron(pull_mirror.periodic_sync, str(pull_mirror.id)), Options())
         _, minute, hour, day_of_week, day_of_month, month_of_year, _ = expression_parser.parse()
 
         parameters = dict(
@@ -105,14 +113,24 @@ def process_cron_expression(pull_mirror: PullMirror) -> bool:
     return changed
 
 
-@pull_mirror_index.route('/', methods=['GET'], defaults={'page': 1})
-@pull_mirror_index.route('/page/<int:page>', methods=['GET'])
+@pull_mirror_index.route('/', methods=['GET'])
 @login_required
-def get_mirror(page: int) -> Tuple[str, int]:
-    pagination = PullMirror.query.filter_by(
+def get_mirror() -> Tuple[str, int]:
+    query = PullMirror.query.filter_by(
         is_deleted=False,
         user=current_user
-    ).order_by(PullMirror.created.desc()).paginate(page=page, per_page=PER_PAGE)
+    )
+    status = flask.request.args.get('status')
+    if status:
+        query = query.filter_by(last_status=status)
+
+    pagination = KeysetPagination(
+        query,
+        PullMirror,
+        PER_PAGE,
+        flask.request.args.get('after'),
+        flask.request.args.get('before')
+    )
     return flask.render_template('pull_mirror.index.pull_mirror.html', pagination=pagination), 200
 
 
@@ -301,8 +319,14 @@ def schedule_sync_mirror(mirror_id: int) -> flask.Response:
     if not found_mirror.project_id:
         flask.flash('Project mirror is not created, cannot be synced', 'danger')
         return flask.redirect(flask.url_for('pull_mirror_index.get_mirror'))
+
+    coalesced_task_result = coalesce_task_pending(found_mirror, sync_pull_mirror, InvokedByEnum.MANUAL)
+    if coalesced_task_result:
+        flask.flash('Sync is already scheduled with UUID: {}'.format(coalesced_task_result.taskmeta.task_id), 'info')
+        return flask.redirect(flask.url_for('pull_mirror_index.get_mirror'))
+
     task = sync_pull_mirror.delay(mirror_id)
-    log_task_pending(task, found_mirror, sync_pull_mirror, InvokedByEnum.MANUAL)
+    log_tasks_pending([(task, found_mirror)], sync_pull_mirror, InvokedByEnum.MANUAL)
 
     flask.flash('Sync has been started with UUID: {}'.format(task.id), 'success')
     return flask.redirect(flask.url_for('pull_mirror_index.get_mirror'))
@@ -323,14 +347,21 @@ def schedule_delete_mirror(mirror_id: int) -> flask.Response:
     return flask.redirect(flask.url_for('pull_mirror_index.get_mirror'))
 
 
-@pull_mirror_index.route('/log/<int:mirror_id>', methods=['GET'], defaults={'page': 1})
-@pull_mirror_index.route('/log/<int:mirror_id>/page/<int:page>', methods=['GET'])
+@pull_mirror_index.route('/log/<int:mirror_id>', methods=['GET'])
 @login_required
-def log(mirror_id: int, page: int) -> Tuple[str, int]:
+def log(mirror_id: int) -> Tuple[str, int]:
     pull_mirror = PullMirror.query.filter_by(id=mirror_id, user=current_user).first_or_404()
 
-    pagination = TaskResult.query.filter_by(pull_mirror=pull_mirror, parent=None).order_by(
-        TaskResult.created.desc()).paginate(page=page, per_page=PER_PAGE)
+    pagination = KeysetPagination(
+        TaskResult.query.filter_by(pull_mirror=pull_mirror, parent=None).options(
+            joinedload(TaskResult.taskmeta),
+            selectinload(TaskResult.children).joinedload(TaskResult.taskmeta)
+        ),
+        TaskResult,
+        PER_PAGE,
+        flask.request.args.get('after'),
+        flask.request.args.get('before')
+    )
     return flask.render_template(
         'pull_mirror.index.log.html',
         pull_mirror=pull_mirror,
@@ -4,6 +4,7 @@
 import flask
 from celery import chain
 from flask_login import current_user, login_required
+from sqlalchemy.orm import joinedload, selectinload
 from gitlab_tools.models.gitlab_tools import PushMirror, Project, TaskResult
 from gitlab_tools.extensions import db
 from gitlab_tools.enums.ProtocolEnum import ProtocolEnum
@@ -12,7 +13,8 @@ from gitlab_tools.forms.push_mirror import EditForm, NewForm
 from gitlab_tools.tools.helpers import convert_url_for_user
 from gitlab_tools.tools.crypto import random_password
 from gitlab_tools.tools.GitRemote import GitRemote
-from gitlab_tools.tools.celery import log_task_pending
+from gitlab_tools.tools.celery import log_task_pending, log_tasks_pending, coalesce_task_pending
+from gitlab_tools.tools.pagination import KeysetPagination
 from gitlab_tools.blueprints import push_mirror_index
 from gitlab_tools.tasks.gitlab_tools import sync_push_mirror, \
     delete_push_mirror, \
@@ -36,14 +38,24 @@ def process_project(gitlab_id: int) -> Project:
     return found_project
 
 
-@push_mirror_index.route('/', methods=['GET'], defaults={'page': 1})
-@push_mirror_index.route('/page/<int:page>', methods=['GET'])
+@push_mirror_index.route('/', methods=['GET'])
 @login_required
-def get_mirror(page: int):
-    pagination = PushMirror.query.filter_by(
+def get_mirror():
+    query = PushMirror.query.filter_by(
         is_deleted=False,
         user=current_user
-    ).order_by(PushMirror.created.desc()).paginate(page=page, per_page=PER_PAGE)
+    )
+    status = flask.request.args.get('status')
+    if status:
+        query = query.filter_by(last_status=status)
+
+    pagination = KeysetPagination(
+        query.options(joinedload(PushMirror.project)),
+        PushMirror,
+        PER_PAGE,
+        flask.request.args.get('after'),
+        flask.request.args.get('before')
+    )
     return flask.render_template('push_mirror.index.push_mirror.html', pagination=pagination)
 
 
@@ -179,8 +191,15 @@ def schedule_sync_mirror(mirror_id: int):
     if not found_mirror.project_id:
         flask.flash('Project mirror is not created, cannot be synced', 'danger')
         return flask.redirect(flask.url_for('push_mirror_index.get_mirror'))
+
+    # Queued task may sync single ref only
+    coalesced_task_result = coalesce_task_pending(found_mirror, sync_push_mirror, InvokedByEnum.MANUAL, is_queued_partial=True)
+    if coalesced_task_result:
+        flask.flash('Sync is already scheduled with UUID: {}'.format(coalesced_task_result.taskmeta.task_id), 'info')
+        return flask.redirect(flask.url_for('push_mirror_index.get_mirror'))
+
     task = sync_push_mirror.delay(mirror_id)
-    log_task_pending(task, found_mirror, sync_push_mirror, InvokedByEnum.MANUAL)
+    log_tasks_pending([(task, found_mirror)], sync_push_mirror, InvokedByEnum.MANUAL)
 
     flask.flash('Sync has been started with UUID: {}'.format(task.id), 'success')
     return flask.redirect(flask.url_for('push_mirror_index.get_mirror'))
@@ -201,14 +220,21 @@ def schedule_delete_mirror(mirror_id: int):
     return flask.redirect(flask.url_for('push_mirror_index.get_mirror'))
 
 
-@push_mirror_index.route('/log/<int:mirror_id>', methods=['GET'], defaults={'page': 1})
-@push_mirror_index.route('/log/<int:mirror_id>/page/<int:page>', methods=['GET'])
+@push_mirror_index.route('/log/<int:mirror_id>', methods=['GET'])
 @login_required
-def log(mirror_id: int, page: int):
+def log(mirror_id: int):
     push_mirror = PushMirror.query.filter_by(id=mirror_id, user=current_user).first_or_404()
 
-    pagination = TaskResult.query.filter_by(push_mirror=push_mirror, parent=None).order_by(
-        TaskResult.created.desc()).paginate(page=page, per_page=PER_PAGE)
+    pagination = KeysetPagination(
+        TaskResult.query.filter_by(push_mirror=push_mirror, parent=None).options(
+            joinedload(TaskResult.taskmeta),
+            selectinload(TaskResult.children).joinedload(TaskResult.taskmeta)
+        ),
+        TaskResult,
+        PER_PAGE,
+        flask.request.args.get('after'),
+        flask.request.args.get('before')
+    )
     return flask.render_template(
         'push_mirror.index.log.html',
         push_mirror=push_mirror,
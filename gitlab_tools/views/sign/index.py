@@ -11,6 +11,7 @@ from flask_login import login_user, logout_user, login_required
 from gitlab_tools.blueprints import sign_index
 from gitlab_tools.tasks.gitlab_tools import create_rsa_pair
 from gitlab_tools.tools.crypto import random_password
+from gitlab_tools.tools.gitlab import get_http_session, get_token_expires
 from gitlab_tools.extensions import db
 from gitlab_tools.models.gitlab_tools import User, OAuth2State
 
@@ -79,7 +80,8 @@ def do_login():
         gl = gitlab.Gitlab(
             flask.current_app.config['GITLAB_URL'],
             oauth_token=response_data['access_token'],
-            api_version=flask.current_app.config['GITLAB_API_VERSION']
+            api_version=flask.current_app.config['GITLAB_API_VERSION'],
+            session=get_http_session()
         )
 
         gl.auth()
@@ -95,6 +97,7 @@ def do_login():
         found_user.avatar_url = logged_user.avatar_url
         found_user.access_token = response_data['access_token']
         found_user.refresh_token = response_data['refresh_token']
+        found_user.expires = get_token_expires(response_data)
         found_user.created = datetime.datetime.fromtimestamp(response_data['created_at'])
 
         db.session.add(found_user)
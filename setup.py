@@ -42,7 +42,8 @@ extra_files = [
         'migrations/alembic.ini',
         'views/*/templates/*',
         'views/*/templates/*/*',
-        'static/*'
+        'static/*',
+        'redis_scripts/*'
 ]
 
 extra_files.extend(package_files('gitlab_tools/translations'))
@@ -0,0 +1,79 @@
+import uuid
+import pytest
+from celery import states
+from gitlab_tools.config import Config
+from gitlab_tools.application import create_app
+from gitlab_tools.extensions import db
+from gitlab_tools.models.gitlab_tools import PullMirror
+from gitlab_tools.tools.celery import log_task_pending, find_active_task_result, coalesce_task_pending, \
+    claim_sync_request
+from gitlab_tools.enums.InvokedByEnum import InvokedByEnum
+
+
+class TestConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    CELERY_BROKER_URL = 'memory://'
+
+
+class FakeAsyncResult:
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+
+
+def sync_pull_mirror():
+    pass
+
+
+@pytest.fixture
+def mirror():
+    app = create_app(TestConfig())
+    with app.app_context():
+        db.create_all()
+        pull_mirror = PullMirror(project_name='test', is_jobs_enabled=True, visibility='private')
+        db.session.add(pull_mirror)
+        db.session.commit()
+        yield pull_mirror
+        db.session.remove()
+        db.drop_all()
+
+
+def start_task(pull_mirror, status: str):
+    task_result = log_task_pending(FakeAsyncResult(), pull_mirror, sync_pull_mirror, InvokedByEnum.MANUAL)
+    # Result backend clears date_done of running task
+    task_result.taskmeta.status = status
+    task_result.taskmeta.date_done = None
+    db.session.commit()
+    return task_result
+
+
+def test_started_task_is_active(mirror):
+    task_result = start_task(mirror, states.STARTED)
+    assert find_active_task_result(mirror, sync_pull_mirror) == task_result
+
+
+def test_trigger_during_started_task_requests_follow_up(mirror):
+    task_result = start_task(mirror, states.STARTED)
+    assert coalesce_task_pending(mirror, sync_pull_mirror, InvokedByEnum.HOOK) == task_result
+    assert mirror.sync_requested_by == InvokedByEnum.HOOK
+
+
+def test_trigger_during_queued_task_needs_no_follow_up(mirror):
+    task_result = log_task_pending(FakeAsyncResult(), mirror, sync_pull_mirror, InvokedByEnum.MANUAL)
+    assert coalesce_task_pending(mirror, sync_pull_mirror, InvokedByEnum.HOOK) == task_result
+    assert mirror.sync_requested_by is None
+
+
+def test_trigger_during_queued_partial_task_is_claimed_at_start(mirror):
+    log_task_pending(FakeAsyncResult(), mirror, sync_pull_mirror, InvokedByEnum.HOOK)
+    assert coalesce_task_pending(mirror, sync_pull_mirror, InvokedByEnum.HOOK, is_queued_partial=True)
+    assert mirror.sync_requested_by == InvokedByEnum.HOOK
+
+    assert claim_sync_request(PullMirror, mirror.id)
+    assert not claim_sync_request(PullMirror, mirror.id)
+    db.session.refresh(mirror)
+    assert mirror.sync_requested_by is None
+
+
+def test_finished_task_is_not_active(mirror):
+    start_task(mirror, states.SUCCESS)
+    assert find_active_task_result(mirror, sync_pull_mirror) is None
@@ -0,0 +1,31 @@
+import pytest
+from gitlab_tools.tools.cron import expand_hashed_cron, expand_hashed_value, get_jitter_offset
+
+
+def test_expand_hashed_cron_is_deterministic() -> None:
+    assert expand_hashed_cron('H * * * *', '1') == expand_hashed_cron('H * * * *', '1')
+    assert expand_hashed_cron('*/5 1 * * *', '1') == '*/5 1 * * *'
+
+
+def test_expand_hashed_cron_spreads_seeds() -> None:
+    minutes = {expand_hashed_cron('H * * * *', str(seed)).split()[0] for seed in range(100)}
+    assert len(minutes) > 30
+    assert all(0 <= int(minute) <= 59 for minute in minutes)
+
+
+def test_expand_hashed_value_range_and_step() -> None:
+    for seed in range(50):
+        assert 10 <= int(expand_hashed_value('H(10-20)', str(seed), 0, 59)) <= 20
+
+        start, step = expand_hashed_value('H/15', str(seed), 0, 59).split('/')
+        assert step == '15'
+        assert int(start.split('-')[0]) < 15
+
+    with pytest.raises(ValueError):
+        expand_hashed_value('H(10-70)', '1', 0, 59)
+
+
+def test_get_jitter_offset() -> None:
+    assert get_jitter_offset('a', 0) == 0
+    assert 0 <= get_jitter_offset('a', 60) < 60
+    assert get_jitter_offset('a', 60) == get_jitter_offset('a', 60)
@@ -168,4 +168,12 @@ def test_https_uri_with_scheme_path_port() -> None:
     assert result.port == 8443
     assert result.path == '/Salamek/qiosk.git'
     assert result.url == 'https://github.com:8443/Salamek/qiosk.git'
-    assert result.build_url(ignore_default_port=True) == 'https://github.com:8443/Salamek/qiosk.git'
\ No newline at end of file
+    assert result.build_url(ignore_default_port=True) == 'https://github.com:8443/Salamek/qiosk.git'
+
+
+def test_normalized_url() -> None:
+    expected = 'https://github.com/Salamek/qiosk'
+    assert GitUri('https://GitHub.com:443/Salamek/qiosk.git').normalized_url == expected
+    assert GitUri('https://github.com/Salamek/qiosk/').normalized_url == expected
+    assert GitUri('git@github.com:Salamek/qiosk.git').normalized_url == 'ssh://git@github.com/Salamek/qiosk'
+    assert GitUri('https://github.com:8443/Salamek/qiosk.git').normalized_url != expected
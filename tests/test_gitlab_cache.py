@@ -0,0 +1,20 @@
+import time
+from gitlab_tools.tools.gitlab_cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set('a', 1, 60)
+    cache.set('b', 2, 60)
+    assert cache.get('a') == 1
+    cache.set('c', 3, 60)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_lru_cache_expires():
+    cache = LRUCache(2)
+    cache.set('a', 1, 0.01)
+    time.sleep(0.02)
+    assert cache.get('a') is None
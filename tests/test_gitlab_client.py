@@ -0,0 +1,34 @@
+import os
+import datetime
+import flask
+from gitlab_tools.models.gitlab_tools import User
+from gitlab_tools.tools.gitlab import is_access_token_expired, get_token_expires, get_gitlab_instance
+
+
+def test_token_expires():
+    assert get_token_expires({'created_at': 1700000000}) is None
+    assert get_token_expires({'created_at': 1700000000, 'expires_in': 7200}) == datetime.datetime.fromtimestamp(1700007200)
+
+
+def test_access_token_expired():
+    now = datetime.datetime.now()
+    assert is_access_token_expired(User(refresh_token='r', expires=now))
+    assert is_access_token_expired(User(refresh_token='r', expires=now + datetime.timedelta(seconds=30)))
+    assert not is_access_token_expired(User(refresh_token='r', expires=now + datetime.timedelta(hours=1)))
+    assert not is_access_token_expired(User(refresh_token='r', expires=None))
+    assert not is_access_token_expired(User(refresh_token=None, expires=now))
+
+
+def test_clients_are_not_shared_with_forked_process(monkeypatch):
+    app = flask.Flask(__name__)
+    app.config.update(GITLAB_URL='https://gitlab.example.com', GITLAB_API_VERSION=4, GITLAB_HTTP_POOL_SIZE=1,
+                      GITLAB_CLIENT_CACHE_SIZE=10)
+    user = User(id=1, access_token='token', refresh_token=None)
+    with app.app_context():
+        gl = get_gitlab_instance(user)
+        assert get_gitlab_instance(user) is gl
+
+        monkeypatch.setattr(os, 'getpid', lambda: -1)
+        forked_gl = get_gitlab_instance(user)
+        assert forked_gl is not gl
+        assert forked_gl.session is not gl.session
@@ -0,0 +1,24 @@
+import requests
+from gitlab_tools.tools.gitlab_rate_limit import get_rate_limit_key, count_api_call, get_api_calls, reset_api_calls
+
+
+def prepare(url: str, token: str) -> requests.PreparedRequest:
+    return requests.Request('GET', url, headers={'Authorization': 'Bearer {}'.format(token)}).prepare()
+
+
+def test_rate_limit_key_per_host_and_token():
+    key = get_rate_limit_key(prepare('https://gitlab.example.com/api/v4/projects', 'a'))
+    assert key.startswith('gitlab_tools.gitlab_rate_limit.gitlab.example.com.')
+    assert key == get_rate_limit_key(prepare('https://gitlab.example.com/api/v4/groups', 'a'))
+    assert key != get_rate_limit_key(prepare('https://gitlab.example.com/api/v4/projects', 'b'))
+    assert key != get_rate_limit_key(prepare('https://other.example.com/api/v4/projects', 'a'))
+    assert 'Bearer' not in key
+
+
+def test_api_calls_count():
+    reset_api_calls()
+    count_api_call(False)
+    count_api_call(True)
+    assert get_api_calls() == (2, 1)
+    reset_api_calls()
+    assert get_api_calls() == (0, 0)
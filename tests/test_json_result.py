@@ -0,0 +1,24 @@
+import pickle
+from gitlab_tools.tools.json_result import encode_result, decode_result, decode_legacy_result
+
+
+def test_result_roundtrip():
+    for value in (None, 'skipped: unchanged', 42, {'exc_type': 'ValueError', 'exc_message': ['boom'], 'exc_module': 'builtins'}):
+        assert decode_result(encode_result(value)) == value
+
+
+def test_long_result_is_compressed():
+    value = 'x' * 10000
+    data = encode_result(value, compress_min_size=1024)
+    assert len(data) < 1024
+    assert decode_result(data) == value
+
+
+def test_compression_disabled():
+    value = 'x' * 10000
+    assert encode_result(value, compress_min_size=0) == '"{}"'.format(value).encode()
+
+
+def test_legacy_result():
+    assert decode_legacy_result(pickle.dumps('done')) == 'done'
+    assert decode_legacy_result(None) is None
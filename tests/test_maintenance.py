@@ -0,0 +1,51 @@
+from gitlab_tools.tools.maintenance import parse_count_objects, maintenance_priority, is_maintenance_needed, \
+    get_maintenance_commands, PACK_WEIGHT, GEOMETRIC_REPACK_GIT_VERSION
+
+
+COUNT_OBJECTS_OUTPUT = """count: 1200
+size: 4800
+in-pack: 9
+packs: 3
+size-pack: 587
+prune-packable: 0
+garbage: 0
+size-garbage: 0
+"""
+
+
+def test_parse_count_objects() -> None:
+    stats = parse_count_objects(COUNT_OBJECTS_OUTPUT)
+    assert stats['count'] == 1200
+    assert stats['packs'] == 3
+    assert stats['size-pack'] == 587
+
+
+def test_maintenance_priority() -> None:
+    assert maintenance_priority({'count': 10, 'packs': 2}) == 10 + 2 * PACK_WEIGHT
+    assert maintenance_priority({}) == 0
+
+
+def test_is_maintenance_needed() -> None:
+    assert is_maintenance_needed({'count': 1001, 'packs': 1}, 1000, 10)
+    assert is_maintenance_needed({'count': 0, 'packs': 11}, 1000, 10)
+    assert not is_maintenance_needed({'count': 1000, 'packs': 10}, 1000, 10)
+
+
+def test_get_maintenance_commands() -> None:
+    repack_command = get_maintenance_commands()[1]
+    assert '--write-bitmap-index' in repack_command
+
+    repack_command = get_maintenance_commands(has_alternates=True)[1]
+    assert '--write-bitmap-index' not in repack_command
+    assert '--write-midx' not in repack_command
+
+
+def test_get_maintenance_commands_old_git() -> None:
+    assert '--geometric=2' in get_maintenance_commands(git_version=GEOMETRIC_REPACK_GIT_VERSION)[1]
+
+    repack_command = get_maintenance_commands(git_version=(2, 30, 2))[1]
+    assert '--geometric=2' not in repack_command
+    assert '--write-midx' not in repack_command
+    assert '-a' in repack_command
+
+    assert get_maintenance_commands(git_version=())[1] == repack_command
@@ -0,0 +1,15 @@
+import datetime
+from gitlab_tools.tools.pagination import encode_cursor, decode_cursor
+
+
+def test_cursor_roundtrip():
+    created = datetime.datetime(2023, 4, 5, 6, 7, 8, 123456)
+    assert decode_cursor(encode_cursor(created, 42)) == (created, 42)
+
+
+def test_invalid_cursor():
+    assert decode_cursor(None) is None
+    assert decode_cursor('') is None
+    assert decode_cursor('garbage') is None
+    assert decode_cursor('2023-04-05T06:07:08_abc') is None
+    assert decode_cursor('not-a-date_1') is None
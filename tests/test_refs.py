@@ -0,0 +1,80 @@
+from gitlab_tools.tools.refs import parse_refs, filter_refs, refs_fingerprint, refs_delta, build_push_refspecs, \
+    chunk_refspecs
+
+
+LS_REMOTE_OUTPUT = '''93ce0b728ea25d4a6403f94f060d5df410d5f784\tHEAD
+93ce0b728ea25d4a6403f94f060d5df410d5f784\trefs/heads/master
+5b2d2a8f0e4c3f7b9d1a6c8e0f2b4d6a8c0e2f4a\trefs/merge-requests/1/head
+1f3e5d7c9b0a2c4e6f8d0b2a4c6e8f0d2b4a6c8e\trefs/tags/v1.0
+93ce0b728ea25d4a6403f94f060d5df410d5f784\trefs/tags/v1.0^{}
+'''
+
+
+def test_parse_refs() -> None:
+    result = parse_refs(LS_REMOTE_OUTPUT)
+    assert result['HEAD'] == '93ce0b728ea25d4a6403f94f060d5df410d5f784'
+    assert result['refs/tags/v1.0'] == '1f3e5d7c9b0a2c4e6f8d0b2a4c6e8f0d2b4a6c8e'
+    assert len(result) == 5
+
+
+def test_parse_refs_empty() -> None:
+    assert parse_refs('') == {}
+
+
+def test_filter_refs() -> None:
+    result = filter_refs(parse_refs(LS_REMOTE_OUTPUT))
+    assert sorted(result) == ['refs/heads/master', 'refs/tags/v1.0']
+
+
+def test_refs_fingerprint_is_order_independent() -> None:
+    refs = parse_refs(LS_REMOTE_OUTPUT)
+    reversed_refs = dict(reversed(list(refs.items())))
+    assert refs_fingerprint(refs) == refs_fingerprint(reversed_refs)
+
+
+def test_refs_fingerprint_ignores_other_namespaces() -> None:
+    refs = parse_refs(LS_REMOTE_OUTPUT)
+    refs_without_mr = {k: v for k, v in refs.items() if not k.startswith('refs/merge-requests/')}
+    prefixes = ('refs/heads/', 'refs/tags/')
+    assert refs_fingerprint(refs) != refs_fingerprint(refs_without_mr)
+    assert refs_fingerprint(refs, prefixes) == refs_fingerprint(refs_without_mr, prefixes)
+
+
+def test_refs_fingerprint_changes_with_sha() -> None:
+    refs = parse_refs(LS_REMOTE_OUTPUT)
+    changed_refs = dict(refs)
+    changed_refs['refs/heads/master'] = '0' * 40
+    assert refs_fingerprint(refs) != refs_fingerprint(changed_refs)
+
+
+def test_refs_delta() -> None:
+    before = {'refs/heads/master': 'a', 'refs/heads/old': 'b', 'refs/tags/v1': 'c', 'refs/pull/1/head': 'd'}
+    after = {'refs/heads/master': 'e', 'refs/heads/new': 'f', 'refs/tags/v1': 'c', 'refs/pull/2/head': 'g'}
+    created, updated, deleted = refs_delta(before, after)
+    assert created == {'refs/heads/new': 'f'}
+    assert updated == {'refs/heads/master': 'e'}
+    assert deleted == {'refs/heads/old': 'b'}
+
+
+def test_build_push_refspecs() -> None:
+    before = {'refs/heads/master': 'a', 'refs/heads/old': 'b'}
+    after = {'refs/heads/master': 'e', 'refs/tags/v2': 'f'}
+    assert build_push_refspecs(before, after) == [
+        'refs/heads/master:refs/heads/master',
+        'refs/tags/v2:refs/tags/v2'
+    ]
+    assert build_push_refspecs(before, after, is_force_update=True, is_prune_mirrors=True) == [
+        '+refs/heads/master:refs/heads/master',
+        '+refs/tags/v2:refs/tags/v2',
+        ':refs/heads/old'
+    ]
+
+
+def test_build_push_refspecs_unchanged() -> None:
+    refs = parse_refs(LS_REMOTE_OUTPUT)
+    assert build_push_refspecs(refs, refs, True, True) == []
+
+
+def test_chunk_refspecs() -> None:
+    refspecs = ['refs/tags/v{0}:refs/tags/v{0}'.format(i) for i in range(5)]
+    assert list(chunk_refspecs(refspecs, 2)) == [refspecs[0:2], refspecs[2:4], refspecs[4:5]]